@@ -0,0 +1,62 @@
+"""
+Deterministic synthetic corpora shared by the benchmark scripts.
+
+The corpora are derived from the JIS X 0208 repertoire as exposed by the
+standard library's ``euc_jp`` codec, so that they do not depend on the data
+files used to generate the extension.
+"""
+
+import random
+import typing
+
+
+def _jisx0208_chars(rows: typing.Iterable[int]) -> typing.List[str]:
+    chars = []
+    for ku in rows:
+        for ten in range(94):
+            try:
+                chars.append(bytes([0xA1 + ku, 0xA1 + ten]).decode("euc_jp"))
+            except UnicodeDecodeError:
+                pass
+    return chars
+
+
+KANJI = _jisx0208_chars(range(15, 84))
+HIRAGANA = _jisx0208_chars([3])
+KATAKANA = _jisx0208_chars([4])
+SYMBOLS = _jisx0208_chars([0, 1, 2])
+
+
+def kanji_heavy(n: int, seed: int = 0) -> str:
+    r = random.Random(seed)
+    population = KANJI + HIRAGANA
+    weights = [8] * len(KANJI) + [1] * len(HIRAGANA)
+    return "".join(r.choices(population, weights, k=n))
+
+
+def kana_heavy(n: int, seed: int = 0) -> str:
+    r = random.Random(seed)
+    population = HIRAGANA + KATAKANA + KANJI + SYMBOLS
+    weights = [40] * len(HIRAGANA) + [40] * len(KATAKANA) + [1] * len(KANJI) + [4] * len(SYMBOLS)
+    return "".join(r.choices(population, weights, k=n))
+
+
+def katakana_heavy(n: int, seed: int = 0) -> str:
+    r = random.Random(seed)
+    population = KATAKANA + ["ー"]
+    return "".join(r.choices(population, k=n))
+
+
+def names(n: int, seed: int = 0) -> typing.List[str]:
+    """Short strings resembling registered corporate names."""
+    r = random.Random(seed)
+    suffixes = ["株式会社", "合同会社", "有限会社", ""]
+    retval = []
+    for _ in range(n):
+        body = "".join(r.choices(KANJI + KATAKANA, k=r.randint(2, 12)))
+        retval.append(body + r.choice(suffixes))
+    return retval
+
+
+def report(label: str, seconds: float, n: int, unit: str = "chars") -> None:
+    print(f"{label:<48} {seconds * 1e3:10.3f} ms  {n / seconds / 1e6:10.2f} M{unit}/s")
@@ -0,0 +1,60 @@
+"""
+Compare filtering strings with jnta_encode inside try / except against
+jnta_check, for clean strings and for strings with an offending character
+near the end.
+
+Usage: python benchmarks/bench_check.py
+"""
+
+import time
+import typing
+
+from _corpus import kana_heavy, names, report
+
+import jntajis
+
+N_CHARS = 4_000_000
+N_RECORDS = 200_000
+MODE = jntajis.ConversionMode.JISX0208
+
+
+def best_of(f: typing.Callable[[], object], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def is_clean(s: str) -> bool:
+    try:
+        jntajis.jnta_encode("jis", s, MODE)
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def main() -> None:
+    blob = kana_heavy(N_CHARS)
+    clean = names(N_RECORDS)
+    dirty = [s[:-1] + "㉑" for s in clean]
+    report("blob / encode", best_of(lambda: is_clean(blob)), N_CHARS)
+    report("blob / check", best_of(lambda: jntajis.jnta_check(blob, MODE)), N_CHARS)
+    for label, records in (("clean", clean), ("dirty", dirty)):
+        report(
+            f"{label} records / encode",
+            best_of(lambda: [is_clean(s) for s in records]),
+            N_RECORDS,
+            "items",
+        )
+        report(
+            f"{label} records / check",
+            best_of(lambda: [jntajis.jnta_check(s, MODE) < 0 for s in records]),
+            N_RECORDS,
+            "items",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Compare writing and reading records through the registered codecs with
+io.TextIOWrapper against calling jnta_encode / jnta_decode on every record
+by hand.
+
+Usage: python benchmarks/bench_codec.py
+"""
+
+import io
+import time
+import typing
+
+from _corpus import names, report
+
+import jntajis
+
+N = 200_000
+CHUNK_SIZE = 1024 * 1024
+
+
+def best_of(f: typing.Callable[[], object], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main() -> None:
+    records = names(N)
+    n_chars = sum(len(r) for r in records)
+    text = "".join(records)
+    encoded = jntajis.jnta_encode("jis", text, jntajis.ConversionMode.SISO)
+
+    def write_per_record() -> None:
+        f = io.BytesIO()
+        for r in records:
+            f.write(jntajis.jnta_encode("jis", r, jntajis.ConversionMode.SISO))
+
+    def write_text_io_per_record() -> None:
+        f = io.TextIOWrapper(io.BytesIO(), encoding="jntajis-siso")
+        for r in records:
+            f.write(r)
+        f.flush()
+
+    def write_text_io_chunked() -> None:
+        f = io.TextIOWrapper(io.BytesIO(), encoding="jntajis-siso")
+        for i in range(0, len(text), CHUNK_SIZE):
+            f.write(text[i : i + CHUNK_SIZE])
+        f.flush()
+
+    def read_per_record() -> None:
+        f = io.BytesIO(encoded)
+        for r in records:
+            jntajis.jnta_decode("jis", f.read(len(r) * 2))
+
+    def read_text_io_chunked() -> None:
+        f = io.TextIOWrapper(io.BytesIO(encoded), encoding="jntajis-siso")
+        while f.read(CHUNK_SIZE):
+            pass
+
+    report("write / jnta_encode per record", best_of(write_per_record), n_chars)
+    report("write / TextIOWrapper per record", best_of(write_text_io_per_record), n_chars)
+    report("write / TextIOWrapper, 1M chunks", best_of(write_text_io_chunked), n_chars)
+    report("read / jnta_decode per record", best_of(read_per_record), n_chars)
+    report("read / TextIOWrapper, 1M chunks", best_of(read_text_io_chunked), n_chars)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Compare decoding through a UCS4 buffer, as jnta_decode does for all but the
+largest inputs, against decoding in two passes straight into a string of
+the right kind, on inputs whose result is a string of each kind: ASCII only
+(1 byte per character), BMP only (2 bytes), and mixed with plane 2 kanji of
+JIS X 0213 (4 bytes), placed at the beginning or at the end of the input,
+for a large blob and for many short records.
+
+Usage: python benchmarks/bench_decode_kinds.py
+"""
+
+import random
+import time
+import typing
+
+from _corpus import KANJI, kana_heavy, names, report
+
+import jntajis
+from jntajis import _jntajis
+
+N_CHARS = 4_000_000
+N_RECORDS = 200_000
+MODE = jntajis.ConversionMode.EUC_JIS2004 + jntajis.ConversionMode.SISO
+INPUT_ENCODING = jntajis.InputEncoding.EUC_JIS2004
+PLANE_2 = "\U00020089"  # 𠂉
+
+
+def best_of(f: typing.Callable[[], object], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def ascii_heavy(n: int, seed: int = 0) -> str:
+    r = random.Random(seed)
+    return "".join(r.choices([chr(c) for c in range(0x20, 0x7F)], k=n))
+
+
+def mixed(n: int, seed: int = 0) -> str:
+    r = random.Random(seed)
+    return "".join(r.choices(KANJI + [PLANE_2], [64] * len(KANJI) + [1], k=n))
+
+
+def encode(s: str) -> bytes:
+    # ASCII is passed as is by EUC-JIS-2004 but not by the encoder
+    return s.encode("ascii") if s.isascii() else jntajis.jnta_encode("jis", s, MODE)
+
+
+def main() -> None:
+    bmp = kana_heavy(N_CHARS)
+    blobs = [
+        ("ascii", ascii_heavy(N_CHARS)),
+        ("bmp", bmp),
+        ("bmp + plane 2 first", PLANE_2 + bmp[1:]),
+        ("bmp + plane 2 last", bmp[:-1] + PLANE_2),
+        ("mixed", mixed(N_CHARS)),
+    ]
+    for label, in_ in blobs:
+        encoded = encode(in_)
+        report(
+            f"{label} / buffer",
+            best_of(lambda: jntajis.jnta_decode("jis", encoded, INPUT_ENCODING)),
+            N_CHARS,
+        )
+        report(
+            f"{label} / two-pass",
+            best_of(lambda: _jntajis._decode_two_pass("jis", encoded, INPUT_ENCODING)),
+            N_CHARS,
+        )
+    records = names(N_RECORDS)
+    for label, rs in (
+        ("bmp", records),
+        ("plane 2", [r + PLANE_2 for r in records]),
+    ):
+        encoded_records = [encode(r) for r in rs]
+        report(
+            f"{label} records / buffer",
+            best_of(
+                lambda: [jntajis.jnta_decode("jis", b, INPUT_ENCODING) for b in encoded_records]
+            ),
+            N_RECORDS,
+            "items",
+        )
+        report(
+            f"{label} records / two-pass",
+            best_of(
+                lambda: [
+                    _jntajis._decode_two_pass("jis", b, INPUT_ENCODING) for b in encoded_records
+                ]
+            ),
+            N_RECORDS,
+            "items",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Measure jnta_decode and jnta_decode_shrink_translit on large inputs in each
+input encoding, and print the size of the table the decoder reads for every
+character next to that of tx_mappings.
+
+Cache counters are not read by this script; where perf is available, run it
+as
+
+    perf stat -e cache-references,cache-misses python benchmarks/bench_decode_table.py
+
+against builds before and after a change to compare them.
+
+Usage: python benchmarks/bench_decode_table.py
+"""
+
+import time
+import typing
+
+from _corpus import kana_heavy, kanji_heavy, report
+
+import jntajis
+from jntajis import _jntajis
+
+N_CHARS = 4_000_000
+MODE = jntajis.ConversionMode.SISO
+
+
+def best_of(f: typing.Callable[[], object], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main() -> None:
+    for name, size in _jntajis._decode_table_sizes().items():
+        print(f"{name}: {size} bytes")
+    for label, in_ in (
+        ("kanji", kanji_heavy(N_CHARS - 2) + "俱繫"),
+        ("kana", kana_heavy(N_CHARS - 2) + "俱繫"),
+    ):
+        for codec, layout, input_encoding in (
+            ("jis", jntajis.ConversionMode.SISO, jntajis.InputEncoding.JIS),
+            ("shift_jis_2004", jntajis.ConversionMode.SJIS2004, jntajis.InputEncoding.SJIS2004),
+            (
+                "euc_jis_2004",
+                jntajis.ConversionMode.EUC_JIS2004,
+                jntajis.InputEncoding.EUC_JIS2004,
+            ),
+        ):
+            encoded = jntajis.jnta_encode("jis", in_, layout + MODE)
+            report(
+                f"{label} / {codec} / decode",
+                best_of(lambda: jntajis.jnta_decode("jis", encoded, input_encoding)),
+                N_CHARS,
+            )
+            report(
+                f"{label} / {codec} / decode_shrink_translit",
+                best_of(
+                    lambda: jntajis.jnta_decode_shrink_translit("jis", encoded, input_encoding)
+                ),
+                N_CHARS,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Compare collecting the unconvertible characters of each record by
+re-encoding it after replacing the offending character, one per retry,
+against jnta_encode_report, which finds them all in a single pass.
+
+Usage: python benchmarks/bench_encode_report.py
+"""
+
+import time
+import typing
+
+from _corpus import names, report
+
+import jntajis
+
+N_RECORDS = 20_000
+MODE = jntajis.ConversionMode.JISX0208
+
+
+def best_of(f: typing.Callable[[], object], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def retry(s: str) -> typing.List[typing.Tuple[int, int]]:
+    failures = []
+    while True:
+        try:
+            jntajis.jnta_encode("jis", s, MODE)
+        except UnicodeEncodeError as e:
+            failures.append((e.start, ord(s[e.start])))
+            s = s[: e.start] + "〓" * (e.end - e.start) + s[e.end :]
+        else:
+            return failures
+
+
+def main() -> None:
+    clean = names(N_RECORDS)
+    for n_bad in (1, 4, 16):
+        dirty = [(s + "\U0001f600") * n_bad for s in clean]
+        report(
+            f"{n_bad} failures / retry",
+            best_of(lambda: [retry(s) for s in dirty]),
+            N_RECORDS,
+            "items",
+        )
+        report(
+            f"{n_bad} failures / report",
+            best_of(lambda: [jntajis.jnta_encode_report("jis", s, MODE) for s in dirty]),
+            N_RECORDS,
+            "items",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Decode a multi-gigabyte SISO-encoded stream chunk by chunk with
+IncrementalDecoder and report the throughput and the peak resident set size.
+The stream is produced on the fly by repeating an encoded block, so the
+memory usage should stay flat regardless of the total size.
+
+Usage: python benchmarks/bench_incremental_decoder.py
+"""
+
+import resource
+import time
+
+from _corpus import kanji_heavy, report
+
+import jntajis
+
+TOTAL = 2 * 1024 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024 + 1  # odd, so that characters straddle the chunks
+
+
+def maxrss_mib() -> float:
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main() -> None:
+    # interleave characters from the extended plane to exercise plane shifts
+    block_str = "".join(
+        c + "\U00020089" if i % 64 == 0 else c for i, c in enumerate(kanji_heavy(1 << 20))
+    )
+    block = jntajis.jnta_encode("jis", block_str, jntajis.ConversionMode.SISO)
+    stream = block * (CHUNK_SIZE // len(block) + 2)
+    n_chunks = TOTAL // CHUNK_SIZE
+
+    dec = jntajis.IncrementalDecoder("jis", siso=True)
+    rss_before = maxrss_mib()
+    n_chars = 0
+    offset = 0
+    t = time.perf_counter()
+    for _ in range(n_chunks):
+        n_chars += len(dec.decode(stream[offset : offset + CHUNK_SIZE]))
+        # stay aligned to the block so that the SISO state stays consistent
+        offset = (offset + CHUNK_SIZE) % len(block)
+    t = time.perf_counter() - t
+    report(
+        f"IncrementalDecoder / {n_chunks * CHUNK_SIZE >> 20} MiB", t, n_chunks * CHUNK_SIZE, "B"
+    )
+    print(f"decoded {n_chars} characters")
+    print(f"peak RSS: {rss_before:.1f} MiB before, {maxrss_mib():.1f} MiB after")
+
+
+if __name__ == "__main__":
+    main()
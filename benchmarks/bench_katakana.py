@@ -0,0 +1,62 @@
+"""
+Measure jnta_encode, jnta_check and jnta_shrink_translit on katakana-heavy
+text, where many characters (カ, セ, ト, ...) may begin a combining
+sequence with the semi-voiced sound mark, with and without such sequences
+mixed in.
+
+Usage: python benchmarks/bench_katakana.py
+"""
+
+import random
+import time
+import typing
+
+from _corpus import katakana_heavy, report
+
+import jntajis
+
+N_CHARS = 2_000_000
+MODE = jntajis.ConversionMode.SISO
+
+
+def best_of(f: typing.Callable[[], object], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def with_sequences(s: str, every: int, seed: int = 0) -> str:
+    r = random.Random(seed)
+    return "".join(
+        c + r.choice(["カ゚", "セ゚", "ト゚"]) if i % every == 0 else c for i, c in enumerate(s)
+    )
+
+
+def main() -> None:
+    plain = katakana_heavy(N_CHARS)
+    for label, in_ in (
+        ("katakana", plain),
+        ("katakana + 1 in 100 sequences", with_sequences(plain, 100)),
+    ):
+        report(
+            f"{label} / encode",
+            best_of(lambda: jntajis.jnta_encode("jis", in_, MODE)),
+            len(in_),
+        )
+        report(
+            f"{label} / check",
+            best_of(lambda: jntajis.jnta_check(in_, MODE)),
+            len(in_),
+        )
+        report(
+            f"{label} / shrink_translit",
+            best_of(lambda: jntajis.jnta_shrink_translit(in_ + "俱")),
+            len(in_),
+        )
+
+
+if __name__ == "__main__":
+    main()
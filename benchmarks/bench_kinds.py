@@ -0,0 +1,64 @@
+"""
+Measure jnta_encode and jnta_shrink_translit on strings of each internal
+kind (1, 2 and 4 bytes per character), to see the effect of the loops
+specialized per kind.
+
+Usage: python benchmarks/bench_kinds.py
+"""
+
+import random
+import time
+import typing
+
+from _corpus import kana_heavy, kanji_heavy, report
+
+import jntajis
+
+N_CHARS = 2_000_000
+MODE = jntajis.ConversionMode.SISO
+
+
+def best_of(f: typing.Callable[[], object], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def latin1_heavy(n: int, seed: int = 0) -> str:
+    # the Latin-1 characters in JIS X 0213, mixed with ASCII that is not
+    r = random.Random(seed)
+    population = []
+    for c in range(0xA1, 0x100):
+        try:
+            chr(c).encode("euc_jis_2004")
+        except UnicodeEncodeError:
+            continue
+        population.append(chr(c))
+    population += [chr(c) for c in range(0x20, 0x7F)]
+    return "".join(r.choices(population, k=n))
+
+
+def main() -> None:
+    inputs = [
+        ("1-byte", latin1_heavy(N_CHARS)),
+        ("2-byte", kana_heavy(N_CHARS)),
+        ("4-byte", kanji_heavy(N_CHARS - 1) + "\U00020089"),
+    ]
+    for label, in_ in inputs:
+        report(
+            f"{label} / encode",
+            best_of(lambda: jntajis.jnta_encode("jis", in_, MODE, "replace")),
+            N_CHARS,
+        )
+        report(
+            f"{label} / shrink_translit",
+            best_of(lambda: jntajis.jnta_shrink_translit(in_, passthrough=True)),
+            N_CHARS,
+        )
+
+
+if __name__ == "__main__":
+    main()
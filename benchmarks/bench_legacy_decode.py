@@ -0,0 +1,72 @@
+"""
+Compare ingesting CP932 / EUC-JIS-2004 bytes through the standard library
+codec followed by jnta_shrink_translit against the single pass of
+jnta_decode_shrink_translit, for a large blob and for many short records.
+
+Usage: python benchmarks/bench_legacy_decode.py
+"""
+
+import time
+import typing
+
+from _corpus import kanji_heavy, names, report
+
+import jntajis
+
+N_CHARS = 4_000_000
+N_RECORDS = 200_000
+
+
+def best_of(f: typing.Callable[[], object], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main() -> None:
+    blob = kanji_heavy(N_CHARS)
+    records = names(N_RECORDS)
+    for codec, input_encoding in (
+        ("cp932", jntajis.InputEncoding.CP932),
+        ("euc_jis_2004", jntajis.InputEncoding.EUC_JIS2004),
+    ):
+        encoded_blob = blob.encode(codec)
+        encoded_records = [r.encode(codec) for r in records]
+        report(
+            f"{codec} / codecs + shrink_translit",
+            best_of(lambda: jntajis.jnta_shrink_translit(encoded_blob.decode(codec))),
+            N_CHARS,
+        )
+        report(
+            f"{codec} / decode_shrink_translit",
+            best_of(
+                lambda: jntajis.jnta_decode_shrink_translit("jis", encoded_blob, input_encoding)
+            ),
+            N_CHARS,
+        )
+        report(
+            f"{codec} / records, codecs + shrink_translit",
+            best_of(
+                lambda: [jntajis.jnta_shrink_translit(b.decode(codec)) for b in encoded_records]
+            ),
+            N_RECORDS,
+            "items",
+        )
+        report(
+            f"{codec} / records, decode_shrink_translit",
+            best_of(
+                lambda: [
+                    jntajis.jnta_decode_shrink_translit("jis", b, input_encoding)
+                    for b in encoded_records
+                ]
+            ),
+            N_RECORDS,
+            "items",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Compare converting many short strings one call at a time against the batch
+APIs (jnta_encode_many / jnta_decode_many / jnta_shrink_translit_many), with
+the batch split across 1, 2, 4 and 8 native threads.
+
+Usage: python benchmarks/bench_many.py
+"""
+
+import time
+import typing
+
+from _corpus import names, report
+
+import jntajis
+
+N = 200_000
+
+
+def best_of(f: typing.Callable[[], object], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main() -> None:
+    corpus = names(N)
+    encoded = [jntajis.jnta_encode("jis", s, jntajis.ConversionMode.MEN1) for s in corpus]
+    cases: typing.List[
+        typing.Tuple[
+            str, typing.Callable[[], object], typing.Callable[[int], typing.Callable[[], object]]
+        ]
+    ] = [
+        (
+            "encode",
+            lambda: [jntajis.jnta_encode("jis", s, jntajis.ConversionMode.MEN1) for s in corpus],
+            lambda n: (
+                lambda: jntajis.jnta_encode_many(
+                    "jis", corpus, jntajis.ConversionMode.MEN1, n_threads=n
+                )
+            ),
+        ),
+        (
+            "decode",
+            lambda: [jntajis.jnta_decode("jis", b) for b in encoded],
+            lambda n: lambda: jntajis.jnta_decode_many("jis", encoded, n_threads=n),
+        ),
+        (
+            "shrink_translit",
+            lambda: [jntajis.jnta_shrink_translit(s) for s in corpus],
+            lambda n: lambda: jntajis.jnta_shrink_translit_many(corpus, n_threads=n),
+        ),
+    ]
+    for name, one_by_one, many in cases:
+        report(f"{name} / one call per item", best_of(one_by_one), N, "items")
+        for n_threads in (1, 2, 4, 8):
+            report(f"{name} / batch, {n_threads} thread(s)", best_of(many(n_threads)), N, "items")
+
+
+if __name__ == "__main__":
+    main()
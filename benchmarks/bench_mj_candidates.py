@@ -0,0 +1,119 @@
+"""
+Measure mj_shrink_candidates against mj_shrink_candidates_iter on names
+made of characters with many variants, taking only the first few candidates
+and taking all of them, against counting them and listing the alternatives
+at each position with mj_shrink_candidate_count and mj_shrink_candidate_sets,
+and the iterator on a name with more candidates than could ever be listed.
+
+Usage: python benchmarks/bench_mj_candidates.py
+"""
+
+import itertools
+import operator
+import random
+import time
+import typing
+
+from _corpus import report
+
+import jntajis
+
+N_RECORDS = 2_000
+FIRST = 5
+COMBO = jntajis.MJShrinkSchemeCombo(15)
+
+# characters that have variants in most of the schemes
+VARIANTS = list("辺邉邊斎斉齋髙高﨑崎澤沢國国嶋島濱浜廣広")
+
+
+def best_of(f: typing.Callable[[], object], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def variant_names(n: int, length: int, seed: int = 0) -> typing.List[str]:
+    r = random.Random(seed)
+    return ["".join(r.choices(VARIANTS, k=length)) for _ in range(n)]
+
+
+def main() -> None:
+    for length in (2, 6, 16):
+        records = variant_names(N_RECORDS, length)
+        total = sum(
+            operator.length_hint(jntajis.mj_shrink_candidates_iter(r, COMBO)) for r in records
+        )
+        print(f"{length} characters: {total / N_RECORDS:.1f} candidates per name")
+        report(
+            f"{length} chars / first {FIRST} / list",
+            best_of(lambda: [jntajis.mj_shrink_candidates(r, COMBO, FIRST) for r in records]),
+            N_RECORDS,
+            "items",
+        )
+        report(
+            f"{length} chars / first {FIRST} / iter",
+            best_of(
+                lambda: [
+                    list(itertools.islice(jntajis.mj_shrink_candidates_iter(r, COMBO), FIRST))
+                    for r in records
+                ]
+            ),
+            N_RECORDS,
+            "items",
+        )
+        report(
+            f"{length} chars / all / list",
+            best_of(lambda: [jntajis.mj_shrink_candidates(r, COMBO, -1) for r in records]),
+            N_RECORDS,
+            "items",
+        )
+        report(
+            f"{length} chars / all / iter",
+            best_of(lambda: [list(jntajis.mj_shrink_candidates_iter(r, COMBO)) for r in records]),
+            N_RECORDS,
+            "items",
+        )
+        report(
+            f"{length} chars / count / len(list)",
+            best_of(lambda: [len(jntajis.mj_shrink_candidates(r, COMBO, -1)) for r in records]),
+            N_RECORDS,
+            "items",
+        )
+        report(
+            f"{length} chars / count",
+            best_of(lambda: [jntajis.mj_shrink_candidate_count(r, COMBO) for r in records]),
+            N_RECORDS,
+            "items",
+        )
+        report(
+            f"{length} chars / sets",
+            best_of(lambda: [jntajis.mj_shrink_candidate_sets(r, COMBO) for r in records]),
+            N_RECORDS,
+            "items",
+        )
+
+    # too many to list; only the first few are built
+    huge = "辺髙" * 20
+    it = jntajis.mj_shrink_candidates_iter(huge, COMBO)
+    print(f"{len(huge)} characters: {operator.length_hint(it)} candidates")
+    report(
+        f"{len(huge)} chars / first {FIRST} / iter",
+        best_of(
+            lambda: list(itertools.islice(jntajis.mj_shrink_candidates_iter(huge, COMBO), FIRST))
+        ),
+        1,
+        "items",
+    )
+    report(
+        f"{len(huge)} chars / count",
+        best_of(lambda: jntajis.mj_shrink_candidate_count(huge, COMBO)),
+        1,
+        "items",
+    )
+
+
+if __name__ == "__main__":
+    main()
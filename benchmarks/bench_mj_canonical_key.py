@@ -0,0 +1,76 @@
+"""
+Measure grouping names that are the same modulo MJ shrink variants by
+mj_canonical_key, with a dict, against comparing every pair with
+mj_equivalent, and the throughput of mj_canonical_key on a large blob.
+
+Usage: python benchmarks/bench_mj_canonical_key.py
+"""
+
+import random
+import time
+import typing
+
+from _corpus import KANJI, kanji_heavy, report
+
+import jntajis
+
+N_PAIRWISE = 1_000
+N_KEYED = 200_000
+N_CHARS = 4_000_000
+COMBO = jntajis.MJShrinkSchemeCombo(15)
+
+# characters that have variants in most of the schemes
+VARIANTS = list("辺邉邊斎斉齋髙高﨑崎澤沢國国嶋島濱浜廣広")
+
+
+def best_of(f: typing.Callable[[], object], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def variant_names(n: int, seed: int = 0) -> typing.List[str]:
+    r = random.Random(seed)
+    return [
+        "".join(r.choice(VARIANTS if r.random() < 0.3 else KANJI) for _ in range(r.randint(2, 4)))
+        for _ in range(n)
+    ]
+
+
+def group_pairwise(names: typing.Sequence[str]) -> typing.List[typing.List[str]]:
+    groups: typing.List[typing.List[str]] = []
+    for n in names:
+        for g in groups:
+            if jntajis.mj_equivalent(g[0], n, COMBO):
+                g.append(n)
+                break
+        else:
+            groups.append([n])
+    return groups
+
+
+def group_keyed(names: typing.Sequence[str]) -> typing.Dict[str, typing.List[str]]:
+    groups: typing.Dict[str, typing.List[str]] = {}
+    for n in names:
+        groups.setdefault(jntajis.mj_canonical_key(n, COMBO), []).append(n)
+    return groups
+
+
+def main() -> None:
+    few = variant_names(N_PAIRWISE)
+    report("pairwise mj_equivalent", best_of(lambda: group_pairwise(few), 1), N_PAIRWISE, "items")
+    report("keyed", best_of(lambda: group_keyed(few)), N_PAIRWISE, "items")
+    many = variant_names(N_KEYED)
+    report("keyed / many", best_of(lambda: group_keyed(many)), N_KEYED, "items")
+    print(f"groups: {len(group_keyed(many))} / {N_KEYED}")
+    blob = kanji_heavy(N_CHARS)
+    report("blob / clean", best_of(lambda: jntajis.mj_canonical_key(blob, COMBO)), N_CHARS)
+    blob = "".join(many)
+    report("blob / names", best_of(lambda: jntajis.mj_canonical_key(blob, COMBO)), len(blob))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Compare collecting the MJ shrink alternatives of each character from the
+table precomputed by gen.py against walking the MJ mappings and the MJ
+shrink mappings as before, on kanji-heavy text, on names full of characters
+that have variants, and on characters followed by IVSes.
+
+Usage: python benchmarks/bench_mj_closure.py
+"""
+
+import random
+import timeit
+
+from _corpus import KANJI, kanji_heavy, report
+
+from jntajis import _jntajis
+
+N = 1_000_000
+REPEAT = 5
+COMBOS = [1, 15]
+
+# characters that have variants in most of the schemes
+VARIANTS = list("辺邉邊斎斉齋髙高﨑崎澤沢國国嶋島濱浜廣広")
+
+
+def variant_heavy(n: int, seed: int = 0) -> str:
+    r = random.Random(seed)
+    return "".join(r.choice(VARIANTS if r.random() < 0.3 else KANJI) for _ in range(n))
+
+
+def with_ivs(n: int, seed: int = 0) -> str:
+    r = random.Random(seed)
+    return "".join(
+        r.choice(VARIANTS + KANJI[:100]) + chr(0xE0100 + r.randrange(32)) for _ in range(n // 2)
+    )
+
+
+def main() -> None:
+    sizes = _jntajis._mj_closure_table_sizes()
+    for k, v in sizes.items():
+        print(f"table size ({k}): {v / 1024:.1f} KiB")
+
+    for name, corpus in [
+        ("kanji-heavy", kanji_heavy(N)),
+        ("variant-heavy", variant_heavy(N)),
+        ("ivs", with_ivs(N)),
+    ]:
+        for combo in COMBOS:
+            assert _jntajis._mj_collect_scan(corpus, combo, True) == _jntajis._mj_collect_scan(
+                corpus, combo, False
+            )
+            for label, table in [("walk", False), ("table", True)]:
+                t = min(
+                    timeit.repeat(
+                        lambda: _jntajis._mj_collect_scan(corpus, combo, table),
+                        number=1,
+                        repeat=REPEAT,
+                    )
+                )
+                report(f"{name} / combo {combo} / {label}", t, len(corpus))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Measure telling whether pairs of names are the same modulo MJ shrink
+variants by intersecting the lists of mj_shrink_candidates, as was done
+before, against mj_equivalent and mj_equivalent_many.
+
+Usage: python benchmarks/bench_mj_equivalent.py
+"""
+
+import random
+import time
+import typing
+
+from _corpus import KANJI, report
+
+import jntajis
+
+N_PAIRS = 20_000
+COMBO = jntajis.MJShrinkSchemeCombo(15)
+
+# characters that have variants in most of the schemes
+VARIANTS = list("辺邉邊斎斉齋髙高﨑崎澤沢國国嶋島濱浜廣広")
+
+
+def best_of(f: typing.Callable[[], object], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def name_pairs(n: int, length: int, seed: int = 0) -> typing.List[typing.Tuple[str, str]]:
+    # half of the characters have variants, which are picked independently
+    # for either name
+    r = random.Random(seed)
+    retval = []
+    for _ in range(n):
+        a, b = [], []
+        for _ in range(length):
+            if r.random() < 0.5:
+                a.append(r.choice(VARIANTS))
+                b.append(r.choice(VARIANTS))
+            else:
+                c = r.choice(KANJI)
+                a.append(c)
+                b.append(c)
+        retval.append(("".join(a), "".join(b)))
+    return retval
+
+
+def intersect(a: str, b: str) -> bool:
+    return bool(
+        set(jntajis.mj_shrink_candidates(a, COMBO)) & set(jntajis.mj_shrink_candidates(b, COMBO))
+    )
+
+
+def main() -> None:
+    for length in (4, 12):
+        pairs = name_pairs(N_PAIRS, length)
+        report(
+            f"{length} chars / intersect candidates",
+            best_of(lambda: [intersect(a, b) for a, b in pairs], 3),
+            N_PAIRS,
+            "items",
+        )
+        report(
+            f"{length} chars / mj_equivalent",
+            best_of(lambda: [jntajis.mj_equivalent(a, b, COMBO) for a, b in pairs]),
+            N_PAIRS,
+            "items",
+        )
+        for n_threads in (1, 4):
+            report(
+                f"{length} chars / mj_equivalent_many x{n_threads}",
+                best_of(lambda: jntajis.mj_equivalent_many(pairs, COMBO, n_threads=n_threads)),
+                N_PAIRS,
+                "items",
+            )
+        missed = sum(intersect(a, b) != jntajis.mj_equivalent(a, b, COMBO) for a, b in pairs)
+        print(f"pairs told apart by the candidate limit: {missed} / {N_PAIRS}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Measure building an MJIndex over a synthetic table of a million corporate
+names with kanji variants sprinkled in, saving it and loading it back, and
+searching it for parts of the names written in other variants, against
+scanning the table with mj_canonical_key for a few of the queries.
+
+Usage: python benchmarks/bench_mj_index.py
+"""
+
+import os
+import random
+import tempfile
+import time
+import typing
+
+from _corpus import names, report
+
+import jntajis
+from jntajis.index import MJIndex
+
+N_NAMES = 1_000_000
+N_QUERIES = 10_000
+N_SCANNED = 10
+COMBO = jntajis.MJShrinkSchemeCombo(15)
+
+# characters that have variants in most of the schemes, in groups
+VARIANT_GROUPS = ["辺邉邊", "斎斉齋", "髙高", "﨑崎", "澤沢", "國国", "嶋島", "濱浜", "廣広"]
+VARIANTS = {c: g for g in VARIANT_GROUPS for c in g}
+
+# the legal forms appended by _corpus.names(), which most names share
+SUFFIXES = ["株式会社", "合同会社", "有限会社"]
+
+
+def best_of(f: typing.Callable[[], object], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def with_variants(ns: typing.List[str], seed: int = 0) -> typing.List[str]:
+    """Insert a character that has variants into one in five names."""
+    r = random.Random(seed)
+    chars = list(VARIANTS)
+    retval = []
+    for n in ns:
+        if r.random() < 0.2:
+            i = r.randint(0, len(n) // 2)
+            n = n[:i] + r.choice(chars) + n[i:]
+        retval.append(n)
+    return retval
+
+
+def queries(ns: typing.Sequence[str], n: int, seed: int = 1) -> typing.List[str]:
+    """
+    Parts of the names other than the legal form, with the characters that
+    have variants swapped.
+    """
+    r = random.Random(seed)
+    retval = []
+    for _ in range(n):
+        s = r.choice(ns)
+        for suffix in SUFFIXES:
+            s = s.removesuffix(suffix)
+        i = r.randint(0, max(0, len(s) - 4))
+        retval.append("".join(r.choice(VARIANTS[c]) if c in VARIANTS else c for c in s[i : i + 4]))
+    return retval
+
+
+def scan(ns: typing.Sequence[str], query: str) -> typing.List[int]:
+    key = jntajis.mj_canonical_key(query, COMBO)
+    return [i for i, n in enumerate(ns) if key in jntajis.mj_canonical_key(n, COMBO)]
+
+
+def main() -> None:
+    table = with_variants(names(N_NAMES))
+    t = time.perf_counter()
+    index = MJIndex.build(enumerate(table), COMBO)
+    report("build", time.perf_counter() - t, N_NAMES, "items")
+
+    qs = queries(table, N_QUERIES)
+    report("search", best_of(lambda: [index.search(q) for q in qs], 3), N_QUERIES, "items")
+    report(
+        "search / combo 1",
+        best_of(lambda: [index.search(q, 1) for q in qs], 3),
+        N_QUERIES,
+        "items",
+    )
+    report(
+        "search / 1 char, limit 100",
+        best_of(lambda: [index.search(q[:1], limit=100) for q in qs[:1000]], 3),
+        1000,
+        "items",
+    )
+    report(
+        "search / legal form, limit 100",
+        best_of(lambda: [index.search(f, limit=100) for f in SUFFIXES], 3),
+        len(SUFFIXES),
+        "items",
+    )
+    report(
+        "scan",
+        best_of(lambda: [scan(table, q) for q in qs[:N_SCANNED]], 1),
+        N_SCANNED,
+        "items",
+    )
+    assert all(index.search(q) == scan(table, q) for q in qs[:N_SCANNED])
+    found = sum(len(index.search(q)) for q in qs)
+    print(f"names found: {found} for {N_QUERIES} queries")
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "names.idx")
+        t = time.perf_counter()
+        index.save(path)
+        report("save", time.perf_counter() - t, N_NAMES, "items")
+        print(f"file size: {os.path.getsize(path)} bytes")
+        t = time.perf_counter()
+        loaded = MJIndex.load(path)
+        report("load", time.perf_counter() - t, N_NAMES, "items")
+        with loaded:
+            report(
+                "search / loaded",
+                best_of(lambda: [loaded.search(q) for q in qs], 3),
+                N_QUERIES,
+                "items",
+            )
+
+
+if __name__ == "__main__":
+    main()
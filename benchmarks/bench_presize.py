@@ -0,0 +1,68 @@
+"""
+Compare jnta_encode writing into a growing buffer against the exact-size
+path (presize=True), which computes the output length with
+jnta_encoded_length first, for short records and for long blobs.
+
+Usage: python benchmarks/bench_presize.py
+"""
+
+import time
+import typing
+
+from _corpus import kanji_heavy, names, report
+
+import jntajis
+
+N_CHARS = 1_000_000
+N_RECORDS = 200_000
+MODES = (
+    ("MEN1", jntajis.ConversionMode.MEN1),
+    ("SISO", jntajis.ConversionMode.SISO),
+    ("JISX0208_TRANSLIT", jntajis.ConversionMode.JISX0208_TRANSLIT),
+    ("ISO2022JP2004", jntajis.ConversionMode.ISO2022JP2004),
+)
+
+
+def best_of(f: typing.Callable[[], object], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main() -> None:
+    blob = kanji_heavy(N_CHARS)
+    records = [s[:32] for s in names(N_RECORDS)]
+    for label, mode in MODES:
+        report(
+            f"{label} / short / length",
+            best_of(lambda: [jntajis.jnta_encoded_length(s, mode) for s in records]),
+            N_RECORDS,
+            "items",
+        )
+        for presize in (False, True):
+            report(
+                f"{label} / short / presize={presize}",
+                best_of(
+                    lambda: [jntajis.jnta_encode("jis", s, mode, presize=presize) for s in records]
+                ),
+                N_RECORDS,
+                "items",
+            )
+        report(
+            f"{label} / long / length",
+            best_of(lambda: jntajis.jnta_encoded_length(blob, mode)),
+            N_CHARS,
+        )
+        for presize in (False, True):
+            report(
+                f"{label} / long / presize={presize}",
+                best_of(lambda: jntajis.jnta_encode("jis", blob, mode, presize=presize)),
+                N_CHARS,
+            )
+
+
+if __name__ == "__main__":
+    main()
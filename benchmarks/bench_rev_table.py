@@ -0,0 +1,35 @@
+"""
+Compare the Unicode-to-JIS reverse table layouts: the chunked range table
+looked up by binary search against the two-level page table.
+
+Usage: python benchmarks/bench_rev_table.py
+"""
+
+import timeit
+
+from _corpus import kana_heavy, kanji_heavy, report
+
+from jntajis import _jntajis
+
+N = 1_000_000
+REPEAT = 5
+
+
+def main() -> None:
+    sizes = _jntajis._rev_table_sizes()
+    for k, v in sizes.items():
+        print(f"table size ({k}): {v / 1024:.1f} KiB")
+
+    for name, corpus in [("kanji-heavy", kanji_heavy(N)), ("kana-heavy", kana_heavy(N))]:
+        assert _jntajis._rev_table_scan(corpus, True) == _jntajis._rev_table_scan(corpus, False)
+        for label, paged in [("bsearch", False), ("pages", True)]:
+            t = min(
+                timeit.repeat(
+                    lambda: _jntajis._rev_table_scan(corpus, paged), number=1, repeat=REPEAT
+                )
+            )
+            report(f"{name} / {label}", t, N)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Measure jnta_shrink_translit on records that are already in JIS X 0208,
+which are returned as is, and on records with a character to transliterate
+at the end, whose unchanged prefix is copied in bulk.
+
+Usage: python benchmarks/bench_shrink_identity.py
+"""
+
+import time
+import typing
+
+from _corpus import kana_heavy, names, report
+
+import jntajis
+
+N_CHARS = 4_000_000
+N_RECORDS = 200_000
+
+
+def best_of(f: typing.Callable[[], object], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main() -> None:
+    blob = kana_heavy(N_CHARS)
+    clean = names(N_RECORDS)
+    dirty = [s + "俱" for s in clean]  # 俱, transliterated to 倶
+    report("blob / clean", best_of(lambda: jntajis.jnta_shrink_translit(blob)), N_CHARS)
+    report(
+        "blob / dirty",
+        best_of(lambda: jntajis.jnta_shrink_translit(blob + "俱")),
+        N_CHARS,
+    )
+    for label, records in (("clean", clean), ("dirty", dirty)):
+        report(
+            f"{label} records",
+            best_of(lambda: [jntajis.jnta_shrink_translit(s) for s in records]),
+            N_RECORDS,
+            "items",
+        )
+        report(
+            f"{label} records / many",
+            best_of(lambda: jntajis.jnta_shrink_translit_many(records)),
+            N_RECORDS,
+            "items",
+        )
+    same = sum(jntajis.jnta_shrink_translit(s) is s for s in clean)
+    print(f"clean records returned as is: {same} / {N_RECORDS}")
+
+
+if __name__ == "__main__":
+    main()
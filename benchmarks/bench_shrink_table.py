@@ -0,0 +1,56 @@
+"""
+Measure jnta_shrink_translit on text that has to be transliterated, so that
+every character goes through the table of shrink transliteration results,
+with kana-heavy, kanji-heavy and katakana-heavy text, and with text mixed
+with characters outside JIS X 0208 and outside JIS altogether.
+
+Usage: python benchmarks/bench_shrink_table.py
+"""
+
+import random
+import time
+import typing
+
+from _corpus import kana_heavy, kanji_heavy, katakana_heavy, report
+
+import jntajis
+
+N_CHARS = 2_000_000
+
+# characters of JIS X 0213 that are transliterated, a sequence with a
+# combining character, and characters not in JIS
+EXTRA = ["俱", "繫", "㉑", "剝", "か゚", "\U0001f600", "é"]
+
+
+def best_of(f: typing.Callable[[], object], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def sprinkle(s: str, every: int, seed: int = 0) -> str:
+    r = random.Random(seed)
+    return "".join(c + r.choice(EXTRA) if i % every == 0 else c for i, c in enumerate(s))
+
+
+def main() -> None:
+    inputs = [
+        ("kana", kana_heavy(N_CHARS)),
+        ("kanji", kanji_heavy(N_CHARS)),
+        ("katakana", katakana_heavy(N_CHARS)),
+    ]
+    for label, in_ in inputs:
+        for every in (1000, 10):
+            dirty = sprinkle(in_, every)
+            report(
+                f"{label} / 1 in {every}",
+                best_of(lambda: jntajis.jnta_shrink_translit(dirty, passthrough=True)),
+                len(dirty),
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Measure how jnta_encode / jnta_decode / jnta_shrink_translit scale across
+threads.  Each thread converts the same number of large inputs; with the GIL
+released in the conversion cores the aggregate throughput should grow with
+the number of threads up to the number of available cores.
+
+Usage: python benchmarks/bench_threads.py
+"""
+
+import concurrent.futures
+import time
+
+from _corpus import kanji_heavy, report
+
+import jntajis
+
+N = 1_000_000
+PER_THREAD = 8
+
+
+def run(f, n_threads: int) -> float:
+    with concurrent.futures.ThreadPoolExecutor(n_threads) as ex:
+        t = time.perf_counter()
+        for fut in [ex.submit(f) for _ in range(n_threads * PER_THREAD)]:
+            fut.result()
+        return time.perf_counter() - t
+
+
+def main() -> None:
+    corpus = kanji_heavy(N)
+    encoded = jntajis.jnta_encode("jis", corpus, jntajis.ConversionMode.MEN1)
+    cases = [
+        ("jnta_encode", lambda: jntajis.jnta_encode("jis", corpus, jntajis.ConversionMode.MEN1)),
+        ("jnta_decode", lambda: jntajis.jnta_decode("jis", encoded)),
+        ("jnta_shrink_translit", lambda: jntajis.jnta_shrink_translit(corpus)),
+    ]
+    for name, f in cases:
+        f()
+        for n_threads in (1, 2, 4, 8):
+            t = run(f, n_threads)
+            report(f"{name} / {n_threads} thread(s)", t, N * n_threads * PER_THREAD)
+
+
+if __name__ == "__main__":
+    main()
@@ -29,16 +29,34 @@ This library makes use of the data from the following entities:
 
 """
 
+import codecs
 import enum
 
 try:
     from ._jntajis import (
+        IncrementalDecoder,
         IncrementalEncoder,
         TransliterationError,
+        Transliterator,
+        jnta_check,
         jnta_decode,
+        jnta_decode_many,
+        jnta_decode_shrink_translit,
         jnta_encode,
+        jnta_encode_into,
+        jnta_encode_many,
+        jnta_encode_report,
+        jnta_encoded_length,
         jnta_shrink_translit,
+        jnta_shrink_translit_check,
+        jnta_shrink_translit_many,
+        mj_canonical_key,
+        mj_equivalent,
+        mj_equivalent_many,
+        mj_shrink_candidate_count,
+        mj_shrink_candidate_sets,
         mj_shrink_candidates,
+        mj_shrink_candidates_iter,
     )
     from ._version import __version__, __version_tuple__
 except ImportError:
@@ -49,12 +67,30 @@ __all__ = [
     "__version__",
     "__version_tuple__",
     "IncrementalEncoder",
+    "IncrementalDecoder",
     "TransliterationError",
+    "Transliterator",
     "jnta_encode",
+    "jnta_encode_into",
+    "jnta_encode_report",
+    "jnta_encoded_length",
     "jnta_decode",
     "jnta_shrink_translit",
+    "jnta_decode_shrink_translit",
+    "jnta_check",
+    "jnta_shrink_translit_check",
+    "jnta_encode_many",
+    "jnta_decode_many",
+    "jnta_shrink_translit_many",
     "mj_shrink_candidates",
+    "mj_shrink_candidates_iter",
+    "mj_shrink_candidate_sets",
+    "mj_shrink_candidate_count",
+    "mj_equivalent",
+    "mj_equivalent_many",
+    "mj_canonical_key",
     "ConversionMode",
+    "InputEncoding",
     "MJShrinkScheme",
     "MJShrinkSchemeCombo",
 ]
@@ -84,6 +120,87 @@ class ConversionMode(enum.IntEnum):
     Instructs it to encode the given string into JIS X 0208 level 1 and 2
     characters.  Non-0208 characters will be tried the transliteration against.
     """
+    SJIS2004 = 4
+    """
+    Same as :py:attr:`SISO` except that the output is laid out in
+    Shift_JIS-2004.
+    """
+    SJIS2004_MEN1 = 5
+    """
+    Same as :py:attr:`MEN1` except that the output is laid out in
+    Shift_JIS-2004.
+    """
+    SJIS2004_JISX0208 = 6
+    """
+    Same as :py:attr:`JISX0208` except that the output is laid out in
+    Shift_JIS-2004.
+    """
+    SJIS2004_JISX0208_TRANSLIT = 7
+    """
+    Same as :py:attr:`JISX0208_TRANSLIT` except that the output is laid out in
+    Shift_JIS-2004.
+    """
+    EUC_JIS2004 = 8
+    """
+    Same as :py:attr:`SISO` except that the output is laid out in
+    EUC-JIS-2004.
+    """
+    EUC_JIS2004_MEN1 = 9
+    """
+    Same as :py:attr:`MEN1` except that the output is laid out in
+    EUC-JIS-2004.
+    """
+    EUC_JIS2004_JISX0208 = 10
+    """
+    Same as :py:attr:`JISX0208` except that the output is laid out in
+    EUC-JIS-2004.
+    """
+    EUC_JIS2004_JISX0208_TRANSLIT = 11
+    """
+    Same as :py:attr:`JISX0208_TRANSLIT` except that the output is laid out in
+    EUC-JIS-2004.
+    """
+    ISO2022JP2004 = 12
+    """
+    Same as :py:attr:`SISO` except that the output is laid out in
+    ISO-2022-JP-2004.
+    """
+    ISO2022JP2004_MEN1 = 13
+    """
+    Same as :py:attr:`MEN1` except that the output is laid out in
+    ISO-2022-JP-2004.
+    """
+    ISO2022JP2004_JISX0208 = 14
+    """
+    Same as :py:attr:`JISX0208` except that the output is laid out in
+    ISO-2022-JP-2004.
+    """
+    ISO2022JP2004_JISX0208_TRANSLIT = 15
+    """
+    Same as :py:attr:`JISX0208_TRANSLIT` except that the output is laid out in
+    ISO-2022-JP-2004.
+    """
+
+
+class InputEncoding(enum.IntEnum):
+    JIS = 0
+    """
+    Instructs the decoder to interpret the input as pairs of row and column
+    bytes, as produced by :py:attr:`ConversionMode.SISO` and its siblings.
+    """
+    SJIS2004 = 1
+    """
+    Instructs the decoder to interpret the input as Shift_JIS-2004.
+    """
+    EUC_JIS2004 = 2
+    """
+    Instructs the decoder to interpret the input as EUC-JIS-2004.
+    """
+    CP932 = 3
+    """
+    Instructs the decoder to interpret the input as CP932 (Microsoft's
+    Shift_JIS), including the NEC special characters and the IBM extensions.
+    """
 
 
 class MJShrinkScheme(enum.IntEnum):
@@ -118,3 +235,11 @@ class MJShrinkSchemeCombo(enum.IntFlag):
     Family Register Act (戸籍法) and related MOJ notices
     (法務省戸籍法関連通達・通知.)
     """
+
+
+try:
+    from .codec import search as _codec_search
+except ImportError:
+    pass
+else:
+    codecs.register(_codec_search)
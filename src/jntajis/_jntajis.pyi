@@ -1,17 +1,123 @@
 import typing
 
+from typing_extensions import Buffer
+
 class IncrementalEncoder:
     def encode(self, in_: str, final: bool) -> bytes: ...
+    def encode_into(
+        self, in_: str, buffer: Buffer, offset: int = 0, final: bool = False
+    ) -> typing.Tuple[int, int]: ...
     def reset(self) -> None: ...
     def getstate(self) -> int: ...
     def setstate(self, state: int) -> None: ...
-    def __init__(self, encoding: str, conv_mode: int) -> None: ...
+    def __init__(
+        self,
+        encoding: str,
+        conv_mode: int,
+        errors: str = "strict",
+        replacement: str = "\u3013",
+    ) -> None: ...
+
+class Transliterator:
+    def translit(self, chunk: str, final: bool = False) -> str: ...
+    def translit_iter(self, chunks: typing.Iterable[str]) -> typing.Iterator[str]: ...
+    def reset(self) -> None: ...
+    def __init__(self, replacement: str = "\ufffd", passthrough: bool = False) -> None: ...
+
+class IncrementalDecoder:
+    def decode(self, in_: Buffer, final: bool = False) -> str: ...
+    def reset(self) -> None: ...
+    def getstate(self) -> typing.Tuple[bytes, int]: ...
+    def setstate(self, state: typing.Tuple[bytes, int]) -> None: ...
+    def __init__(
+        self,
+        encoding: str,
+        siso: bool = False,
+        input_encoding: int = 0,
+        shrink_translit: bool = False,
+        replacement: str = "\ufffd",
+        passthrough: bool = False,
+    ) -> None: ...
 
 class TransliterationError(Exception): ...
 
-def jnta_encode(encoding: str, in_: str, conv_mode: int) -> bytes: ...
-def jnta_decode(encoding: str, in_: bytes) -> str: ...
+def jnta_encode(
+    encoding: str,
+    in_: str,
+    conv_mode: int,
+    errors: str = "strict",
+    replacement: str = "\u3013",
+    presize: bool = False,
+) -> bytes: ...
+def jnta_encoded_length(
+    in_: str,
+    conv_mode: int,
+    errors: str = "strict",
+    replacement: str = "\u3013",
+) -> int: ...
+def jnta_encode_into(
+    encoding: str,
+    in_: str,
+    conv_mode: int,
+    buffer: Buffer,
+    offset: int = 0,
+    errors: str = "strict",
+    replacement: str = "\u3013",
+) -> typing.Tuple[int, int]: ...
+def jnta_encode_report(
+    encoding: str,
+    in_: str,
+    conv_mode: int,
+    errors: str = "replace",
+    replacement: str = "\u3013",
+) -> typing.Tuple[bytes, typing.List[typing.Tuple[int, int, str]]]: ...
+def jnta_decode(encoding: str, in_: Buffer, input_encoding: int = 0) -> str: ...
+def jnta_decode_shrink_translit(
+    encoding: str,
+    in_: Buffer,
+    input_encoding: int = 0,
+    replacement: str = "\ufffd",
+    passthrough: bool = False,
+) -> str: ...
 def jnta_shrink_translit(
     in_: str, replacement: str = "\ufffd", passthrough: bool = False
 ) -> str: ...
+@typing.overload
+def jnta_check(in_: str, conv_mode: int, find_all: typing.Literal[False] = False) -> int: ...
+@typing.overload
+def jnta_check(in_: str, conv_mode: int, find_all: typing.Literal[True]) -> typing.List[int]: ...
+@typing.overload
+def jnta_shrink_translit_check(in_: str, find_all: typing.Literal[False] = False) -> int: ...
+@typing.overload
+def jnta_shrink_translit_check(in_: str, find_all: typing.Literal[True]) -> typing.List[int]: ...
+def jnta_encode_many(
+    encoding: str,
+    ins: typing.Iterable[str],
+    conv_mode: int,
+    n_threads: int = 1,
+    errors: str = "strict",
+    replacement: str = "\u3013",
+) -> typing.List[typing.Union[bytes, Exception]]: ...
+def jnta_decode_many(
+    encoding: str, ins: typing.Iterable[Buffer], n_threads: int = 1, input_encoding: int = 0
+) -> typing.List[typing.Union[str, Exception]]: ...
+def jnta_shrink_translit_many(
+    ins: typing.Iterable[str],
+    replacement: str = "\ufffd",
+    passthrough: bool = False,
+    n_threads: int = 1,
+) -> typing.List[typing.Union[str, Exception]]: ...
 def mj_shrink_candidates(in_: str, combo: int, limit: int = 100) -> typing.List[str]: ...
+
+class MJShrinkCandidateIterator(typing.Iterator[str]):
+    def __next__(self) -> str: ...
+    def __length_hint__(self) -> int: ...
+
+def mj_shrink_candidates_iter(in_: str, combo: int) -> MJShrinkCandidateIterator: ...
+def mj_shrink_candidate_sets(in_: str, combo: int) -> typing.List[typing.Tuple[str, ...]]: ...
+def mj_shrink_candidate_count(in_: str, combo: int) -> int: ...
+def mj_canonical_key(in_: str, combo: int) -> str: ...
+def mj_equivalent(a: str, b: str, combo: int) -> bool: ...
+def mj_equivalent_many(
+    pairs: typing.Iterable[typing.Tuple[str, str]], combo: int, n_threads: int = 1
+) -> typing.List[typing.Union[bool, Exception]]: ...
@@ -1,9 +1,24 @@
 # cython: language_level=3, cdivision=True, boundscheck=False, wraparound=False, embedsignature=True
 from libc.stdio cimport snprintf
-from libc.stdlib cimport malloc, calloc, free
-from libc.string cimport memcpy
-from cpython.ref cimport PyObject, Py_INCREF, Py_DECREF
-
+from libc.stdlib cimport malloc, calloc, realloc, free
+from libc.string cimport memcmp, memcpy
+from cpython.buffer cimport PyObject_GetBuffer, PyBuffer_Release, PyBUF_SIMPLE, PyBUF_WRITABLE
+from cpython.bytes cimport PyBytes_FromStringAndSize
+from cpython.pythread cimport (
+    PyThread_type_lock,
+    PyThread_allocate_lock,
+    PyThread_free_lock,
+    PyThread_acquire_lock,
+    PyThread_release_lock,
+    PyThread_start_new_thread,
+    WAIT_LOCK,
+)
+from cpython.ref cimport PyObject, Py_INCREF, Py_DECREF, Py_XDECREF
+from cpython.pyport cimport PY_SSIZE_T_MAX
+from cpython.tuple cimport PyTuple_New, PyTuple_SET_ITEM
+from cpython.unicode cimport PyUnicode_FromOrdinal
+
+import codecs
 import enum
 
 cdef extern from "./_jntajis.h":
@@ -33,7 +48,29 @@ cdef extern from "./_jntajis.h":
         pass
     const ShrinkingTransliterationMapping[] tx_mappings
     const URangeToJISMapping[] urange_to_jis_mappings
+    enum: JIS_DEC_PAIR
+    enum: JIS_DEC_SHRINKS
+    enum: JIS_DEC_RESERVED
+    enum: JIS_DEC_FLAGS
+    const uint32_t[] jis_dec_us
+    const uint32_t[][2] jis_dec_pairs
+    enum: REV_JIS_PAGE_SHIFT
+    enum: REV_JIS_PAGE_SIZE
+    enum: REV_JIS_PAGE_INDEX_LEN
+    const uint16_t[][REV_JIS_PAGE_SIZE] rev_jis_pages
+    const uint16_t[] rev_jis_page_index
+    enum: SHRINK_TX_POOL
+    enum: SHRINK_TX_STARTER
+    enum: SHRINK_TX_NONE
+    const uint32_t[][REV_JIS_PAGE_SIZE] shrink_tx_pages
+    const uint32_t[] shrink_tx_pool
+    enum: CP932_IBM_EXT_TRAIL_LEN
+    const uint16_t[][CP932_IBM_EXT_TRAIL_LEN] cp932_ibm_ext_ucs
+    const uint32_t[] cp932_jis_valid
     uint16_t sm_uni_to_jis_mapping(int *state, uint32_t u) nogil
+    bint sm_uni_to_jis_is_first(uint32_t u) nogil
+    bint sm_uni_to_jis_is_second(uint32_t u) nogil
+    enum: SM_UNI_TO_JIS_MIN_SECOND
     ctypedef struct UIVSPair:
         uint32_t u
         bint v
@@ -55,6 +92,35 @@ cdef extern from "./_jntajis.h":
         const MJMappingSet* mss
     const URangeToMJMappings[] urange_to_mj_mappings
     const MJShrinkMappingUnicodeSet[] mj_shrink_mappings
+    enum: MJ_SHRINK_MAPPINGS_LEN
+    enum: MJ_CANON_PAGE_SHIFT
+    enum: MJ_CANON_PAGE_SIZE
+    enum: MJ_CANON_PAGE_INDEX_LEN
+    enum: MJ_CANON_IVS_LEN
+    enum: MJ_CANON_COMBOS
+    ctypedef struct MJCanonIVS:
+        uint32_t u
+        uint8_t s
+        uint16_t i
+    const uint16_t[][MJ_CANON_PAGE_SIZE] mj_canon_pages
+    const uint16_t[] mj_canon_page_index
+    const MJCanonIVS[] mj_canon_ivs
+    const uint32_t[][MJ_CANON_COMBOS] mj_canon_reps
+    enum: MJ_CLOSURE_PAGE_SHIFT
+    enum: MJ_CLOSURE_PAGE_SIZE
+    enum: MJ_CLOSURE_PAGE_INDEX_LEN
+    enum: MJ_CLOSURE_IVS_LEN
+    enum: MJ_CLOSURE_COMBOS
+    enum: MJ_CLOSURE_FORM_U_BITS
+    ctypedef struct MJClosureIVS:
+        uint32_t u
+        uint8_t s
+        uint16_t i
+    const uint16_t[][MJ_CLOSURE_PAGE_SIZE] mj_closure_pages
+    const uint16_t[] mj_closure_page_index
+    const MJClosureIVS[] mj_closure_ivs
+    const uint32_t[][MJ_CLOSURE_COMBOS] mj_closure_lists
+    const uint32_t[] mj_closure_pool
 
 
 cdef extern from "Python.h":
@@ -63,6 +129,8 @@ cdef extern from "Python.h":
     ctypedef struct _PyUnicodeWriter:
         Py_ssize_t min_length
         int overallocate
+    ctypedef unsigned char Py_UCS1
+    ctypedef unsigned short Py_UCS2
     ctypedef int Py_UCS4
     cdef enum PyUnicode_Kind:
         PyUnicode_1BYTE_KIND
@@ -79,7 +147,12 @@ cdef extern from "Python.h":
     PyUnicode_Kind PyUnicode_KIND(object)
     void* PyUnicode_DATA(object) 
     Py_ssize_t PyUnicode_GET_LENGTH(object)
-    Py_UCS4 PyUnicode_READ(int, void*, Py_ssize_t)
+    Py_UCS4 PyUnicode_READ(int, void*, Py_ssize_t) nogil
+    unicode PyUnicode_FromKindAndData(int, const void*, Py_ssize_t)
+    unicode PyUnicode_New(Py_ssize_t, Py_UCS4)
+    void PyUnicode_WRITE(int, void*, Py_ssize_t, Py_UCS4) nogil
+    Py_UCS4* PyUnicode_AsUCS4Copy(object) except NULL
+    void PyMem_Free(void*) nogil
 
 cdef extern from "pythoncapi_compat.h":
     ctypedef struct PyBytesWriter:
@@ -87,6 +160,7 @@ cdef extern from "pythoncapi_compat.h":
     PyBytesWriter* PyBytesWriter_Create(Py_ssize_t) nogil
     void PyBytesWriter_Discard(PyBytesWriter*) nogil
     void* PyBytesWriter_GetData(PyBytesWriter*) nogil
+    Py_ssize_t PyBytesWriter_GetSize(PyBytesWriter*) nogil
     object PyBytesWriter_FinishWithPointer(PyBytesWriter*, void*) nogil
     void* PyBytesWriter_WriteBytes(PyBytesWriter*, void*, void*, Py_ssize_t) nogil
 
@@ -94,13 +168,52 @@ cdef extern from "./pythoncapi_compat_shim.h":
     void* PyBytesWriter_Prepare(PyBytesWriter*, void*, Py_ssize_t) nogil
 
 
-ctypedef bint (*jis_put_func)(JNTAJISIncrementalEncoderContext*, uint16_t)
+ctypedef bint (*jis_put_func)(JNTAJISIncrementalEncoderContext*, uint16_t) noexcept nogil
+
+
+ctypedef enum JISLayout:
+    JISLayout_JIS               = 0  # row / column pairs, planes switched with SI / SO
+    JISLayout_SHIFT_JIS_2004    = 1
+    JISLayout_EUC_JIS_2004      = 2
+    JISLayout_ISO_2022_JP_2004  = 3
+
+
+ctypedef enum ISO2022Designation:
+    ISO2022Designation_ASCII            = 0
+    ISO2022Designation_JISX0208         = 1
+    ISO2022Designation_JISX0213_PLANE1  = 2
+    ISO2022Designation_JISX0213_PLANE2  = 3
+
+
+ctypedef enum JNTAJISErrorHandling:
+    JNTAJISErrorHandling_STRICT   = 0
+    JNTAJISErrorHandling_REPLACE  = 1
+    JNTAJISErrorHandling_IGNORE   = 2
+    JNTAJISErrorHandling_CALLBACK = 3  # a custom handler is called with the GIL held
+
+
+ctypedef struct JNTAJISEncodeFailure:
+    Py_ssize_t pos
+    uint32_t u
+    int reason  # JNTAJISError
+
+
+ctypedef struct JNTAJISEncodeFailureBuffer:
+    JNTAJISEncodeFailure* p
+    Py_ssize_t l
+    Py_ssize_t cap
 
 
 ctypedef struct JNTAJISIncrementalEncoder:
     PyObject* encoding
     uint16_t replacement
+    JNTAJISErrorHandling errors
+    PyObject* error_handler  # only for JNTAJISErrorHandling_CALLBACK
+    JNTAJISEncodeFailureBuffer* failures  # NULL unless the failures are collected
     jis_put_func put_jis
+    JISLayout layout
+    size_t max_put_len  # the maximum number of bytes put_jis emits at once
+    size_t max_reset_len  # the number of bytes needed to return to the initial shift state
     size_t lal
     uint32_t[32] la
     int shift_state
@@ -111,6 +224,25 @@ ctypedef enum JNTAJISError:
     JNTAJISError_Success = 0
     JNTAJISError_MemoryError = 1
     JNTAJISError_AssertionError = 2
+    JNTAJISError_BufferFull = 3
+    JNTAJISError_NotConvertible = 4
+    JNTAJISError_ReplacementNotConvertible = 5
+    JNTAJISError_LookaheadOverflow = 6
+    JNTAJISError_UnmappedCharacter = 7
+    JNTAJISError_UnexpectedTrailingByte = 8
+    JNTAJISError_UnexpectedByte = 9
+    JNTAJISError_IncompleteMultibyteCharacter = 10
+    JNTAJISError_NotRepresentableInSJIS = 11
+
+
+# inputs at least this long are converted with the GIL released
+cdef enum:
+    JNTAJIS_NOGIL_THRESHOLD = 4096
+
+# inputs of at least this many bytes are decoded in two passes, which is
+# slower but spares the intermediate buffer of 4 bytes per character
+cdef enum:
+    JNTAJIS_DECODE_TWO_PASS_THRESHOLD = 64 * 1024 * 1024
 
 
 ctypedef struct JNTAJISIncrementalEncoderContext:
@@ -122,10 +254,52 @@ ctypedef struct JNTAJISIncrementalEncoderContext:
     Py_ssize_t ul
     Py_ssize_t pos
     char* p
+    char* pe
     JNTAJISError err
+    Py_ssize_t err_start, err_end
+
+
+cdef bint JNTAJISEncodeFailureBuffer_append(
+    JNTAJISEncodeFailureBuffer* b,
+    Py_ssize_t pos,
+    uint32_t u,
+    JNTAJISError reason,
+) noexcept nogil:
+    cdef Py_ssize_t cap
+    cdef JNTAJISEncodeFailure* p
+    if b.l >= b.cap:
+        cap = b.cap + b.cap // 2
+        if cap < 16:
+            cap = 16
+        p = <JNTAJISEncodeFailure*>realloc(b.p, cap * sizeof(JNTAJISEncodeFailure))
+        if p == NULL:
+            return False
+        b.p = p
+        b.cap = cap
+    b.p[b.l].pos = pos
+    b.p[b.l].u = u
+    b.p[b.l].reason = reason
+    b.l += 1
+    return True
+
+
+cdef void JNTAJISEncodeFailureBuffer_fini(JNTAJISEncodeFailureBuffer* b) noexcept nogil:
+    free(b.p)
+    b.p = NULL
+
+
+cdef inline bint lookup_rev_table(uint16_t* pj, uint32_t u) nogil:
+    cdef uint16_t jis
+    if u >= REV_JIS_PAGE_INDEX_LEN << REV_JIS_PAGE_SHIFT:
+        return False
+    jis = rev_jis_pages[rev_jis_page_index[u >> REV_JIS_PAGE_SHIFT]][u & (REV_JIS_PAGE_SIZE - 1)]
+    if jis == <uint16_t>-1:
+        return False
+    pj[0] = jis
+    return True
 
 
-cdef bint lookup_rev_table(uint16_t* pj, uint32_t u) nogil:
+cdef bint lookup_rev_table_bsearch(uint16_t* pj, uint32_t u) nogil:
     cdef size_t l = sizeof(urange_to_jis_mappings) // sizeof(urange_to_jis_mappings[0])
     cdef size_t s = 0, e = l
     cdef size_t m
@@ -150,90 +324,187 @@ cdef bint lookup_rev_table(uint16_t* pj, uint32_t u) nogil:
     return False
 
 
-cdef bint jis_put_men_1(JNTAJISIncrementalEncoderContext* ctx, uint16_t c) nogil:
+def _rev_table_scan(unicode in_, bint paged=True):
+    """
+    Look up every character of the given string in the Unicode-to-JIS
+    reverse table and return the sum of (JIS code + 1) over the characters
+    found.  Used by the benchmarks and tests to compare the paged layout
+    against the range table with binary search.
+    """
+
+    cdef int uk = PyUnicode_KIND(in_)
+    cdef void* ud = PyUnicode_DATA(in_)
+    cdef Py_ssize_t ul = PyUnicode_GET_LENGTH(in_)
+    cdef Py_ssize_t i
+    cdef uint16_t jis
+    cdef unsigned long long acc = 0
+
+    with nogil:
+        if paged:
+            for i in range(ul):
+                if lookup_rev_table(&jis, PyUnicode_READ(uk, ud, i)):
+                    acc += jis + 1
+        else:
+            for i in range(ul):
+                if lookup_rev_table_bsearch(&jis, PyUnicode_READ(uk, ud, i)):
+                    acc += jis + 1
+    return acc
+
+
+def _decode_table_sizes():
+    """
+    Return the memory footprint in bytes of tx_mappings and of the table
+    the decoder reads instead.
+    """
+
+    return {
+        "tx_mappings": sizeof(tx_mappings),
+        "jis_dec": sizeof(jis_dec_us) + sizeof(jis_dec_pairs),
+    }
+
+
+def _rev_table_sizes():
+    """
+    Return the memory footprint in bytes of each reverse table layout.
+    """
+
+    cdef size_t i
+    cdef size_t ranges = sizeof(urange_to_jis_mappings)
+    for i in range(sizeof(urange_to_jis_mappings) // sizeof(urange_to_jis_mappings[0])):
+        ranges += (urange_to_jis_mappings[i].end - urange_to_jis_mappings[i].start + 1) * sizeof(uint16_t)
+    return {
+        "ranges": ranges,
+        "pages": sizeof(rev_jis_pages) + sizeof(rev_jis_page_index),
+    }
+
+
+cdef inline bint jis_is_jisx0208(uint16_t c) noexcept nogil:
+    cdef JISCharacterClass class_ = tx_mappings[c].class_
+    return (
+        class_ == JISCharacterClass_KANJI_LEVEL_1 or
+        class_ == JISCharacterClass_KANJI_LEVEL_2 or
+        class_ == JISCharacterClass_JISX0208_NON_KANJI
+    )
+
+
+cdef inline bint sjis2004_has_row(uint16_t c) noexcept nogil:
+    # only rows 1, 3-5, 8, 12-15 and 78-94 of the plane 2 are assigned
+    # bytes in Shift_JIS-2004
+    cdef unsigned int ku = c // 94 % 94
+    return c // (94 * 94) == 0 or (
+        ku == 0 or ku == 2 or ku == 3 or ku == 4 or ku == 7 or
+        (ku >= 11 and ku <= 14) or ku >= 77
+    )
+
+
+cdef inline bint jis_emit(JNTAJISIncrementalEncoderContext* ctx, uint16_t c) noexcept nogil:
+    # write a single JIS character in the byte layout of the encoder
     cdef unsigned int men = c // (94 * 94)
     cdef unsigned int ku = c // 94 % 94
     cdef unsigned int ten = c % 94
-    cdef char* p
-    if men != 0:
-        return False
+    cdef JISLayout layout = ctx.e.layout
+    cdef char* p = ctx.p
 
-    p = <char *>PyBytesWriter_Prepare(ctx.writer, ctx.p, 2)
-    if not p:
-        ctx.err = JNTAJISError_MemoryError
+    if layout == JISLayout_JIS:
+        if not JNTAJISIncrementalEncoderContext_put_shift(ctx, men):
+            return False
+        p = ctx.p
+        p[0] = 0x21 + ku
+        p[1] = 0x21 + ten
+        ctx.p = p + 2
+    elif layout == JISLayout_SHIFT_JIS_2004:
+        # ku and ten are 0-origin here
+        if not sjis2004_has_row(c):
+            return False
+        if men == 0:
+            if ku < 62:
+                p[0] = (ku + 0x102) >> 1
+            else:
+                p[0] = (ku + 0x182) >> 1
+        elif ku < 77:
+            p[0] = ((ku + 0x1e0) >> 1) - (ku + 1) // 8 * 3
+        else:
+            p[0] = (ku + 0x19c) >> 1
+        if ku % 2 == 0:
+            p[1] = ten + 0x40 + (1 if ten >= 63 else 0)
+        else:
+            p[1] = ten + 0x9f
+        ctx.p = p + 2
+    elif layout == JISLayout_EUC_JIS_2004:
+        if men != 0:
+            p[0] = <char>0x8f
+            p += 1
+        p[0] = 0xa1 + ku
+        p[1] = 0xa1 + ten
+        ctx.p = p + 2
+    elif layout == JISLayout_ISO_2022_JP_2004:
+        if not JNTAJISIncrementalEncoderContext_put_shift(
+            ctx,
+            ISO2022Designation_JISX0213_PLANE2 if men != 0 else
+            ISO2022Designation_JISX0208 if jis_is_jisx0208(c) else
+            ISO2022Designation_JISX0213_PLANE1,
+        ):
+            return False
+        p = ctx.p
+        p[0] = 0x21 + ku
+        p[1] = 0x21 + ten
+        ctx.p = p + 2
+    else:
+        ctx.err = JNTAJISError_AssertionError
         return False
-    p[0] = 0x21 +  ku
-    p[1] = 0x21 + ten
-    p += 2
-    ctx.p = p
     return True
 
 
-cdef bint jis_put_jisx0208(JNTAJISIncrementalEncoderContext* ctx, uint16_t c) nogil:
+cdef bint jis_put_any(JNTAJISIncrementalEncoderContext* ctx, uint16_t c) noexcept nogil:
+    return jis_emit(ctx, c)
+
+
+cdef bint jis_put_men_1(JNTAJISIncrementalEncoderContext* ctx, uint16_t c) noexcept nogil:
+    if c // (94 * 94) != 0:
+        return False
+    return jis_emit(ctx, c)
+
+
+cdef bint jis_put_jisx0208(JNTAJISIncrementalEncoderContext* ctx, uint16_t c) noexcept nogil:
     if c >= sizeof(tx_mappings) // sizeof(tx_mappings[0]):
         return False
-    cdef JISCharacterClass class_ = tx_mappings[c].class_
-    cdef char* p
-    if (
-        class_ == JISCharacterClass_KANJI_LEVEL_1 or
-        class_ == JISCharacterClass_KANJI_LEVEL_2 or
-        class_ == JISCharacterClass_JISX0208_NON_KANJI
-    ):
-        p = <char *>PyBytesWriter_Prepare(ctx.writer, ctx.p, 2)
-        if not p:
-            ctx.err = JNTAJISError_MemoryError
-            return False
-        p[0] = 0x21 + c // 94 % 94
-        p[1] = 0x21 + c % 94
-        p += 2
-        ctx.p = p
-        return True
+    if jis_is_jisx0208(c):
+        return jis_emit(ctx, c)
     else:
         return False
 
 
-cdef bint jis_put_jisx0208_translit(JNTAJISIncrementalEncoderContext* ctx, uint16_t c) nogil:
+cdef bint jis_put_jisx0208_translit(JNTAJISIncrementalEncoderContext* ctx, uint16_t c) noexcept nogil:
     if c >= sizeof(tx_mappings) // sizeof(tx_mappings[0]):
         return False
     cdef const ShrinkingTransliterationMapping* m = &tx_mappings[c]
-    cdef JISCharacterClass class_ = m.class_
-    cdef char* p
-    if (
-        class_ == JISCharacterClass_KANJI_LEVEL_1 or
-        class_ == JISCharacterClass_KANJI_LEVEL_2 or
-        class_ == JISCharacterClass_JISX0208_NON_KANJI
-    ):
-        p = <char *>PyBytesWriter_Prepare(ctx.writer, ctx.p, 2)
-        if not p:
-            ctx.err = JNTAJISError_MemoryError
-            return False
-        p[0] = 0x21 + c // 94 % 94
-        p[1] = 0x21 + c % 94
-        p += 2
-        ctx.p = p
-        return True
+    cdef size_t i
+    if jis_is_jisx0208(c):
+        return jis_emit(ctx, c)
     else:
         if m.tx_len > 0:
-            p = <char *>PyBytesWriter_Prepare(ctx.writer, ctx.p, 2 * m.tx_len)
-            if not p:
-                ctx.err = JNTAJISError_MemoryError
-                return False
             for i in range(m.tx_len):
-                c = m.tx_jis[i]
-                p[0] = 0x21 + c // 94 % 94
-                p[1] = 0x21 + c % 94
-                p += 2
-            ctx.p = p
+                if not jis_emit(ctx, m.tx_jis[i]):
+                    return False
             return True
         else:
             return False
 
 
-cdef object JNTAJISIncrementalEncoderContext_raise(JNTAJISIncrementalEncoderContext* ctx):
-    if ctx.err == JNTAJISError_MemoryError:
-        raise MemoryError()
-    elif ctx.err == JNTAJISError_AssertionError:
-        raise AssertionError()
+cdef inline JNTAJISError jis_put_failure(
+    JNTAJISIncrementalEncoderContext* ctx,
+    uint16_t c,
+) noexcept nogil:
+    # tell why the put function refused a character that has a JIS
+    # counterpart: it is out of the repertoire of the conversion mode, or it
+    # is in a row of the plane 2 that Shift_JIS-2004 has no bytes for
+    if (
+        ctx.e.layout == JISLayout_SHIFT_JIS_2004 and
+        ctx.e.put_jis == jis_put_any and
+        not sjis2004_has_row(c)
+    ):
+        return JNTAJISError_NotRepresentableInSJIS
+    return JNTAJISError_NotConvertible
 
 
 cdef object JNTAJISIncrementalEncoderContext_createUnicodeEncodeError(
@@ -243,128 +514,386 @@ cdef object JNTAJISIncrementalEncoderContext_createUnicodeEncodeError(
     return UnicodeEncodeError(
         <object>ctx.e.encoding,
         <object>ctx.u,
-        ctx.pos,
-        ctx.pos + 1,
+        ctx.err_start,
+        ctx.err_end,
         (<bytes>reason).decode("ascii"),
     )
 
 
-cdef object JNTAJISIncrementalEncoderContext_put_replacement(JNTAJISIncrementalEncoderContext* ctx):
-    cdef uint16_t jis = ctx.e.replacement
+cdef const char* JNTAJISIncrementalEncoder_reason(JNTAJISError err) noexcept nogil:
+    if err == JNTAJISError_NotConvertible:
+        return "not convertible to JISX0208"
+    elif err == JNTAJISError_UnmappedCharacter:
+        return "no corresponding JIS character"
+    elif err == JNTAJISError_NotRepresentableInSJIS:
+        return "not representable in Shift_JIS-2004"
+    elif err == JNTAJISError_ReplacementNotConvertible:
+        return "replacement character is neither convertible to JISX0208"
+    elif err == JNTAJISError_LookaheadOverflow:
+        return "lookahead buffer overflow"
+    else:
+        return NULL
 
-    if jis == <uint16_t>-1:
-        raise JNTAJISIncrementalEncoderContext_createUnicodeEncodeError(
-            ctx, "not convertible to JISX0208",
-        )
+
+cdef object JNTAJISIncrementalEncoderContext_createError(JNTAJISIncrementalEncoderContext* ctx):
+    cdef const char* reason
+    if ctx.err == JNTAJISError_MemoryError:
+        return MemoryError()
+    if ctx.err == JNTAJISError_UnmappedCharacter:
+        # only jnta_encode_report() tells the two apart
+        reason = JNTAJISIncrementalEncoder_reason(JNTAJISError_NotConvertible)
     else:
-        if not jis_put_men_1(ctx, jis):
-            raise JNTAJISIncrementalEncoderContext_createUnicodeEncodeError(
-                ctx, "replacement character is neither convertible to JISX0208",
-            )
-            
+        reason = JNTAJISIncrementalEncoder_reason(ctx.err)
+    if reason == NULL:
+        return AssertionError()
+    return JNTAJISIncrementalEncoderContext_createUnicodeEncodeError(ctx, <char*>reason)
 
-cdef bint JNTAJISIncrementalEncoderContext_put_shift(
+
+cdef object JNTAJISIncrementalEncoderContext_raise(JNTAJISIncrementalEncoderContext* ctx):
+    raise JNTAJISIncrementalEncoderContext_createError(ctx)
+
+
+cdef object JNTAJISIncrementalEncoderContext_reserve(
     JNTAJISIncrementalEncoderContext* ctx,
-    int next_shift_state
-) nogil:
-    if next_shift_state != ctx.e.shift_state:
-        ctx.e.shift_state = next_shift_state
-        ctx.p = <char *>PyBytesWriter_Prepare(ctx.writer, ctx.p, 1)
-        if not ctx.p:
+    Py_ssize_t n,
+):
+    cdef char* p
+    if ctx.pe - ctx.p >= n:
+        return
+    p = <char *>PyBytesWriter_Prepare(ctx.writer, ctx.p, n)
+    if not p:
+        raise MemoryError()
+    ctx.p = p
+    ctx.pe = <char *>PyBytesWriter_GetData(ctx.writer) + PyBytesWriter_GetSize(ctx.writer)
+
+
+cdef bint JNTAJISIncrementalEncoderContext_put_replacement(
+    JNTAJISIncrementalEncoderContext* ctx,
+    Py_ssize_t start,
+    Py_ssize_t end,
+    uint32_t u,
+    JNTAJISError reason,
+) noexcept nogil:
+    # called for the characters between start and end that cannot be
+    # encoded; u is the first of them
+    cdef JNTAJISIncrementalEncoder* e = ctx.e
+
+    if e.failures != NULL:
+        if not JNTAJISEncodeFailureBuffer_append(e.failures, start, u, reason):
             ctx.err = JNTAJISError_MemoryError
             return False
+    if e.errors == JNTAJISErrorHandling_IGNORE:
+        return True
+    elif e.errors == JNTAJISErrorHandling_REPLACE:
+        if not e.put_jis(ctx, e.replacement):
+            if ctx.err == JNTAJISError_Success:
+                ctx.err = JNTAJISError_ReplacementNotConvertible
+                ctx.err_start = start
+                ctx.err_end = end
+            return False
+        return True
+    else:
+        ctx.err = reason
+        ctx.err_start = start
+        ctx.err_end = end
+        return False
+
+
+cdef bint JNTAJISIncrementalEncoderContext_put_shift(
+    JNTAJISIncrementalEncoderContext* ctx,
+    int next_shift_state
+) noexcept nogil:
+    # The shift state is the plane selected with SI / SO for JISLayout_JIS,
+    # and the ISO2022Designation for JISLayout_ISO_2022_JP_2004.  It stays 0
+    # for the other layouts.
+    cdef char* p = ctx.p
+    if next_shift_state == ctx.e.shift_state:
+        return True
+    if ctx.e.layout == JISLayout_JIS:
         if next_shift_state == 0:
-            ctx.p[0] = 0x0e
-            ctx.p += 1
+            p[0] = 0x0e
+            p += 1
         elif next_shift_state == 1:
-            ctx.p[0] = 0x0f
-            ctx.p += 1
+            p[0] = 0x0f
+            p += 1
         else:
             ctx.err = JNTAJISError_AssertionError
             return False
-    return True
-
-
-cdef bint jis_put_siso(
-    JNTAJISIncrementalEncoderContext* ctx,
-    uint16_t jis
-) nogil:
-    if not JNTAJISIncrementalEncoderContext_put_shift(ctx, jis // (94 * 94)):
-        return False
-    ctx.p = <char *>PyBytesWriter_Prepare(ctx.writer, ctx.p, 2)
-    if not ctx.p:
-        ctx.err = JNTAJISError_MemoryError
+    elif ctx.e.layout == JISLayout_ISO_2022_JP_2004:
+        p[0] = 0x1b
+        if next_shift_state == ISO2022Designation_ASCII:
+            p[1] = 0x28  # (
+            p[2] = 0x42  # B
+            p += 3
+        elif next_shift_state == ISO2022Designation_JISX0208:
+            p[1] = 0x24  # $
+            p[2] = 0x42  # B
+            p += 3
+        elif next_shift_state == ISO2022Designation_JISX0213_PLANE1:
+            p[1] = 0x24  # $
+            p[2] = 0x28  # (
+            p[3] = 0x51  # Q
+            p += 4
+        elif next_shift_state == ISO2022Designation_JISX0213_PLANE2:
+            p[1] = 0x24  # $
+            p[2] = 0x28  # (
+            p[3] = 0x50  # P
+            p += 4
+        else:
+            ctx.err = JNTAJISError_AssertionError
+            return False
+    else:
+        ctx.err = JNTAJISError_AssertionError
         return False
-    ctx.p[0] = 0x21 + jis // 94 % 94
-    ctx.p[1] = 0x21 + jis % 94
-    ctx.p += 2
+    ctx.e.shift_state = next_shift_state
+    ctx.p = p
     return True
 
 
-cdef object JNTAJISIncrementalEncoderContext_flush_lookahead(
+cdef bint JNTAJISIncrementalEncoderContext_flush_lookahead(
     JNTAJISIncrementalEncoderContext* ctx
-):
+) noexcept nogil:
+    # the last character in the lookahead buffer is at ctx.pos
     cdef jis_put_func put = ctx.e.put_jis
     cdef size_t i
     cdef uint32_t u
     cdef uint16_t jis
-    cdef bint ok
+    cdef Py_ssize_t pos = ctx.pos + 1 - <Py_ssize_t>ctx.e.lal
 
     for i in range(ctx.e.lal):
         u = ctx.e.la[i]
-        ok = lookup_rev_table(&jis, u)
-        if ok:
-            ok = put(ctx, jis)
-        if not ok:
-            if ctx.err == JNTAJISError_Success:
-                JNTAJISIncrementalEncoderContext_put_replacement(ctx)
-            else:
-                JNTAJISIncrementalEncoderContext_raise(ctx)
+        if not lookup_rev_table(&jis, u):
+            if not JNTAJISIncrementalEncoderContext_put_replacement(
+                ctx, pos + i, pos + i + 1, u, JNTAJISError_UnmappedCharacter,
+            ):
+                return False
+        elif not put(ctx, jis):
+            if ctx.err != JNTAJISError_Success:
+                return False
+            if not JNTAJISIncrementalEncoderContext_put_replacement(
+                ctx, pos + i, pos + i + 1, u, jis_put_failure(ctx, jis),
+            ):
+                return False
 
     JNTAJISIncrementalEncoder_reset(ctx.e)
+    return True
 
 
-cdef object JNTAJISIncrementalEncoderContext_encode(
-    JNTAJISIncrementalEncoderContext* ctx
-):
+ctypedef fused ucs_t:
+    Py_UCS1
+    Py_UCS2
+    Py_UCS4
+
+
+cdef inline bint JNTAJISIncrementalEncoderContext_encode_kind(
+    JNTAJISIncrementalEncoderContext* ctx,
+    const ucs_t* ud,
+) noexcept nogil:
     cdef jis_put_func put = ctx.e.put_jis
-    cdef uint32_t u
+    cdef uint32_t u, la0
     cdef uint16_t jis
+    cdef int state
+    cdef bint ok
     cdef JNTAJISIncrementalEncoder* e = ctx.e
 
-    for ctx.pos in range(ctx.ul):
-        u = PyUnicode_READ(ctx.uk, ctx.ud, ctx.pos)
+    while ctx.pos < ctx.ul:
+        if ctx.pe - ctx.p < <Py_ssize_t>((e.lal + 1) * e.max_put_len):
+            ctx.err = JNTAJISError_BufferFull
+            return False
+        u = ud[ctx.pos]
+        if e.state == 0 and (
+            not sm_uni_to_jis_is_first(u) or (
+                ctx.pos + 1 < ctx.ul and (
+                    (ucs_t is Py_UCS1 and SM_UNI_TO_JIS_MIN_SECOND > 0xff) or
+                    not sm_uni_to_jis_is_second(ud[ctx.pos + 1])
+                )
+            )
+        ):
+            # A character that cannot begin a combining sequence, or that is
+            # followed by one that cannot complete it, is looked up on its
+            # own without going through the lookahead buffer.  The last
+            # character may be continued in the next chunk.
+            if not lookup_rev_table(&jis, u):
+                if not JNTAJISIncrementalEncoderContext_put_replacement(
+                    ctx, ctx.pos, ctx.pos + 1, u, JNTAJISError_UnmappedCharacter,
+                ):
+                    return False
+            elif not put(ctx, jis):
+                if ctx.err != JNTAJISError_Success:
+                    return False
+                if not JNTAJISIncrementalEncoderContext_put_replacement(
+                    ctx, ctx.pos, ctx.pos + 1, u, jis_put_failure(ctx, jis),
+                ):
+                    return False
+            ctx.pos += 1
+            continue
         jis = sm_uni_to_jis_mapping(&e.state, u)
         if e.state == -1:
+            if e.lal > 1:
+                # the characters before the one that began the sequence
+                la0 = e.la[e.lal - 1]
+                e.lal -= 1
+                ctx.pos -= 1
+                ok = JNTAJISIncrementalEncoderContext_flush_lookahead(ctx)
+                ctx.pos += 1
+                if not ok:
+                    return False
+                e.la[0] = la0
+                e.lal = 1
             if not put(ctx, jis):
-                if ctx.err == JNTAJISError_Success:
-                    JNTAJISIncrementalEncoderContext_put_replacement(ctx)
-                else:
-                    JNTAJISIncrementalEncoderContext_raise(ctx)
+                if ctx.err != JNTAJISError_Success:
+                    return False
+                if not JNTAJISIncrementalEncoderContext_put_replacement(
+                    ctx,
+                    ctx.pos - <Py_ssize_t>e.lal,
+                    ctx.pos + 1,
+                    e.la[0] if e.lal > 0 else u,
+                    jis_put_failure(ctx, jis),
+                ):
+                    return False
             e.lal = 0
             e.state = 0
         else:
+            if e.state > 0 and e.lal > 0:
+                # u begins a new sequence in place of the pending one, so
+                # that the lookahead never holds more than one starter
+                state = e.state
+                ctx.pos -= 1
+                ok = JNTAJISIncrementalEncoderContext_flush_lookahead(ctx)
+                ctx.pos += 1
+                if not ok:
+                    return False
+                e.state = state
             if e.lal >= sizeof(e.la) // sizeof(e.la[0]):
-                raise JNTAJISIncrementalEncoderContext_createUnicodeEncodeError(
-                    ctx, "lookahead buffer overflow"
-                )
+                ctx.err = JNTAJISError_LookaheadOverflow
+                ctx.err_start = ctx.pos
+                ctx.err_end = ctx.pos + 1
+                return False
             e.la[e.lal] = u
             e.lal += 1
             if e.state == 0:
-                JNTAJISIncrementalEncoderContext_flush_lookahead(ctx)
+                if not JNTAJISIncrementalEncoderContext_flush_lookahead(ctx):
+                    return False
+        ctx.pos += 1
+    return True
+
+
+cdef bint JNTAJISIncrementalEncoderContext_encode(
+    JNTAJISIncrementalEncoderContext* ctx
+) noexcept nogil:
+    # Convert the input from ctx.pos onwards into the space between ctx.p and
+    # ctx.pe without touching any Python object.  On failure, ctx.err is set
+    # and ctx.pos points to the offending character.  JNTAJISError_BufferFull
+    # tells the output space may run short at the next character, in which
+    # case the conversion can be resumed after reserving more space.  The
+    # loop is specialized for each string kind.
+    if ctx.uk == PyUnicode_1BYTE_KIND:
+        return JNTAJISIncrementalEncoderContext_encode_kind(ctx, <const Py_UCS1*>ctx.ud)
+    elif ctx.uk == PyUnicode_2BYTE_KIND:
+        return JNTAJISIncrementalEncoderContext_encode_kind(ctx, <const Py_UCS2*>ctx.ud)
+    else:
+        return JNTAJISIncrementalEncoderContext_encode_kind(ctx, <const Py_UCS4*>ctx.ud)
 
 
-cdef void JNTAJISIncrementalEncoder_reset(JNTAJISIncrementalEncoder* e) noexcept:
+cdef void JNTAJISIncrementalEncoder_reset(JNTAJISIncrementalEncoder* e) noexcept nogil:
     e.state = 0
     e.lal = 0
 
 
+cdef object JNTAJISIncrementalEncoderContext_put_bytes(
+    JNTAJISIncrementalEncoderContext* ctx,
+    bytes b,
+):
+    cdef Py_ssize_t n = len(b)
+    JNTAJISIncrementalEncoderContext_reserve(ctx, n)
+    memcpy(ctx.p, <const char*>b, n)
+    ctx.p += n
+
+
+cdef object JNTAJISIncrementalEncoderContext_put_unicode(
+    JNTAJISIncrementalEncoderContext* ctx,
+    unicode u,
+):
+    # encode the replacement string returned by an error handler strictly,
+    # continuing from the current shift state
+    cdef JNTAJISIncrementalEncoder e = ctx.e[0]
+    cdef JNTAJISIncrementalEncoderContext rctx
+    e.errors = JNTAJISErrorHandling_STRICT
+    e.failures = NULL
+    JNTAJISIncrementalEncoder_reset(&e)
+    rctx.e = &e
+    rctx.writer = ctx.writer
+    rctx.u = <PyObject*>u  # borrow
+    rctx.uk = PyUnicode_KIND(u)
+    rctx.ud = PyUnicode_DATA(u)
+    rctx.ul = PyUnicode_GET_LENGTH(u)
+    rctx.pos = 0
+    rctx.err = JNTAJISError_Success
+    rctx.p = ctx.p
+    rctx.pe = ctx.pe
+    try:
+        while not JNTAJISIncrementalEncoderContext_encode(&rctx):
+            if rctx.err != JNTAJISError_BufferFull:
+                JNTAJISIncrementalEncoderContext_raise(&rctx)
+            rctx.err = JNTAJISError_Success
+            JNTAJISIncrementalEncoderContext_reserve(
+                &rctx,
+                (rctx.ul - rctx.pos) * 2 + (e.lal + 1) * e.max_put_len,
+            )
+        rctx.pos -= 1
+        JNTAJISIncrementalEncoderContext_reserve(&rctx, e.lal * e.max_put_len)
+        if not JNTAJISIncrementalEncoderContext_flush_lookahead(&rctx):
+            JNTAJISIncrementalEncoderContext_raise(&rctx)
+    finally:
+        ctx.p = rctx.p
+        ctx.pe = rctx.pe
+    ctx.e.shift_state = e.shift_state
+
+
+cdef object JNTAJISIncrementalEncoderContext_call_error_handler(
+    JNTAJISIncrementalEncoderContext* ctx,
+):
+    # Raise the error in ctx unless a custom error handler is set.  Otherwise
+    # call the handler as the codec machinery does, write out what it
+    # returns and move ctx.pos to where the conversion is to be resumed.
+    cdef object exc, retval, repl
+    cdef Py_ssize_t newpos
+    if ctx.e.errors != JNTAJISErrorHandling_CALLBACK or ctx.err in (
+        JNTAJISError_MemoryError,
+        JNTAJISError_AssertionError,
+        JNTAJISError_BufferFull,
+    ):
+        JNTAJISIncrementalEncoderContext_raise(ctx)
+    exc = JNTAJISIncrementalEncoderContext_createError(ctx)
+    retval = (<object>ctx.e.error_handler)(exc)
+    if (
+        not isinstance(retval, tuple)
+        or len(retval) != 2
+        or not isinstance(retval[0], (str, bytes))
+        or not isinstance(retval[1], int)
+    ):
+        raise TypeError("encoding error handler must return (str/bytes, int) tuple")
+    repl, newpos = retval
+    if newpos < 0:
+        newpos += ctx.ul
+    if newpos < 0 or newpos > ctx.ul:
+        raise IndexError(f"position {retval[1]} from error handler out of bounds")
+    JNTAJISIncrementalEncoder_reset(ctx.e)
+    ctx.err = JNTAJISError_Success
+    if isinstance(repl, bytes):
+        JNTAJISIncrementalEncoderContext_put_bytes(ctx, repl)
+    else:
+        JNTAJISIncrementalEncoderContext_put_unicode(ctx, repl)
+    ctx.pos = newpos
+
+
 cdef object JNTAJISIncrementalEncoder_encode(
     JNTAJISIncrementalEncoder* e,
     unicode u,
     bint flush,
 ):
     cdef JNTAJISIncrementalEncoderContext ctx
+    cdef bint ok
     ctx.e = e
     ctx.u = <PyObject*>u  # borrow
     ctx.uk = PyUnicode_KIND(u)
@@ -376,50 +905,392 @@ cdef object JNTAJISIncrementalEncoder_encode(
     if not ctx.writer:
         raise MemoryError()
     ctx.p = <char *>PyBytesWriter_GetData(ctx.writer)
+    ctx.pe = ctx.p + ctx.ul * 2
     try:
-        JNTAJISIncrementalEncoderContext_encode(&ctx)
-        if flush:
-            JNTAJISIncrementalEncoderContext_flush_lookahead(&ctx)
-            JNTAJISIncrementalEncoderContext_put_shift(&ctx, 0)
+        while True:
+            if ctx.ul - ctx.pos >= JNTAJIS_NOGIL_THRESHOLD:
+                with nogil:
+                    ok = JNTAJISIncrementalEncoderContext_encode(&ctx)
+            else:
+                ok = JNTAJISIncrementalEncoderContext_encode(&ctx)
+            if ok:
+                if not flush:
+                    break
+                if ctx.pos > 0:
+                    ctx.pos -= 1
+                JNTAJISIncrementalEncoderContext_reserve(&ctx, e.lal * e.max_put_len + e.max_reset_len)
+                if (
+                    JNTAJISIncrementalEncoderContext_flush_lookahead(&ctx) and
+                    JNTAJISIncrementalEncoderContext_put_shift(&ctx, 0)
+                ):
+                    break
+            elif ctx.err == JNTAJISError_BufferFull:
+                ctx.err = JNTAJISError_Success
+                JNTAJISIncrementalEncoderContext_reserve(
+                    &ctx,
+                    (ctx.ul - ctx.pos) * 2 + (e.lal + 1) * e.max_put_len,
+                )
+                continue
+            JNTAJISIncrementalEncoderContext_call_error_handler(&ctx)
         return PyBytesWriter_FinishWithPointer(ctx.writer, ctx.p)
     except:
         PyBytesWriter_Discard(ctx.writer)
         raise
 
 
-ctypedef enum ConversionMode:
-    ConversionMode_SISO              = 0
-    ConversionMode_MEN1              = 1
-    ConversionMode_JISX0208          = 2
-    ConversionMode_JISX0208_TRANSLIT = 3
+cdef bint JNTAJISIncrementalEncoderContext_encode_spill(
+    JNTAJISIncrementalEncoderContext* ctx,
+    char* out,
+    Py_ssize_t* n,
+) noexcept nogil:
+    # Convert the rest of the input, including the final flush, through a
+    # scratch area, adding the output length to n and copying the output to
+    # out + n unless out is NULL.  The scratch area always has room for the
+    # worst case output of a character with a full lookahead buffer.
+    cdef char[1024] scratch
+    cdef bint ok
+    while True:
+        ctx.p = scratch
+        ctx.pe = scratch + sizeof(scratch)
+        ok = JNTAJISIncrementalEncoderContext_encode(ctx)
+        if not ok and ctx.err != JNTAJISError_BufferFull:
+            return False
+        if out != NULL:
+            memcpy(out + n[0], scratch, ctx.p - scratch)
+        n[0] += ctx.p - scratch
+        if ok:
+            break
+        ctx.err = JNTAJISError_Success
+    ctx.p = scratch
+    if ctx.pos > 0:
+        ctx.pos -= 1
+    if not (
+        JNTAJISIncrementalEncoderContext_flush_lookahead(ctx) and
+        JNTAJISIncrementalEncoderContext_put_shift(ctx, 0)
+    ):
+        return False
+    if out != NULL:
+        memcpy(out + n[0], scratch, ctx.p - scratch)
+    n[0] += ctx.p - scratch
+    return True
 
 
-cdef jis_put_func jis_put_func_for_conversion_mode(int conv_mode):
-    if conv_mode == ConversionMode_SISO:
-        return jis_put_siso
-    elif conv_mode == ConversionMode_MEN1:
-        return jis_put_men_1
-    elif conv_mode == ConversionMode_JISX0208:
-        return jis_put_jisx0208
-    elif conv_mode == ConversionMode_JISX0208_TRANSLIT:
-        return jis_put_jisx0208_translit
+cdef Py_ssize_t JNTAJISIncrementalEncoder_encoded_length(
+    JNTAJISIncrementalEncoder* e,
+    unicode u,
+) except -1:
+    # The encoder is left untouched; failures are not recorded twice.
+    cdef JNTAJISIncrementalEncoder e0 = e[0]
+    cdef JNTAJISIncrementalEncoderContext ctx
+    cdef Py_ssize_t n = 0
+    cdef bint ok
+    if e.errors == JNTAJISErrorHandling_CALLBACK:
+        raise ValueError("custom error handlers are not supported when computing the length")
+    e0.failures = NULL
+    ctx.e = &e0
+    ctx.writer = NULL
+    ctx.u = <PyObject*>u  # borrow
+    ctx.uk = PyUnicode_KIND(u)
+    ctx.ud = PyUnicode_DATA(u)
+    ctx.ul = PyUnicode_GET_LENGTH(u)
+    ctx.pos = 0
+    ctx.err = JNTAJISError_Success
+    if ctx.ul >= JNTAJIS_NOGIL_THRESHOLD:
+        with nogil:
+            ok = JNTAJISIncrementalEncoderContext_encode_spill(&ctx, NULL, &n)
     else:
-        return NULL
-
-
-cdef void JNTAJISIncrementalEncoder_fini(JNTAJISIncrementalEncoder* e):
-    Py_DECREF(<object>e.encoding)
+        ok = JNTAJISIncrementalEncoderContext_encode_spill(&ctx, NULL, &n)
+    if not ok:
+        JNTAJISIncrementalEncoderContext_raise(&ctx)
+    return n
 
 
-cdef object JNTAJISIncrementalEncoder_init(JNTAJISIncrementalEncoder* e, unicode encoding, int conv_mode):
-    if len(encoding) == 0:
-        raise ValueError("encoding cannot be empty")
+cdef object JNTAJISIncrementalEncoder_encode_presized(
+    JNTAJISIncrementalEncoder* e,
+    unicode u,
+):
+    # Same as JNTAJISIncrementalEncoder_encode() with flush, except that the
+    # output is written into a bytes object of the exact size computed in
+    # advance.  The core stops short of the end of the buffer as it keeps
+    # room for the worst case; the rest is converted through a scratch area.
+    cdef Py_ssize_t l = JNTAJISIncrementalEncoder_encoded_length(e, u)
+    cdef bytes retval = PyBytes_FromStringAndSize(NULL, l)
+    cdef char* buf = <char*>retval
+    cdef JNTAJISIncrementalEncoderContext ctx
+    cdef Py_ssize_t n
+    cdef bint ok
+    ctx.e = e
+    ctx.writer = NULL
+    ctx.u = <PyObject*>u  # borrow
+    ctx.uk = PyUnicode_KIND(u)
+    ctx.ud = PyUnicode_DATA(u)
+    ctx.ul = PyUnicode_GET_LENGTH(u)
+    ctx.pos = 0
+    ctx.err = JNTAJISError_Success
+    ctx.p = buf
+    ctx.pe = buf + l
+    if ctx.ul >= JNTAJIS_NOGIL_THRESHOLD:
+        with nogil:
+            ok = JNTAJISIncrementalEncoderContext_encode(&ctx)
+            if ok or ctx.err == JNTAJISError_BufferFull:
+                ctx.err = JNTAJISError_Success
+                n = ctx.p - buf
+                ok = JNTAJISIncrementalEncoderContext_encode_spill(&ctx, buf, &n)
+    else:
+        ok = JNTAJISIncrementalEncoderContext_encode(&ctx)
+        if ok or ctx.err == JNTAJISError_BufferFull:
+            ctx.err = JNTAJISError_Success
+            n = ctx.p - buf
+            ok = JNTAJISIncrementalEncoderContext_encode_spill(&ctx, buf, &n)
+    if not ok:
+        JNTAJISIncrementalEncoderContext_raise(&ctx)
+    if n != l:
+        raise AssertionError()
+    return retval
+
+
+cdef object JNTAJISIncrementalEncoder_encode_into(
+    JNTAJISIncrementalEncoder* e,
+    unicode u,
+    char* buf,
+    Py_ssize_t buf_len,
+    bint final,
+):
+    # The bulk of the input is converted straight into the buffer as long as
+    # the worst-case output of the next character fits, keeping room for
+    # the closing shift.  Near the end of the buffer, each character is
+    # converted into a scratch area and committed only if its output, plus
+    # the flushed lookahead if final is true, fits in what is left.
+    #
+    # If final is true, the characters reported as consumed are always
+    # followed by the complete flush: when the flush does not fit after the
+    # bulk conversion, the call starts over one character at a time.
+    cdef JNTAJISIncrementalEncoderContext ctx
+    cdef JNTAJISIncrementalEncoder e_start, e0, e1
+    cdef char[1024] scratch
+    cdef char* be = buf + buf_len
+    cdef char* out
+    cdef Py_ssize_t ul, n
+    cdef bint ok, restarted = False
+
+    if e.errors == JNTAJISErrorHandling_CALLBACK:
+        raise ValueError("custom error handlers are not supported when encoding into a buffer")
+    e_start = e[0]
+    ctx.e = e
+    ctx.writer = NULL
+    ctx.u = <PyObject*>u  # borrow
+    ctx.uk = PyUnicode_KIND(u)
+    ctx.ud = PyUnicode_DATA(u)
+    ctx.ul = ul = PyUnicode_GET_LENGTH(u)
+    ctx.pos = 0
+    ctx.err = JNTAJISError_Success
+    ctx.p = buf
+    ctx.pe = be - e.max_reset_len if buf_len >= <Py_ssize_t>e.max_reset_len else buf
+    if ctx.ul >= JNTAJIS_NOGIL_THRESHOLD:
+        with nogil:
+            ok = JNTAJISIncrementalEncoderContext_encode(&ctx)
+    else:
+        ok = JNTAJISIncrementalEncoderContext_encode(&ctx)
+    if not ok and ctx.err != JNTAJISError_BufferFull:
+        JNTAJISIncrementalEncoderContext_raise(&ctx)
+    while True:
+        if not ok:
+            ctx.err = JNTAJISError_Success
+            out = ctx.p
+            while ctx.pos < ul:
+                e0 = e[0]
+                ctx.p = scratch
+                ctx.pe = scratch + sizeof(scratch)
+                ctx.ul = ctx.pos + 1
+                if not JNTAJISIncrementalEncoderContext_encode(&ctx):
+                    JNTAJISIncrementalEncoderContext_raise(&ctx)
+                n = ctx.p - scratch
+                if final:
+                    e1 = e[0]
+                    ctx.pos -= 1
+                    if not (
+                        JNTAJISIncrementalEncoderContext_flush_lookahead(&ctx) and
+                        JNTAJISIncrementalEncoderContext_put_shift(&ctx, 0)
+                    ):
+                        JNTAJISIncrementalEncoderContext_raise(&ctx)
+                    ctx.pos += 1
+                    e[0] = e1
+                if ctx.p - scratch > be - out:
+                    e[0] = e0
+                    ctx.pos -= 1
+                    break
+                memcpy(out, scratch, n)
+                out += n
+            ctx.p = out
+            ctx.ul = ul
+        if not final:
+            break
+        e0 = e[0]
+        out = ctx.p
+        ctx.p = scratch
+        ctx.pe = scratch + sizeof(scratch)
+        n = ctx.pos
+        if ctx.pos > 0:
+            ctx.pos -= 1
+        if not (
+            JNTAJISIncrementalEncoderContext_flush_lookahead(&ctx) and
+            JNTAJISIncrementalEncoderContext_put_shift(&ctx, 0)
+        ):
+            JNTAJISIncrementalEncoderContext_raise(&ctx)
+        ctx.pos = n
+        n = ctx.p - scratch
+        if n <= be - out:
+            memcpy(out, scratch, n)
+            ctx.p = out + n
+            break
+        e[0] = e0
+        if restarted or ctx.pos == 0:
+            # the output of every character converted one at a time is
+            # followed by room for the flush, so nothing of the input fits
+            # here and the flush is of the state left over from the
+            # previous calls
+            if ul == 0:
+                raise ValueError(
+                    "buffer too small to return to the initial state; "
+                    "retry with a larger buffer"
+                )
+            ctx.p = out
+            break
+        # the lookahead flushed at the end of the bulk conversion does not
+        # fit; start over one character at a time
+        restarted = True
+        e[0] = e_start
+        ctx.pos = 0
+        ctx.p = buf
+        ok = False
+    return ctx.pos, ctx.p - buf
+
+
+cdef object JNTAJISIncrementalEncoder_encode_into_object(
+    JNTAJISIncrementalEncoder* e,
+    unicode u,
+    object buffer,
+    Py_ssize_t offset,
+    bint final,
+):
+    cdef Py_buffer view
+    PyObject_GetBuffer(buffer, &view, PyBUF_WRITABLE)
+    try:
+        if offset < 0 or offset > view.len:
+            raise ValueError(f"offset out of range: {offset}")
+        return JNTAJISIncrementalEncoder_encode_into(
+            e, u, <char*>view.buf + offset, view.len - offset, final,
+        )
+    finally:
+        PyBuffer_Release(&view)
+
+
+ctypedef enum ConversionMode:
+    # the lower two bits select the repertoire, the rest the byte layout
+    ConversionMode_SISO              = 0
+    ConversionMode_MEN1              = 1
+    ConversionMode_JISX0208          = 2
+    ConversionMode_JISX0208_TRANSLIT = 3
+    ConversionMode_SJIS2004          = 4
+    ConversionMode_EUC_JIS2004       = 8
+    ConversionMode_ISO2022JP2004     = 12
+    ConversionMode_MAX               = 16
+
+
+cdef size_t max_put_len_for_conversion_mode(int conv_mode):
+    cdef JISLayout layout = <JISLayout>(conv_mode // 4)
+    cdef size_t n = 1
+    cdef size_t l = 2
+    if conv_mode % 4 == ConversionMode_JISX0208_TRANSLIT:
+        n = sizeof(tx_mappings[0].tx_jis) // sizeof(tx_mappings[0].tx_jis[0])
+    if layout == JISLayout_JIS:
+        if conv_mode % 4 == ConversionMode_SISO:
+            l += 1  # SI / SO
+    elif layout == JISLayout_EUC_JIS_2004:
+        l += 1  # SS3
+    elif layout == JISLayout_ISO_2022_JP_2004:
+        l += 4  # ESC $ ( Q
+    return n * l
+
+
+cdef size_t max_reset_len_for_conversion_mode(int conv_mode):
+    cdef JISLayout layout = <JISLayout>(conv_mode // 4)
+    if conv_mode == ConversionMode_SISO:
+        return 1  # SO
+    elif layout == JISLayout_ISO_2022_JP_2004:
+        return 3  # ESC ( B
+    else:
+        return 0
+
+
+cdef jis_put_func jis_put_func_for_conversion_mode(int conv_mode):
+    if conv_mode < 0 or conv_mode >= ConversionMode_MAX:
+        return NULL
+    conv_mode %= 4
+    if conv_mode == ConversionMode_SISO:
+        return jis_put_any
+    elif conv_mode == ConversionMode_MEN1:
+        return jis_put_men_1
+    elif conv_mode == ConversionMode_JISX0208:
+        return jis_put_jisx0208
+    elif conv_mode == ConversionMode_JISX0208_TRANSLIT:
+        return jis_put_jisx0208_translit
+    else:
+        return NULL
+
+
+cdef void JNTAJISIncrementalEncoder_fini(JNTAJISIncrementalEncoder* e):
+    Py_XDECREF(e.encoding)
+    e.encoding = NULL
+    Py_XDECREF(e.error_handler)
+    e.error_handler = NULL
+
+
+cdef object JNTAJISIncrementalEncoder_init(
+    JNTAJISIncrementalEncoder* e,
+    unicode encoding,
+    int conv_mode,
+    unicode errors=u"strict",
+    unicode replacement=u"\u3013",
+):
+    # everything is checked before e is touched, so that a failure leaves
+    # nothing for JNTAJISIncrementalEncoder_fini() to release
+    cdef object handler = None
+    cdef uint16_t replacement_jis
+    cdef JNTAJISErrorHandling errors_
+    cdef jis_put_func put_jis
+    if len(encoding) == 0:
+        raise ValueError("encoding cannot be empty")
+    if len(replacement) != 1 or not lookup_rev_table(&replacement_jis, ord(replacement)):
+        raise ValueError(f"replacement must be a single JIS character: {replacement!r}")
+    put_jis = jis_put_func_for_conversion_mode(<int>conv_mode)
+    if not put_jis:
+        raise ValueError(f"unknown conversion mode: {conv_mode}")
+    if errors == u"strict":
+        errors_ = JNTAJISErrorHandling_STRICT
+    else:
+        handler = codecs.lookup_error(errors)
+        if handler is codecs.strict_errors:
+            errors_ = JNTAJISErrorHandling_STRICT
+        elif handler is codecs.replace_errors:
+            errors_ = JNTAJISErrorHandling_REPLACE
+        elif handler is codecs.ignore_errors:
+            errors_ = JNTAJISErrorHandling_IGNORE
+        else:
+            errors_ = JNTAJISErrorHandling_CALLBACK
+    e.replacement = replacement_jis
+    e.errors = errors_
+    e.error_handler = NULL
+    if errors_ == JNTAJISErrorHandling_CALLBACK:
+        Py_INCREF(handler)
+        e.error_handler = <PyObject*>handler
+    e.failures = NULL
     Py_INCREF(encoding)
     e.encoding = <PyObject*>encoding
-    e.replacement = <uint16_t>-1
-    e.put_jis = jis_put_func_for_conversion_mode(<int>conv_mode)
-    if not e.put_jis:
-        raise ValueError(f"unknown conversion mode: {conv_mode}")
+    e.put_jis = put_jis
+    e.layout = <JISLayout>(conv_mode // 4)
+    e.max_put_len = max_put_len_for_conversion_mode(<int>conv_mode)
+    e.max_reset_len = max_reset_len_for_conversion_mode(<int>conv_mode)
     e.lal = 0
     e.shift_state = 0
     e.state = 0
@@ -437,348 +1308,2182 @@ cdef class IncrementalEncoder:
     def encode(self, in_, final):
         return JNTAJISIncrementalEncoder_encode(&self._impl, in_, final)
 
+    def encode_into(self, unicode in_, buffer, Py_ssize_t offset=0, final=False):
+        """
+        Encode the given string into a writable buffer starting at offset,
+        and return a tuple of the number of characters consumed and the
+        number of bytes written.  The conversion stops when the next
+        character no longer fits in the buffer.
+
+        If final is true, the consumed characters are always followed by
+        the flush of the pending state, and ValueError is raised if in_ is
+        empty and the flush does not fit in the buffer.
+        """
+        return JNTAJISIncrementalEncoder_encode_into_object(&self._impl, in_, buffer, offset, final)
+
     def reset(self):
         JNTAJISIncrementalEncoder_reset(&self._impl)
 
     def getstate(self):
-        return self._impl.state * 2 + self._impl.shift_state
+        return self._impl.state * 4 + self._impl.shift_state
 
     def setstate(self, state):
-        self._impl.shift_state = state % 2
-        self._impl.state = state // 2
+        self._impl.shift_state = state % 4
+        self._impl.state = state // 4
 
     def __del__(self):
         JNTAJISIncrementalEncoder_fini(&self._impl)
 
-    def __init__(self, unicode encoding, int conv_mode):
-        JNTAJISIncrementalEncoder_init(&self._impl, encoding, conv_mode)
+    def __init__(
+        self,
+        unicode encoding,
+        int conv_mode,
+        unicode errors=u"strict",
+        unicode replacement=u"\u3013",
+    ):
+        JNTAJISIncrementalEncoder_init(&self._impl, encoding, conv_mode, errors, replacement)
 
 
-def jnta_encode(unicode encoding, unicode in_, int conv_mode):
+def jnta_encode(
+    unicode encoding,
+    unicode in_,
+    int conv_mode,
+    unicode errors=u"strict",
+    unicode replacement=u"\u3013",
+    bint presize=False,
+):
     """
     Encode a given Unicode string into JIS X 0208:1997 / JIS X 0213:2012.
     """
 
     cdef JNTAJISIncrementalEncoder e
-    JNTAJISIncrementalEncoder_init(&e, encoding, conv_mode)
+    JNTAJISIncrementalEncoder_init(&e, encoding, conv_mode, errors, replacement)
+    try:
+        if presize:
+            return JNTAJISIncrementalEncoder_encode_presized(&e, in_)
+        else:
+            return JNTAJISIncrementalEncoder_encode(&e, in_, True)
+    finally:
+        JNTAJISIncrementalEncoder_fini(&e)
+
+
+def jnta_encoded_length(
+    unicode in_,
+    int conv_mode,
+    unicode errors=u"strict",
+    unicode replacement=u"\u3013",
+):
+    """
+    Return the exact number of bytes that jnta_encode() would produce for
+    a given Unicode string, without building the output.
+    """
+
+    cdef JNTAJISIncrementalEncoder e
+    JNTAJISIncrementalEncoder_init(&e, u"jis", conv_mode, errors, replacement)
+    try:
+        return JNTAJISIncrementalEncoder_encoded_length(&e, in_)
+    finally:
+        JNTAJISIncrementalEncoder_fini(&e)
+
+
+def jnta_encode_report(
+    unicode encoding,
+    unicode in_,
+    int conv_mode,
+    unicode errors=u"replace",
+    unicode replacement=u"\u3013",
+):
+    """
+    Encode a given Unicode string into JIS X 0208:1997 / JIS X 0213:2012,
+    and return a tuple of the encoded bytes and the list of
+    (position, codepoint, reason) for every character that could not be
+    encoded, gathered in a single pass.
+    """
+
+    cdef JNTAJISIncrementalEncoder e
+    cdef JNTAJISEncodeFailureBuffer failures
+    cdef JNTAJISEncodeFailure* f
+    cdef Py_ssize_t i
+    cdef bytes retval
+    JNTAJISIncrementalEncoder_init(&e, encoding, conv_mode, errors, replacement)
+    failures.p = NULL
+    failures.l = 0
+    failures.cap = 0
+    e.failures = &failures
+    try:
+        retval = JNTAJISIncrementalEncoder_encode(&e, in_, True)
+        report = []
+        for i in range(failures.l):
+            f = &failures.p[i]
+            report.append((
+                f.pos,
+                f.u,
+                (<bytes>JNTAJISIncrementalEncoder_reason(<JNTAJISError>f.reason)).decode("ascii"),
+            ))
+        return retval, report
+    finally:
+        JNTAJISEncodeFailureBuffer_fini(&failures)
+        JNTAJISIncrementalEncoder_fini(&e)
+
+
+def jnta_encode_into(
+    unicode encoding,
+    unicode in_,
+    int conv_mode,
+    buffer,
+    Py_ssize_t offset=0,
+    unicode errors=u"strict",
+    unicode replacement=u"\u3013",
+):
+    """
+    Encode a given Unicode string into JIS X 0208:1997 / JIS X 0213:2012,
+    writing the result into a writable buffer starting at offset.
+    """
+
+    cdef JNTAJISIncrementalEncoder e
+    JNTAJISIncrementalEncoder_init(&e, encoding, conv_mode, errors, replacement)
     try:
-        return JNTAJISIncrementalEncoder_encode(&e, in_, True)
+        return JNTAJISIncrementalEncoder_encode_into_object(&e, in_, buffer, offset, True)
     finally:
         JNTAJISIncrementalEncoder_fini(&e)
 
 
+ctypedef struct UCS4Buffer:
+    Py_UCS4* p
+    Py_ssize_t l
+    Py_ssize_t cap
+
+
+cdef bint UCS4Buffer_init(UCS4Buffer* b, Py_ssize_t cap) noexcept nogil:
+    if cap < 16:
+        cap = 16
+    b.p = <Py_UCS4*>malloc(cap * sizeof(Py_UCS4))
+    b.l = 0
+    b.cap = cap
+    return b.p != NULL
+
+
+cdef bint UCS4Buffer_reserve(UCS4Buffer* b, Py_ssize_t n) noexcept nogil:
+    cdef Py_ssize_t cap
+    cdef Py_UCS4* p
+    if b.cap - b.l >= n:
+        return True
+    cap = b.cap + b.cap // 2
+    if cap < b.l + n:
+        cap = b.l + n
+    p = <Py_UCS4*>realloc(b.p, cap * sizeof(Py_UCS4))
+    if p == NULL:
+        return False
+    b.p = p
+    b.cap = cap
+    return True
+
+
+cdef void UCS4Buffer_fini(UCS4Buffer* b) noexcept nogil:
+    free(b.p)
+    b.p = NULL
+
+
+cdef unicode UCS4Buffer_to_unicode(UCS4Buffer* b):
+    return PyUnicode_FromKindAndData(PyUnicode_4BYTE_KIND, b.p, b.l)
+
+
+cdef bint UCS4Buffer_append_kind(
+    UCS4Buffer* b,
+    int uk,
+    const void* ud,
+    Py_ssize_t n,
+) noexcept nogil:
+    # append the first n characters of the string data of the given kind
+    cdef Py_ssize_t i
+    if not UCS4Buffer_reserve(b, n):
+        return False
+    if uk == PyUnicode_4BYTE_KIND:
+        memcpy(&b.p[b.l], ud, n * sizeof(Py_UCS4))
+    elif uk == PyUnicode_2BYTE_KIND:
+        for i in range(n):
+            b.p[b.l + i] = (<const Py_UCS2*>ud)[i]
+    else:
+        for i in range(n):
+            b.p[b.l + i] = (<const Py_UCS1*>ud)[i]
+    b.l += n
+    return True
+
+
+cdef inline bint ShrinkingTransliterationMapping_shrinks(
+    const ShrinkingTransliterationMapping* m,
+) noexcept nogil:
+    # whether the character is transliterated as it is not in JIS X 0208
+    return (
+        (
+            m.class_ == JISCharacterClass_JISX0213_NON_KANJI or
+            m.class_ == JISCharacterClass_KANJI_LEVEL_3 or
+            m.class_ == JISCharacterClass_KANJI_LEVEL_4
+        )
+        and m.tx_len > 0
+    )
+
+
+cdef bint UCS4Buffer_append_jis(
+    UCS4Buffer* b,
+    const ShrinkingTransliterationMapping* m,
+    bint shrink,
+) noexcept nogil:
+    # append the Unicode form of m, or its transliterated form if shrink is
+    # true and the character is not in JIS X 0208
+    cdef size_t i
+    if shrink and ShrinkingTransliterationMapping_shrinks(m):
+        if not UCS4Buffer_reserve(b, m.tx_len):
+            return False
+        for i in range(m.tx_len):
+            b.p[b.l] = m.tx_us[i]
+            b.l += 1
+    else:
+        if not UCS4Buffer_reserve(b, 2):
+            return False
+        b.p[b.l] = m.us[0]
+        b.l += 1
+        if m.us[1] != <uint32_t>-1:
+            b.p[b.l] = m.us[1]
+            b.l += 1
+    return True
+
+
+ctypedef enum JISInputEncoding:
+    JISInputEncoding_JIS            = 0  # row / column pairs, optionally with SI / SO
+    JISInputEncoding_SHIFT_JIS_2004 = 1
+    JISInputEncoding_EUC_JIS_2004   = 2
+    JISInputEncoding_CP932          = 3
+    JISInputEncoding_MAX            = 4
+
+
 ctypedef struct JNTAJISDecoder:
     PyObject* encoding
+    JISInputEncoding input_encoding
     int siso
     int shift_offset
-    int upper
+    int upper  # the first byte of a character split across chunks
+    int upper2  # the second byte of the above, for the three-byte characters of EUC-JIS-2004
+    bint shrink
+    Py_UCS4* replacement
+    Py_ssize_t replacement_len
+    bint passthrough
+    Py_ssize_t two_pass_threshold  # see JNTAJISDecoder_decode()
+
+
+ctypedef enum JNTAJISDecoderOutput:
+    JNTAJISDecoderOutput_BUFFER  = 0  # append to out
+    JNTAJISDecoderOutput_MEASURE = 1  # only count the characters in out.l and track out_max
+    JNTAJISDecoderOutput_DIRECT  = 2  # write into the string data at out_data, from out.l
+
+
+ctypedef struct JNTAJISDecoderContext:
+    JNTAJISDecoder* d
+    const unsigned char* in_
+    Py_ssize_t in_sz
+    Py_ssize_t err_pos
+    unsigned int c0, c1
+    uint16_t jis
+    JNTAJISDecoderOutput out_mode
+    UCS4Buffer out
+    Py_UCS4 out_max
+    int out_kind
+    void* out_data
+    JNTAJISError err
 
 
 cdef object JNTAJISDecoder_createUnicodeDecodeError(
     JNTAJISDecoder *d,
     object underlying,
-    Py_ssize_t in_size,
     Py_ssize_t pos,
     char *reason
 ):
     return UnicodeDecodeError(
         <object>d.encoding,
         underlying,
-        in_size,
         pos,
         pos + 1,
         (<bytes>reason).decode("ascii"),
     )
 
 
-cdef object JNTAJISDecoder_decode(
-    JNTAJISDecoder *d,
-    object underlying,
-    void* in_bytes,
-    Py_ssize_t in_sz
-):
-    cdef unsigned char* in_ = <unsigned char *>in_bytes
-    cdef unsigned char* p = in_
-    cdef unsigned char* e = in_ + in_sz
-    cdef unsigned int c0, c1
-    cdef uint16_t jis
-    cdef const ShrinkingTransliterationMapping* m
-    cdef _PyUnicodeWriter writer
+cdef object JNTAJISDecoderContext_createError(JNTAJISDecoderContext* ctx, object underlying):
     cdef char[256] reason
 
-    _PyUnicodeWriter_Init(&writer)
-    writer.min_length = in_sz // 2
-    writer.overallocate = 1
+    if ctx.err == JNTAJISError_MemoryError:
+        return MemoryError()
+    elif ctx.err == JNTAJISError_UnmappedCharacter:
+        snprintf(
+            reason, sizeof(reason),
+            "JIS character %d-%d-%d does not have a corresponding unicode codepoint",
+            <int>(ctx.jis // (94 * 94) + 1),
+            <int>(ctx.jis // 94 % 94 + 1),
+            <int>(ctx.jis % 94 + 1),
+        )
+    elif ctx.err == JNTAJISError_UnexpectedTrailingByte:
+        snprintf(
+            reason, sizeof(reason),
+            "unexpected byte \\x%02x after \\x%02x",
+            ctx.c1, ctx.c0,
+        )
+    elif ctx.err == JNTAJISError_UnexpectedByte:
+        snprintf(
+            reason, sizeof(reason),
+            "unexpected byte \\x%02x",
+            ctx.c0,
+        )
+    elif ctx.err == JNTAJISError_IncompleteMultibyteCharacter:
+        snprintf(reason, sizeof(reason), "incomplete multibyte character")
+    elif ctx.err == JNTAJISError_NotConvertible:
+        return TransliterationError(f"transliteration failed at position {ctx.err_pos}")
+    else:
+        return AssertionError()
+    return JNTAJISDecoder_createUnicodeDecodeError(
+        ctx.d,
+        underlying,
+        ctx.err_pos,
+        reason,
+    )
 
-    try:
-        while p < e:
-            if d.upper > 0:
-                c0 = d.upper
-                d.upper = 0
-            else:
-                c0 = p[0]
-                p += 1
 
-            if c0 >= 0x21 and c0 <= 0x7e:
-                if p >= e:
-                    d.upper = c0
-                    break
-                c1 = p[0]
-                p += 1
-                if c1 >= 0x21 and c1 <= 0x7e:
-                    jis = d.shift_offset + (c0 - 0x21)  *94 + (c1 - 0x21)
-                    m = &tx_mappings[jis]
-                    if m.class_ == JISCharacterClass_RESERVED:
-                        snprintf(
-                            reason, sizeof(reason),
-                            "JIS character %d-%d-%d does not have a corresponding unicode codepoint",
-                            <int>(d.shift_offset // 94 // 94 + 1),
-                            c0 + 1,
-                            c1 + 1,
-                        )
-                        raise JNTAJISDecoder_createUnicodeDecodeError(
-                            d,
-                            underlying,
-                            in_sz,
-                            p - in_ - 2,
-                            reason,
-                        )
-                    else:
-                        if m.us[1] == <uint32_t>-1:
-                            if _PyUnicodeWriter_Prepare(&writer, 1, <Py_UCS4>m.us[0]):
-                                raise MemoryError()
-                            _PyUnicodeWriter_WriteChar(&writer, <Py_UCS4>m.us[0])
-                        else:
-                            if _PyUnicodeWriter_Prepare(&writer, 2, <Py_UCS4>Py_MAX(m.us[0], m.us[1])):
-                                raise MemoryError()
-                            _PyUnicodeWriter_WriteChar(&writer, <Py_UCS4>m.us[0])
-                            _PyUnicodeWriter_WriteChar(&writer, <Py_UCS4>m.us[1])
-                else:
-                    snprintf(
-                        reason, sizeof(reason),
-                        "unexpected byte \\x%02x after \\x%02x",
-                        c1, c0,
-                    )
-                    raise JNTAJISDecoder_createUnicodeDecodeError(
-                        d,
-                        underlying,
-                        in_sz,
-                        p - in_ - 2,
-                        reason,
-                    )
-            else:
-                siso = d.siso
-                if c0 == 0x0e and siso:
-                    d.shift_offset = 0
-                elif c0 == 0x0f and siso:
-                    d.shift_offset = 94 * 94
-                else:
-                    snprintf(
-                        reason, sizeof(reason),
-                        "unexpected byte \\x%02x",
-                        c0,
-                    )
-                    raise JNTAJISDecoder_createUnicodeDecodeError(
-                        d,
-                        underlying,
-                        in_sz,
-                        p - in_ - 2,
-                        reason,
-                    )
-        return _PyUnicodeWriter_Finish(&writer)
-    except:
-        _PyUnicodeWriter_Dealloc(&writer)
-        raise
+cdef object JNTAJISDecoderContext_raise(JNTAJISDecoderContext* ctx, object underlying):
+    raise JNTAJISDecoderContext_createError(ctx, underlying)
 
 
-cdef void JNTAJISDecoder_fini(JNTAJISDecoder *d):
-    Py_DECREF(<object>d.encoding)
+cdef inline bint JNTAJISDecoderContext_put1(JNTAJISDecoderContext* ctx, Py_UCS4 u) noexcept nogil:
+    if ctx.out_mode == JNTAJISDecoderOutput_BUFFER:
+        if not UCS4Buffer_reserve(&ctx.out, 1):
+            ctx.err = JNTAJISError_MemoryError
+            return False
+        ctx.out.p[ctx.out.l] = u
+    elif ctx.out_mode == JNTAJISDecoderOutput_MEASURE:
+        if u > ctx.out_max:
+            ctx.out_max = u
+    else:
+        PyUnicode_WRITE(ctx.out_kind, ctx.out_data, ctx.out.l, u)
+    ctx.out.l += 1
+    return True
 
 
-cdef object JNTAJISDecoder_init(JNTAJISDecoder *d, unicode encoding):
-    if len(encoding) == 0:
-        raise ValueError("encoding cannot be empty")
-    Py_INCREF(encoding)
-    d.encoding = <PyObject*>encoding
-    d.siso = 0
-    d.shift_offset = 0
-    d.upper = 0
+cdef bint JNTAJISDecoderContext_put_jis(JNTAJISDecoderContext* ctx, uint16_t jis) noexcept nogil:
+    # jis_dec_us holds all that is needed but for the transliterated forms,
+    # which are read from tx_mappings
+    cdef uint32_t x = jis_dec_us[jis]
+    cdef const ShrinkingTransliterationMapping* m
+    cdef size_t i
+    if not (x & JIS_DEC_FLAGS):
+        return JNTAJISDecoderContext_put1(ctx, x)
+    elif x & JIS_DEC_RESERVED:
+        ctx.err = JNTAJISError_UnmappedCharacter
+        ctx.jis = jis
+        return False
+    elif ctx.d.shrink and x & JIS_DEC_SHRINKS:
+        m = &tx_mappings[jis]
+        for i in range(m.tx_len):
+            if not JNTAJISDecoderContext_put1(ctx, m.tx_us[i]):
+                return False
+        return True
+    elif x & JIS_DEC_PAIR:
+        x &= ~(<uint32_t>JIS_DEC_FLAGS)
+        return (
+            JNTAJISDecoderContext_put1(ctx, jis_dec_pairs[x][0]) and
+            JNTAJISDecoderContext_put1(ctx, jis_dec_pairs[x][1])
+        )
+    else:
+        return JNTAJISDecoderContext_put1(ctx, x & ~(<uint32_t>JIS_DEC_FLAGS))
+
+
+cdef bint JNTAJISDecoderContext_put_ucs(JNTAJISDecoderContext* ctx, Py_UCS4 u) noexcept nogil:
+    # put a character that is not encoded as a JIS X 0213 code in the input,
+    # going through the shrink transliteration table when transliterating
+    cdef JNTAJISDecoder* d = ctx.d
+    cdef uint32_t x
+    cdef size_t i, n
+
+    if d.shrink:
+        x = lookup_shrink_tx_table(u) & ~(<uint32_t>SHRINK_TX_STARTER)
+        if x & SHRINK_TX_POOL:
+            n = (x >> 24) & 0x3f
+            for i in range(x & 0xffffff, (x & 0xffffff) + n):
+                if not JNTAJISDecoderContext_put1(ctx, shrink_tx_pool[i]):
+                    return False
+            return True
+        elif x != SHRINK_TX_NONE:
+            return JNTAJISDecoderContext_put1(ctx, x)
+        elif not d.passthrough:
+            if d.replacement_len == 0:
+                ctx.err = JNTAJISError_NotConvertible
+                return False
+            for i in range(d.replacement_len):
+                if not JNTAJISDecoderContext_put1(ctx, d.replacement[i]):
+                    return False
+            return True
+    return JNTAJISDecoderContext_put1(ctx, u)
 
 
-def jnta_decode(unicode encoding, bytes in_):
-    """
-    Decode a given JIS character sequence into a Unicode string.
-    """
+cdef bint JNTAJISDecoderContext_decode_jis(JNTAJISDecoderContext* ctx) noexcept nogil:
+    cdef JNTAJISDecoder* d = ctx.d
+    cdef const unsigned char* in_ = ctx.in_
+    cdef const unsigned char* p = in_
+    cdef const unsigned char* e = in_ + ctx.in_sz
+    cdef const unsigned char* s
+    cdef unsigned int c0, c1
 
-    cdef JNTAJISDecoder d
-    JNTAJISDecoder_init(&d, encoding)
-    try:
-        retval = JNTAJISDecoder_decode(&d, in_, <char *>in_, len(in_))
+    while p < e:
+        # a character carried over from the previous chunk is reported at 0
+        s = p
         if d.upper > 0:
-            raise JNTAJISDecoder_createUnicodeDecodeError(
-                &d, in_, len(in_), len(in_) - 1,
-                "incomplete multibyte character",
-            )
-        return retval
-    finally:
-        JNTAJISDecoder_fini(&d)
-
+            c0 = d.upper
+            d.upper = 0
+        else:
+            c0 = p[0]
+            p += 1
 
-class TransliterationError(Exception):
-    pass
+        if c0 >= 0x21 and c0 <= 0x7e:
+            if p >= e:
+                d.upper = c0
+                break
+            c1 = p[0]
+            p += 1
+            if c1 >= 0x21 and c1 <= 0x7e:
+                if not JNTAJISDecoderContext_put_jis(
+                    ctx, d.shift_offset + (c0 - 0x21) * 94 + (c1 - 0x21),
+                ):
+                    ctx.err_pos = s - in_
+                    return False
+            else:
+                ctx.err = JNTAJISError_UnexpectedTrailingByte
+                ctx.c0 = c0
+                ctx.c1 = c1
+                ctx.err_pos = s - in_
+                return False
+        else:
+            if c0 == 0x0e and d.siso:
+                d.shift_offset = 0
+            elif c0 == 0x0f and d.siso:
+                d.shift_offset = 94 * 94
+            else:
+                ctx.err = JNTAJISError_UnexpectedByte
+                ctx.c0 = c0
+                ctx.err_pos = s - in_
+                return False
+    return True
 
 
-ctypedef struct JNTAJISShrinkingTransliteratorContext:
-    _PyUnicodeWriter writer 
-    PyObject *replacement
-    bint passthrough
-    PyObject *in_
-    int uk
-    void* ud
-    Py_ssize_t ul
-    Py_ssize_t pos
-    int state
-    uint32_t[32] la
-    size_t lal
-    bint finished
+cdef unsigned char[10] sjis_2004_plane_2_rows = [0, 7, 2, 3, 4, 11, 12, 13, 14, 77]
 
 
-cdef object JNTAJISShrinkingTransliteratorContext_put_replacement(
-    JNTAJISShrinkingTransliteratorContext* t,
-    Py_UCS4 u,
-):
-    if t.passthrough:
-        if _PyUnicodeWriter_Prepare(&t.writer, 1, u):
-            raise MemoryError()
-        _PyUnicodeWriter_WriteChar(&t.writer, u)
-    else:
-        if len(<object>t.replacement) == 0:
-            raise TransliterationError(f"transliteration failed at position {t.pos}")
-        _PyUnicodeWriter_WriteStr(&t.writer, <object>t.replacement)
+cdef bint JNTAJISDecoderContext_decode_sjis(JNTAJISDecoderContext* ctx) noexcept nogil:
+    # Shift_JIS-2004 and CP932 share the layout of the JIS X 0208 rows;
+    # the lead bytes 0xF0-0xFC carry the plane 2 of JIS X 0213 in the former
+    # and the user-defined area and IBM extensions in the latter.  The codes
+    # of CP932 are limited to those it defines, although they are decoded
+    # through the JIS X 0213 mappings
+    cdef JNTAJISDecoder* d = ctx.d
+    cdef bint cp932 = d.input_encoding == JISInputEncoding_CP932
+    cdef const unsigned char* in_ = ctx.in_
+    cdef const unsigned char* p = in_
+    cdef const unsigned char* e = in_ + ctx.in_sz
+    cdef const unsigned char* s
+    cdef unsigned int c0, c1, t, ku, jis
+    cdef Py_UCS4 u
+    cdef bint ok
 
+    while p < e:
+        s = p
+        if d.upper > 0:
+            c0 = d.upper
+            d.upper = 0
+        else:
+            c0 = p[0]
+            p += 1
+
+        if c0 < 0x80:
+            if not cp932 and c0 == 0x5c:
+                u = 0xa5  # YEN SIGN
+            elif not cp932 and c0 == 0x7e:
+                u = 0x203e  # OVERLINE
+            else:
+                u = c0
+            ok = JNTAJISDecoderContext_put_ucs(ctx, u)
+        elif c0 >= 0xa1 and c0 <= 0xdf:
+            ok = JNTAJISDecoderContext_put_ucs(ctx, 0xff61 + (c0 - 0xa1))
+        elif (c0 >= 0x81 and c0 <= 0x9f) or (c0 >= 0xe0 and c0 <= 0xfc):
+            if p >= e:
+                d.upper = c0
+                break
+            c1 = p[0]
+            p += 1
+            if c1 < 0x40 or c1 == 0x7f or c1 > 0xfc:
+                ctx.err = JNTAJISError_UnexpectedTrailingByte
+                ctx.c0 = c0
+                ctx.c1 = c1
+                ctx.err_pos = s - in_
+                return False
+            # t is 0-93 for the odd row and 94-187 for the even row
+            t = c1 - 0x40 - (1 if c1 >= 0x80 else 0)
+            if cp932 and (c0 == 0xed or c0 == 0xee or c0 >= 0xfa):
+                u = cp932_ibm_ext_ucs[c0 - 0xed if c0 <= 0xee else c0 - 0xf8][t]
+                if u == 0:
+                    ctx.err = JNTAJISError_UnexpectedTrailingByte
+                    ctx.c0 = c0
+                    ctx.c1 = c1
+                    ctx.err_pos = s - in_
+                    return False
+                ok = JNTAJISDecoderContext_put_ucs(ctx, u)
+            elif cp932 and c0 >= 0xf0:
+                ok = JNTAJISDecoderContext_put_ucs(ctx, 0xe000 + (c0 - 0xf0) * 188 + t)
+            elif c0 <= 0xef:
+                jis = (c0 - (0x81 if c0 <= 0x9f else 0xc1)) * 188 + t
+                if cp932 and not (cp932_jis_valid[jis >> 5] >> (jis & 31)) & 1:
+                    ctx.err = JNTAJISError_UnexpectedTrailingByte
+                    ctx.c0 = c0
+                    ctx.c1 = c1
+                    ctx.err_pos = s - in_
+                    return False
+                ok = JNTAJISDecoderContext_put_jis(ctx, jis)
+            elif c0 >= 0xf5:
+                # rows 79-94 of the plane 2
+                ok = JNTAJISDecoderContext_put_jis(ctx, 94 * 94 + (78 + (c0 - 0xf5) * 2) * 94 + t)
+            else:
+                # rows 1, 8, 3, 4, 5, 12, 13, 14, 15 and 78 of the plane 2
+                ku = sjis_2004_plane_2_rows[(c0 - 0xf0) * 2 + (1 if t >= 94 else 0)]
+                ok = JNTAJISDecoderContext_put_jis(ctx, 94 * 94 + ku * 94 + t % 94)
+        else:
+            ctx.err = JNTAJISError_UnexpectedByte
+            ctx.c0 = c0
+            ctx.err_pos = s - in_
+            return False
+        if not ok:
+            ctx.err_pos = s - in_
+            return False
+    return True
+
+
+cdef bint JNTAJISDecoderContext_decode_euc(JNTAJISDecoderContext* ctx) noexcept nogil:
+    cdef JNTAJISDecoder* d = ctx.d
+    cdef const unsigned char* in_ = ctx.in_
+    cdef const unsigned char* p = in_
+    cdef const unsigned char* e = in_ + ctx.in_sz
+    cdef const unsigned char* s
+    cdef unsigned int c0, c1, c2
+    cdef bint ok
+
+    while p < e:
+        s = p
+        if d.upper > 0:
+            c0 = d.upper
+            d.upper = 0
+        else:
+            c0 = p[0]
+            p += 1
+
+        if c0 < 0x80:
+            ok = JNTAJISDecoderContext_put_ucs(ctx, c0)
+        elif c0 == 0x8e or c0 == 0x8f or (c0 >= 0xa1 and c0 <= 0xfe):
+            if d.upper2 > 0:
+                c1 = d.upper2
+                d.upper2 = 0
+            else:
+                if p >= e:
+                    d.upper = c0
+                    break
+                c1 = p[0]
+                p += 1
+            if c0 == 0x8e:
+                if c1 < 0xa1 or c1 > 0xdf:
+                    ctx.err = JNTAJISError_UnexpectedTrailingByte
+                    ctx.c0 = c0
+                    ctx.c1 = c1
+                    ctx.err_pos = s - in_
+                    return False
+                ok = JNTAJISDecoderContext_put_ucs(ctx, 0xff61 + (c1 - 0xa1))
+            elif c1 < 0xa1 or c1 > 0xfe:
+                ctx.err = JNTAJISError_UnexpectedTrailingByte
+                ctx.c0 = c0
+                ctx.c1 = c1
+                ctx.err_pos = s - in_
+                return False
+            elif c0 == 0x8f:
+                if p >= e:
+                    d.upper = c0
+                    d.upper2 = c1
+                    break
+                c2 = p[0]
+                p += 1
+                if c2 < 0xa1 or c2 > 0xfe:
+                    ctx.err = JNTAJISError_UnexpectedTrailingByte
+                    ctx.c0 = c1
+                    ctx.c1 = c2
+                    ctx.err_pos = s - in_
+                    return False
+                ok = JNTAJISDecoderContext_put_jis(ctx, 94 * 94 + (c1 - 0xa1) * 94 + (c2 - 0xa1))
+            else:
+                ok = JNTAJISDecoderContext_put_jis(ctx, (c0 - 0xa1) * 94 + (c1 - 0xa1))
+        else:
+            ctx.err = JNTAJISError_UnexpectedByte
+            ctx.c0 = c0
+            ctx.err_pos = s - in_
+            return False
+        if not ok:
+            ctx.err_pos = s - in_
+            return False
+    return True
+
+
+cdef bint JNTAJISDecoderContext_decode(JNTAJISDecoderContext* ctx) noexcept nogil:
+    # Decode the whole input into ctx.out without touching any Python object.
+    # On failure, ctx.err, ctx.err_pos and the offending bytes are recorded
+    # so that the exception can be built after the GIL is reacquired.
+    cdef JISInputEncoding input_encoding = ctx.d.input_encoding
+    if input_encoding == JISInputEncoding_JIS:
+        return JNTAJISDecoderContext_decode_jis(ctx)
+    elif input_encoding == JISInputEncoding_EUC_JIS_2004:
+        return JNTAJISDecoderContext_decode_euc(ctx)
+    else:
+        return JNTAJISDecoderContext_decode_sjis(ctx)
+
+
+cdef object JNTAJISDecoder_decode(
+    JNTAJISDecoder *d,
+    object underlying,
+    void* in_bytes,
+    Py_ssize_t in_sz
+):
+    cdef JNTAJISDecoderContext ctx
+    cdef bint ok
+
+    if in_sz >= d.two_pass_threshold:
+        return JNTAJISDecoder_decode_two_pass(d, underlying, in_bytes, in_sz)
+
+    ctx.d = d
+    ctx.in_ = <const unsigned char*>in_bytes
+    ctx.in_sz = in_sz
+    ctx.err = JNTAJISError_Success
+    ctx.out_mode = JNTAJISDecoderOutput_BUFFER
+    if not UCS4Buffer_init(&ctx.out, in_sz // 2):
+        raise MemoryError()
+    try:
+        if in_sz >= JNTAJIS_NOGIL_THRESHOLD:
+            with nogil:
+                ok = JNTAJISDecoderContext_decode(&ctx)
+        else:
+            ok = JNTAJISDecoderContext_decode(&ctx)
+        if not ok:
+            JNTAJISDecoderContext_raise(&ctx, underlying)
+        return UCS4Buffer_to_unicode(&ctx.out)
+    finally:
+        UCS4Buffer_fini(&ctx.out)
+
+
+cdef object JNTAJISDecoder_decode_two_pass(
+    JNTAJISDecoder *d,
+    object underlying,
+    void* in_bytes,
+    Py_ssize_t in_sz
+):
+    # Decode the input twice: first only to find the length and the maximum
+    # character of the result, then straight into a string allocated once at
+    # the right kind.  The decoder state is restored in between so that both
+    # passes see the same.  This is slower than going through a UCS4Buffer,
+    # but needs no memory besides the result.
+    cdef JNTAJISDecoderContext ctx
+    cdef JNTAJISDecoder saved = d[0]
+    cdef bint ok
+    cdef unicode retval
+
+    ctx.d = d
+    ctx.in_ = <const unsigned char*>in_bytes
+    ctx.in_sz = in_sz
+    ctx.err = JNTAJISError_Success
+    ctx.out_mode = JNTAJISDecoderOutput_MEASURE
+    ctx.out.p = NULL
+    ctx.out.l = 0
+    ctx.out_max = 0
+    with nogil:
+        ok = JNTAJISDecoderContext_decode(&ctx)
+    if not ok:
+        JNTAJISDecoderContext_raise(&ctx, underlying)
+
+    retval = PyUnicode_New(ctx.out.l, ctx.out_max)
+    d[0] = saved
+    ctx.out_mode = JNTAJISDecoderOutput_DIRECT
+    ctx.out_kind = PyUnicode_KIND(retval)
+    ctx.out_data = PyUnicode_DATA(retval)
+    ctx.out.l = 0
+    with nogil:
+        ok = JNTAJISDecoderContext_decode(&ctx)
+    if not ok:
+        JNTAJISDecoderContext_raise(&ctx, underlying)
+    return retval
+
+
+cdef object JNTAJISDecoder_decode_buffer(
+    JNTAJISDecoder *d,
+    object in_,
+    bint final,
+):
+    # decode in place from any object exporting a contiguous buffer
+    cdef Py_buffer view
+    cdef Py_ssize_t pos
+
+    PyObject_GetBuffer(in_, &view, PyBUF_SIMPLE)
+    try:
+        retval = JNTAJISDecoder_decode(d, in_, view.buf, view.len)
+        if final and d.upper > 0:
+            pos = view.len - (2 if d.upper2 > 0 else 1)
+            if pos < 0:
+                pos = 0
+            raise JNTAJISDecoder_createUnicodeDecodeError(
+                d, in_, pos,
+                "incomplete multibyte character",
+            )
+        return retval
+    finally:
+        PyBuffer_Release(&view)
+
+
+cdef void JNTAJISDecoder_fini(JNTAJISDecoder *d):
+    PyMem_Free(d.replacement)
+    d.replacement = NULL
+    Py_XDECREF(d.encoding)
+    d.encoding = NULL
+
+
+cdef object JNTAJISDecoder_init(JNTAJISDecoder *d, unicode encoding, int input_encoding=0):
+    # everything is checked before d is touched, so that a failure leaves
+    # nothing for JNTAJISDecoder_fini() to release
+    if len(encoding) == 0:
+        raise ValueError("encoding cannot be empty")
+    if input_encoding < 0 or input_encoding >= JISInputEncoding_MAX:
+        raise ValueError(f"unknown input encoding: {input_encoding}")
+    Py_INCREF(encoding)
+    d.encoding = <PyObject*>encoding
+    d.input_encoding = <JISInputEncoding>input_encoding
+    d.siso = 0
+    d.shift_offset = 0
+    d.upper = 0
+    d.upper2 = 0
+    d.two_pass_threshold = JNTAJIS_DECODE_TWO_PASS_THRESHOLD
+    d.shrink = 0
+    d.replacement = NULL
+    d.replacement_len = 0
+    d.passthrough = 0
+
+
+cdef object JNTAJISDecoder_init_shrink(JNTAJISDecoder *d, unicode replacement, bint passthrough):
+    d.replacement_len = PyUnicode_GET_LENGTH(replacement)
+    d.replacement = PyUnicode_AsUCS4Copy(replacement)
+    d.passthrough = passthrough
+    d.shrink = 1
+
+
+def jnta_decode(unicode encoding, in_, int input_encoding=0):
+    """
+    Decode a given JIS character sequence into a Unicode string.
+    """
+
+    cdef JNTAJISDecoder d
+    JNTAJISDecoder_init(&d, encoding, input_encoding)
+    try:
+        return JNTAJISDecoder_decode_buffer(&d, in_, True)
+    finally:
+        JNTAJISDecoder_fini(&d)
+
+
+def jnta_decode_shrink_translit(
+    unicode encoding,
+    in_,
+    int input_encoding=0,
+    unicode replacement=u"\ufffd",
+    bint passthrough=False,
+):
+    """
+    Decode a given JIS character sequence and transliterate the result
+    according to the NTA shrink mappings in a single pass.
+    """
+
+    cdef JNTAJISDecoder d
+    JNTAJISDecoder_init(&d, encoding, input_encoding)
+    try:
+        JNTAJISDecoder_init_shrink(&d, replacement, passthrough)
+        return JNTAJISDecoder_decode_buffer(&d, in_, True)
+    finally:
+        JNTAJISDecoder_fini(&d)
+
+
+def _decode_two_pass(
+    unicode encoding,
+    in_,
+    int input_encoding=0,
+    unicode replacement=None,
+    bint passthrough=False,
+):
+    """
+    Like jnta_decode(), or jnta_decode_shrink_translit() if replacement is
+    given, but always decoding in two passes whatever the size of the
+    input.  Used by the benchmarks and tests.
+    """
+
+    cdef JNTAJISDecoder d
+    JNTAJISDecoder_init(&d, encoding, input_encoding)
+    try:
+        if replacement is not None:
+            JNTAJISDecoder_init_shrink(&d, replacement, passthrough)
+        d.two_pass_threshold = 0
+        return JNTAJISDecoder_decode_buffer(&d, in_, True)
+    finally:
+        JNTAJISDecoder_fini(&d)
+
+
+cdef class IncrementalDecoder:
+    """
+    An IncrementalDecoder implementation.
+
+    For the description of each method, please see the Python's
+    codec documentation: https://docs.python.org/3/library/codecs.html#codecs.IncrementalDecoder
+    """
+    cdef JNTAJISDecoder _impl
+
+    def decode(self, in_, final=False):
+        return JNTAJISDecoder_decode_buffer(&self._impl, in_, final)
+
+    def reset(self):
+        self._impl.shift_offset = 0
+        self._impl.upper = 0
+        self._impl.upper2 = 0
+
+    def getstate(self):
+        cdef bytes pending = b""
+        if self._impl.upper > 0:
+            pending = bytes([self._impl.upper])
+            if self._impl.upper2 > 0:
+                pending += bytes([self._impl.upper2])
+        return (pending, self._impl.shift_offset // (94 * 94))
+
+    def setstate(self, state):
+        buf, flag = state
+        self._impl.upper = buf[0] if len(buf) > 0 else 0
+        self._impl.upper2 = buf[1] if len(buf) > 1 else 0
+        self._impl.shift_offset = (flag % 2) * 94 * 94
+
+    def __del__(self):
+        JNTAJISDecoder_fini(&self._impl)
+
+    def __init__(
+        self,
+        unicode encoding,
+        bint siso=False,
+        int input_encoding=0,
+        bint shrink_translit=False,
+        unicode replacement=u"\ufffd",
+        bint passthrough=False,
+    ):
+        JNTAJISDecoder_init(&self._impl, encoding, input_encoding)
+        self._impl.siso = siso
+        if shrink_translit:
+            JNTAJISDecoder_init_shrink(&self._impl, replacement, passthrough)
+
+
+class TransliterationError(Exception):
+    pass
 
-cdef object JNTAJISIncrementalEncoderContext_put(
+
+ctypedef struct JNTAJISShrinkingTransliteratorContext:
+    UCS4Buffer out
+    Py_UCS4* replacement
+    Py_ssize_t replacement_len
+    bint passthrough
+    PyObject *in_
+    int uk
+    void* ud
+    Py_ssize_t ul
+    Py_ssize_t pos
+    bint final  # whether the input ends here, or may continue in another chunk
+    int state
+    uint32_t[32] la
+    size_t lal
+    JNTAJISError err
+
+
+cdef bint JNTAJISShrinkingTransliteratorContext_put_replacement(
+    JNTAJISShrinkingTransliteratorContext* t,
+    Py_UCS4 u,
+) noexcept nogil:
+    if t.passthrough:
+        if not UCS4Buffer_reserve(&t.out, 1):
+            t.err = JNTAJISError_MemoryError
+            return False
+        t.out.p[t.out.l] = u
+        t.out.l += 1
+    else:
+        if t.replacement_len == 0:
+            t.err = JNTAJISError_NotConvertible
+            return False
+        if not UCS4Buffer_reserve(&t.out, t.replacement_len):
+            t.err = JNTAJISError_MemoryError
+            return False
+        memcpy(&t.out.p[t.out.l], t.replacement, t.replacement_len * sizeof(Py_UCS4))
+        t.out.l += t.replacement_len
+    return True
+
+
+cdef bint JNTAJISShrinkingTransliteratorContext_put(
     JNTAJISShrinkingTransliteratorContext* t,
     uint16_t jis
-):
+) noexcept nogil:
     cdef const ShrinkingTransliterationMapping* m = &tx_mappings[jis]
-    cdef size_t i
-    cdef Py_UCS4 u = 0
 
     if m.class_ == JISCharacterClass_RESERVED:
         return False
     else:
-        if (
-            (
-                m.class_ == JISCharacterClass_JISX0213_NON_KANJI or
-                m.class_ == JISCharacterClass_KANJI_LEVEL_3 or
-                m.class_ == JISCharacterClass_KANJI_LEVEL_4
-            )
-            and m.tx_len > 0
-        ):
-            for i in range(m.tx_len):
-                u = Py_MAX(u, m.tx_us[i])
-            if _PyUnicodeWriter_Prepare(&t.writer, m.tx_len, u):
-                raise MemoryError()
-            for i in range(m.tx_len):
-                _PyUnicodeWriter_WriteChar(&t.writer, <Py_UCS4>m.tx_us[i])
-        else:
-            if m.us[1] == <uint32_t>-1:
-                if _PyUnicodeWriter_Prepare(&t.writer, 1, <Py_UCS4>m.us[0]):
-                    raise MemoryError()
-                _PyUnicodeWriter_WriteChar(&t.writer, <Py_UCS4>m.us[0])
-            else:
-                if _PyUnicodeWriter_Prepare(&t.writer, 2, <Py_UCS4>Py_MAX(m.us[0], m.us[1])):
-                    raise MemoryError()
-                _PyUnicodeWriter_WriteChar(&t.writer, <Py_UCS4>m.us[0])
-                _PyUnicodeWriter_WriteChar(&t.writer, <Py_UCS4>m.us[1])
+        if not UCS4Buffer_append_jis(&t.out, m, True):
+            t.err = JNTAJISError_MemoryError
+            return False
         return True
 
 
-cdef object JNTAJISShrinkingTransliteratorContext_do(
+cdef inline uint32_t lookup_shrink_tx_table(uint32_t u) noexcept nogil:
+    # the entry of shrink_tx_pages for u, which shares the page index with
+    # rev_jis_pages
+    if u >= REV_JIS_PAGE_INDEX_LEN << REV_JIS_PAGE_SHIFT:
+        return SHRINK_TX_NONE
+    return shrink_tx_pages[rev_jis_page_index[u >> REV_JIS_PAGE_SHIFT]][u & (REV_JIS_PAGE_SIZE - 1)]
+
+
+cdef inline bint JNTAJISShrinkingTransliteratorContext_put_shrink_tx(
     JNTAJISShrinkingTransliteratorContext* t,
-):
+    uint32_t u,
+    uint32_t x,
+) noexcept nogil:
+    # put the result for a character outside a combining sequence, given its
+    # entry in shrink_tx_pages
+    cdef size_t n
+    x &= ~(<uint32_t>SHRINK_TX_STARTER)
+    if x == SHRINK_TX_NONE:
+        return JNTAJISShrinkingTransliteratorContext_put_replacement(t, u)
+    if x & SHRINK_TX_POOL:
+        n = (x >> 24) & 0x3f
+        if not UCS4Buffer_reserve(&t.out, n):
+            t.err = JNTAJISError_MemoryError
+            return False
+        memcpy(&t.out.p[t.out.l], &shrink_tx_pool[x & 0xffffff], n * sizeof(Py_UCS4))
+        t.out.l += n
+    else:
+        if not UCS4Buffer_reserve(&t.out, 1):
+            t.err = JNTAJISError_MemoryError
+            return False
+        t.out.p[t.out.l] = x
+        t.out.l += 1
+    return True
+
+
+cdef bint JNTAJISShrinkingTransliteratorContext_flush_lookahead(
+    JNTAJISShrinkingTransliteratorContext* t,
+) noexcept nogil:
+    cdef size_t i
+    for i in range(t.lal):
+        if not JNTAJISShrinkingTransliteratorContext_put_shrink_tx(
+            t, t.la[i], lookup_shrink_tx_table(t.la[i])
+        ):
+            return False
+    t.lal = 0
+    return True
+
+
+cdef inline bint JNTAJISShrinkingTransliteratorContext_do_kind(
+    JNTAJISShrinkingTransliteratorContext* t,
+    const ucs_t* ud,
+) noexcept nogil:
     cdef Py_UCS4 u
+    cdef uint32_t x
     cdef uint16_t jis
-    cdef size_t i
-    cdef const ShrinkingTransliterationMapping* m
 
-    for t.pos in range(t.ul):
-        u = PyUnicode_READ(t.uk, t.ud, t.pos)
+    while t.pos < t.ul:
+        u = ud[t.pos]
+        if t.state == 0:
+            # a character that does not begin a combining sequence, or whose
+            # successor cannot complete one, is looked up in the fused table
+            x = lookup_shrink_tx_table(u)
+            if (
+                not (x & SHRINK_TX_STARTER) or
+                (t.pos + 1 < t.ul and not sm_uni_to_jis_is_second(ud[t.pos + 1]))
+            ):
+                if not JNTAJISShrinkingTransliteratorContext_put_shrink_tx(t, u, x):
+                    return False
+                t.pos += 1
+                continue
         jis = sm_uni_to_jis_mapping(&t.state, u)
         if t.state == -1:
-            if not JNTAJISIncrementalEncoderContext_put(t, jis):
-                JNTAJISShrinkingTransliteratorContext_put_replacement(t, u)
+            if t.lal > 1:
+                # the characters before the one that began the sequence
+                t.lal -= 1
+                if not JNTAJISShrinkingTransliteratorContext_flush_lookahead(t):
+                    return False
+            if not JNTAJISShrinkingTransliteratorContext_put(t, jis):
+                if t.err != JNTAJISError_Success:
+                    return False
+                if not JNTAJISShrinkingTransliteratorContext_put_replacement(t, u):
+                    return False
+            t.lal = 0
             t.state = 0
         else:
+            if t.state > 0 and t.lal > 0:
+                # u begins a new sequence in place of the pending one
+                if not JNTAJISShrinkingTransliteratorContext_flush_lookahead(t):
+                    return False
+            if t.lal >= sizeof(t.la) // sizeof(t.la[0]):
+                t.err = JNTAJISError_LookaheadOverflow
+                return False
             t.la[t.lal] = u
             t.lal += 1
             if t.state == 0:
-                for i in range(t.lal):
-                    if not lookup_rev_table(&jis, t.la[i]):
-                        JNTAJISShrinkingTransliteratorContext_put_replacement(t, u)
-                        continue
-                    else:
-                        if not JNTAJISIncrementalEncoderContext_put(t, jis):
-                            JNTAJISShrinkingTransliteratorContext_put_replacement(t, u)
-                t.lal = 0
+                if not JNTAJISShrinkingTransliteratorContext_flush_lookahead(t):
+                    return False
+        t.pos += 1
 
+    if t.final:
+        return JNTAJISShrinkingTransliteratorContext_flush_lookahead(t)
     return True
 
+
+cdef bint JNTAJISShrinkingTransliteratorContext_do(
+    JNTAJISShrinkingTransliteratorContext* t,
+) noexcept nogil:
+    # Transliterate the whole input into t.out without touching any Python
+    # object.  On failure, t.err is set and t.pos points to the character
+    # being processed.
+    if t.uk == PyUnicode_1BYTE_KIND:
+        return JNTAJISShrinkingTransliteratorContext_do_kind(t, <const Py_UCS1*>t.ud)
+    elif t.uk == PyUnicode_2BYTE_KIND:
+        return JNTAJISShrinkingTransliteratorContext_do_kind(t, <const Py_UCS2*>t.ud)
+    else:
+        return JNTAJISShrinkingTransliteratorContext_do_kind(t, <const Py_UCS4*>t.ud)
+
+
+cdef inline bint shrink_translit_keeps(uint32_t u, bint passthrough, Py_UCS4 repl) noexcept nogil:
+    # whether a character not in a combining sequence is transliterated to
+    # itself; repl is the replacement if it is a single character
+    cdef uint32_t x = lookup_shrink_tx_table(u) & ~(<uint32_t>SHRINK_TX_STARTER)
+    if x == SHRINK_TX_NONE:
+        return passthrough or <uint32_t>repl == u
+    return x == u
+
+
+def _shrink_tx_table_mismatches():
+    """
+    Compare the fused shrink transliteration table against the result of
+    looking each codepoint up in the reverse table and tx_mappings, and
+    return the codepoints whose entries disagree.  Used by the tests.
+    """
+
+    cdef uint32_t u, x
+    cdef uint16_t jis
+    cdef int state
+    cdef bint starter
+    cdef const ShrinkingTransliterationMapping* m
+    cdef UCS4Buffer b
+    cdef Py_UCS4* p
+    cdef size_t n
+    mismatches = []
+
+    if not UCS4Buffer_init(&b, 8):
+        raise MemoryError()
+    try:
+        for u in range(REV_JIS_PAGE_INDEX_LEN << REV_JIS_PAGE_SHIFT):
+            x = lookup_shrink_tx_table(u)
+            state = 0
+            sm_uni_to_jis_mapping(&state, u)
+            starter = state > 0
+            if starter != ((x & SHRINK_TX_STARTER) != 0):
+                mismatches.append(u)
+                continue
+            x &= ~(<uint32_t>SHRINK_TX_STARTER)
+            b.l = 0
+            if lookup_rev_table(&jis, u):
+                m = &tx_mappings[jis]
+                if m.class_ != JISCharacterClass_RESERVED:
+                    if not UCS4Buffer_append_jis(&b, m, True):
+                        raise MemoryError()
+            if x == SHRINK_TX_NONE:
+                n = 0
+            elif x & SHRINK_TX_POOL:
+                n = (x >> 24) & 0x3f
+                p = <Py_UCS4*>&shrink_tx_pool[x & 0xffffff]
+            else:
+                n = 1
+                p = <Py_UCS4*>&x
+            if <size_t>b.l != n or memcmp(b.p, p, n * sizeof(Py_UCS4)) != 0:
+                mismatches.append(u)
+    finally:
+        UCS4Buffer_fini(&b)
+    return mismatches
+
+
+cdef inline Py_ssize_t shrink_translit_unchanged_prefix_kind(
+    const ucs_t* ud,
+    Py_ssize_t ul,
+    bint passthrough,
+    Py_UCS4 repl,
+) noexcept nogil:
+    cdef int state = 0
+    cdef uint32_t la0 = 0
+    cdef size_t lal = 0
+    cdef Py_ssize_t pos = 0
+    cdef uint32_t u
+    cdef uint16_t jis
+    cdef const ShrinkingTransliterationMapping* m
+
+    while pos < ul:
+        u = ud[pos]
+        if lal == 0 and not sm_uni_to_jis_is_first(u):
+            # neither completes nor begins a sequence
+            if not shrink_translit_keeps(u, passthrough, repl):
+                return pos
+            pos += 1
+            continue
+        jis = sm_uni_to_jis_mapping(&state, u)
+        if state == -1:
+            m = &tx_mappings[jis]
+            if not (
+                lal == 1 and
+                m.class_ != JISCharacterClass_RESERVED and
+                not ShrinkingTransliterationMapping_shrinks(m) and
+                m.us[0] == la0 and m.us[1] == u
+            ):
+                return pos - <Py_ssize_t>lal
+            lal = 0
+            state = 0
+        elif state == 0:
+            # u did not complete the sequence begun with la0
+            if lal > 0 and not shrink_translit_keeps(la0, passthrough, repl):
+                return pos - <Py_ssize_t>lal
+            lal = 0
+            if not shrink_translit_keeps(u, passthrough, repl):
+                return pos
+        else:
+            # u began another sequence in place of the one begun with la0
+            if lal > 0 and not shrink_translit_keeps(la0, passthrough, repl):
+                return pos - <Py_ssize_t>lal
+            la0 = u
+            lal = 1
+        pos += 1
+    if lal > 0 and not shrink_translit_keeps(la0, passthrough, repl):
+        return ul - <Py_ssize_t>lal
+    return ul
+
+
+cdef Py_ssize_t shrink_translit_unchanged_prefix(
+    int uk,
+    const void* ud,
+    Py_ssize_t ul,
+    bint passthrough,
+    Py_UCS4 repl,
+) noexcept nogil:
+    # Return the length of the longest prefix of the input that the shrink
+    # transliteration leaves as is, ending at a boundary where the
+    # transliteration can be started afresh; ul means nothing would change.
+    if uk == PyUnicode_1BYTE_KIND:
+        return shrink_translit_unchanged_prefix_kind(<const Py_UCS1*>ud, ul, passthrough, repl)
+    elif uk == PyUnicode_2BYTE_KIND:
+        return shrink_translit_unchanged_prefix_kind(<const Py_UCS2*>ud, ul, passthrough, repl)
+    else:
+        return shrink_translit_unchanged_prefix_kind(<const Py_UCS4*>ud, ul, passthrough, repl)
+
+
+cdef object JNTAJISShrinkingTransliteratorContext_createError(
+    JNTAJISShrinkingTransliteratorContext* t,
+):
+    if t.err == JNTAJISError_MemoryError:
+        return MemoryError()
+    elif t.err == JNTAJISError_NotConvertible:
+        return TransliterationError(f"transliteration failed at position {t.pos}")
+    elif t.err == JNTAJISError_LookaheadOverflow:
+        return TransliterationError(f"lookahead buffer overflow at position {t.pos}")
+    else:
+        return AssertionError()
+
+
+cdef object JNTAJISShrinkingTransliteratorContext_raise(
+    JNTAJISShrinkingTransliteratorContext* t,
+):
+    raise JNTAJISShrinkingTransliteratorContext_createError(t)
+
+
 cdef unicode JNTAJISShrinkingTransliteratorContext_get_result(
     JNTAJISShrinkingTransliteratorContext* t,
 ):
-    t.finished = 1
-    return _PyUnicodeWriter_Finish(&t.writer)
+    return UCS4Buffer_to_unicode(&t.out)
 
 
 cdef void JNTAJISShrinkingTransliteratorContext_fini(
     JNTAJISShrinkingTransliteratorContext* t,
 ):
-    if not t.finished:
-        _PyUnicodeWriter_Dealloc(&t.writer)
+    UCS4Buffer_fini(&t.out)
+    PyMem_Free(t.replacement)
     Py_DECREF(<object>t.in_)
-    Py_DECREF(<object>t.replacement)
 
 
-cdef JNTAJISShrinkingTransliteratorContext_init(
-    JNTAJISShrinkingTransliteratorContext* t,
-    unicode in_,
-    unicode replacement,
-    bint passthrough,
-):
-    Py_INCREF(in_)
-    t.in_ = <PyObject*>in_
-    Py_INCREF(replacement)
-    t.replacement = <PyObject*>replacement
-    t.uk = PyUnicode_KIND(in_)
-    t.ud = PyUnicode_DATA(in_)
-    t.ul = PyUnicode_GET_LENGTH(in_)
-    _PyUnicodeWriter_Init(&t.writer)
-    t.writer.min_length = len(in_)
-    t.writer.overallocate = 1
-    t.state = 0
-    t.lal = 0
-    t.finished = 0
-    t.passthrough = passthrough
+cdef JNTAJISShrinkingTransliteratorContext_init(
+    JNTAJISShrinkingTransliteratorContext* t,
+    unicode in_,
+    unicode replacement,
+    bint passthrough,
+):
+    t.replacement_len = PyUnicode_GET_LENGTH(replacement)
+    t.replacement = PyUnicode_AsUCS4Copy(replacement)
+    if t.replacement == NULL:
+        raise MemoryError()
+    if not UCS4Buffer_init(&t.out, PyUnicode_GET_LENGTH(in_)):
+        PyMem_Free(t.replacement)
+        raise MemoryError()
+    Py_INCREF(in_)
+    t.in_ = <PyObject*>in_
+    t.uk = PyUnicode_KIND(in_)
+    t.ud = PyUnicode_DATA(in_)
+    t.ul = PyUnicode_GET_LENGTH(in_)
+    t.pos = 0
+    t.final = True
+    t.state = 0
+    t.lal = 0
+    t.err = JNTAJISError_Success
+    t.passthrough = passthrough
+
+
+def jnta_shrink_translit(unicode in_, unicode replacement=u"\ufffd", bint passthrough=False):
+    """
+    Transliterate a Unicode string according to the NTA shrink mappings.
+    The input is returned as is if no character would change.
+    """
+
+    cdef JNTAJISShrinkingTransliteratorContext ctx
+    cdef int uk = PyUnicode_KIND(in_)
+    cdef const void* ud = PyUnicode_DATA(in_)
+    cdef Py_ssize_t ul = PyUnicode_GET_LENGTH(in_)
+    cdef Py_UCS4 repl = replacement[0] if len(replacement) == 1 else <Py_UCS4>-1
+    cdef Py_ssize_t n
+    cdef bint ok
+
+    # look for the first change before allocating anything
+    if ul >= JNTAJIS_NOGIL_THRESHOLD:
+        with nogil:
+            n = shrink_translit_unchanged_prefix(uk, ud, ul, passthrough, repl)
+    else:
+        n = shrink_translit_unchanged_prefix(uk, ud, ul, passthrough, repl)
+    if n == ul:
+        return in_
+
+    JNTAJISShrinkingTransliteratorContext_init(&ctx, in_, replacement, passthrough)
+    try:
+        if not UCS4Buffer_append_kind(&ctx.out, uk, ud, n):
+            raise MemoryError()
+        ctx.pos = n
+        if ctx.ul - n >= JNTAJIS_NOGIL_THRESHOLD:
+            with nogil:
+                ok = JNTAJISShrinkingTransliteratorContext_do(&ctx)
+        else:
+            ok = JNTAJISShrinkingTransliteratorContext_do(&ctx)
+        if not ok:
+            JNTAJISShrinkingTransliteratorContext_raise(&ctx)
+        return JNTAJISShrinkingTransliteratorContext_get_result(&ctx)
+    finally:
+        JNTAJISShrinkingTransliteratorContext_fini(&ctx)
+
+
+cdef unicode JNTAJISShrinkingTransliteratorContext_feed(
+    JNTAJISShrinkingTransliteratorContext* t,
+    unicode in_,
+    bint final,
+):
+    # Transliterate a chunk, carrying the pending lookahead over from the
+    # previous one and, unless final, on to the next.  The output buffer
+    # and the input cursor live in a context of this call, and only the
+    # lookahead is stored back into t.
+    cdef JNTAJISShrinkingTransliteratorContext ctx
+    cdef int uk = PyUnicode_KIND(in_)
+    cdef const void* ud = PyUnicode_DATA(in_)
+    cdef Py_ssize_t ul = PyUnicode_GET_LENGTH(in_)
+    cdef Py_UCS4 repl = (
+        t.replacement[0] if t.replacement_len == 1 else <Py_UCS4>-1
+    )
+    cdef Py_ssize_t n = 0
+    cdef bint ok
+
+    if t.lal == 0:
+        if ul >= JNTAJIS_NOGIL_THRESHOLD:
+            with nogil:
+                n = shrink_translit_unchanged_prefix(uk, ud, ul, t.passthrough, repl)
+        else:
+            n = shrink_translit_unchanged_prefix(uk, ud, ul, t.passthrough, repl)
+        if n == ul:
+            if final or ul == 0 or not sm_uni_to_jis_is_first(PyUnicode_READ(uk, ud, ul - 1)):
+                return in_
+            # the last character may begin a sequence with the next chunk
+            n = ul - 1
+
+    ctx = t[0]
+    if not UCS4Buffer_init(&ctx.out, ul - n + <Py_ssize_t>ctx.lal):
+        raise MemoryError()
+    try:
+        if not UCS4Buffer_append_kind(&ctx.out, uk, ud, n):
+            raise MemoryError()
+        ctx.in_ = <PyObject*>in_
+        ctx.uk = uk
+        ctx.ud = <void*>ud
+        ctx.ul = ul
+        ctx.pos = n
+        ctx.final = final
+        ctx.err = JNTAJISError_Success
+        if ul - n >= JNTAJIS_NOGIL_THRESHOLD:
+            with nogil:
+                ok = JNTAJISShrinkingTransliteratorContext_do(&ctx)
+        else:
+            ok = JNTAJISShrinkingTransliteratorContext_do(&ctx)
+        if not ok:
+            t.state = 0
+            t.lal = 0
+            JNTAJISShrinkingTransliteratorContext_raise(&ctx)
+        t.state = ctx.state
+        t.lal = ctx.lal
+        memcpy(t.la, ctx.la, ctx.lal * sizeof(ctx.la[0]))
+        return JNTAJISShrinkingTransliteratorContext_get_result(&ctx)
+    finally:
+        UCS4Buffer_fini(&ctx.out)
+
+
+cdef class Transliterator:
+    """
+    A reusable JNTA shrink transliterator for text given in chunks.
+
+    A character at the end of a chunk that may begin a combining sequence
+    is held back until the next chunk, or the final call.  As the chunks
+    are parts of one text, an instance cannot be used from more than one
+    thread at a time; a call made while another is running raises
+    RuntimeError.
+    """
+    cdef JNTAJISShrinkingTransliteratorContext _ctx
+    cdef bint _busy
+
+    cdef unicode _feed(self, unicode chunk, bint final):
+        if self._busy:
+            raise RuntimeError("Transliterator is in use by another thread")
+        self._busy = True
+        try:
+            return JNTAJISShrinkingTransliteratorContext_feed(&self._ctx, chunk, final)
+        finally:
+            self._busy = False
+
+    def translit(self, unicode chunk, bint final=False):
+        """
+        Transliterate a chunk of text.  A chunk that is left as is is
+        returned itself.
+        """
+        return self._feed(chunk, final)
+
+    def translit_iter(self, chunks):
+        """
+        Transliterate each chunk of the given iterable in turn, yielding the
+        non-empty results, and finish after the last one.
+        """
+        for chunk in chunks:
+            out = self._feed(chunk, False)
+            if out:
+                yield out
+        out = self._feed(u"", True)
+        if out:
+            yield out
+
+    def reset(self):
+        if self._busy:
+            raise RuntimeError("Transliterator is in use by another thread")
+        self._ctx.state = 0
+        self._ctx.lal = 0
+
+    def __del__(self):
+        PyMem_Free(self._ctx.replacement)
+        self._ctx.replacement = NULL
+
+    def __init__(self, unicode replacement=u"\ufffd", bint passthrough=False):
+        cdef Py_UCS4* replacement_buf = PyUnicode_AsUCS4Copy(replacement)
+        if self._busy:
+            PyMem_Free(replacement_buf)
+            raise RuntimeError("Transliterator is in use by another thread")
+        PyMem_Free(self._ctx.replacement)
+        self._ctx.replacement = replacement_buf
+        self._ctx.replacement_len = PyUnicode_GET_LENGTH(replacement)
+        self._ctx.passthrough = passthrough
+        self._ctx.in_ = NULL
+        self._ctx.state = 0
+        self._ctx.lal = 0
+
+
+ctypedef struct IndexBuffer:
+    Py_ssize_t* p
+    Py_ssize_t l
+    Py_ssize_t cap
+
+
+cdef bint IndexBuffer_append(IndexBuffer* b, Py_ssize_t i) noexcept nogil:
+    cdef Py_ssize_t cap
+    cdef Py_ssize_t* p
+    if b.l >= b.cap:
+        cap = b.cap + b.cap // 2
+        if cap < 16:
+            cap = 16
+        p = <Py_ssize_t*>realloc(b.p, cap * sizeof(Py_ssize_t))
+        if p == NULL:
+            return False
+        b.p = p
+        b.cap = cap
+    b.p[b.l] = i
+    b.l += 1
+    return True
+
+
+cdef void IndexBuffer_fini(IndexBuffer* b) noexcept nogil:
+    free(b.p)
+    b.p = NULL
+
+
+ctypedef struct JNTAJISChecker:
+    # ctx.e is NULL when checking for jnta_shrink_translit
+    JNTAJISIncrementalEncoderContext ctx
+    char[64] scratch
+    bint find_all
+    Py_ssize_t first
+    IndexBuffer found
+
+
+cdef bint JNTAJISChecker_accept(JNTAJISChecker* c, uint16_t jis) noexcept nogil:
+    # the output of the put function is thrown away character by character
+    if c.ctx.e == NULL:
+        return tx_mappings[jis].class_ != JISCharacterClass_RESERVED
+    c.ctx.p = c.scratch
+    c.ctx.pe = c.scratch + sizeof(c.scratch)
+    return c.ctx.e.put_jis(&c.ctx, jis)
+
+
+cdef bint JNTAJISChecker_reject(JNTAJISChecker* c, Py_ssize_t pos) noexcept nogil:
+    # returns False when the scan is to stop
+    if c.ctx.err != JNTAJISError_Success:
+        return False
+    if c.first < 0:
+        c.first = pos
+    if not c.find_all:
+        return False
+    if not IndexBuffer_append(&c.found, pos):
+        c.ctx.err = JNTAJISError_MemoryError
+        return False
+    return True
+
+
+cdef bint JNTAJISChecker_flush_lookahead(
+    JNTAJISChecker* c,
+    const uint32_t* la,
+    size_t lal,
+    Py_ssize_t pos,
+) noexcept nogil:
+    # la[0] is at pos
+    cdef size_t i
+    cdef uint16_t jis
+    for i in range(lal):
+        if not (lookup_rev_table(&jis, la[i]) and JNTAJISChecker_accept(c, jis)):
+            if not JNTAJISChecker_reject(c, pos + i):
+                return False
+    return True
+
+
+cdef bint JNTAJISChecker_scan(JNTAJISChecker* c) noexcept nogil:
+    # Run the same state machine and reverse table lookups as the encoder and
+    # the transliterator, recording the position of every character that
+    # would be rejected.  Returns False when ctx.err is set.
+    cdef JNTAJISIncrementalEncoderContext* ctx = &c.ctx
+    cdef int state = 0
+    cdef uint32_t[32] la
+    cdef size_t lal = 0
+    cdef uint32_t u
+    cdef uint16_t jis
+
+    while ctx.pos < ctx.ul:
+        u = PyUnicode_READ(ctx.uk, ctx.ud, ctx.pos)
+        if state == 0 and (
+            not sm_uni_to_jis_is_first(u) or (
+                ctx.pos + 1 < ctx.ul and
+                not sm_uni_to_jis_is_second(PyUnicode_READ(ctx.uk, ctx.ud, ctx.pos + 1))
+            )
+        ):
+            # as in the encoder, a character that cannot begin a sequence, or
+            # that is followed by one that cannot complete it, is looked up
+            # on its own; lal is 0 here
+            la[0] = u
+            if not JNTAJISChecker_flush_lookahead(c, la, 1, ctx.pos):
+                return ctx.err == JNTAJISError_Success
+            ctx.pos += 1
+            continue
+        jis = sm_uni_to_jis_mapping(&state, u)
+        if state == -1:
+            if lal > 1:
+                # the characters before the one that began the sequence
+                if not JNTAJISChecker_flush_lookahead(c, la, lal - 1, ctx.pos - lal):
+                    return ctx.err == JNTAJISError_Success
+                lal = 1
+            if not JNTAJISChecker_accept(c, jis):
+                if not JNTAJISChecker_reject(c, ctx.pos - lal):
+                    return ctx.err == JNTAJISError_Success
+            lal = 0
+            state = 0
+        else:
+            if state > 0 and lal > 0:
+                # u begins a new sequence in place of the pending one
+                if not JNTAJISChecker_flush_lookahead(c, la, lal, ctx.pos - lal):
+                    return ctx.err == JNTAJISError_Success
+                lal = 0
+            if lal >= sizeof(la) // sizeof(la[0]):
+                ctx.err = JNTAJISError_LookaheadOverflow
+                ctx.err_start = ctx.pos
+                ctx.err_end = ctx.pos + 1
+                return False
+            la[lal] = u
+            lal += 1
+            if state == 0:
+                if not JNTAJISChecker_flush_lookahead(c, la, lal, ctx.pos + 1 - lal):
+                    return ctx.err == JNTAJISError_Success
+                lal = 0
+        ctx.pos += 1
+    if not JNTAJISChecker_flush_lookahead(c, la, lal, ctx.pos - lal):
+        return ctx.err == JNTAJISError_Success
+    return True
+
+
+cdef object JNTAJISChecker_run(JNTAJISChecker* c, unicode in_, bint find_all):
+    cdef bint ok
+    cdef Py_ssize_t i
+
+    c.ctx.writer = NULL
+    c.ctx.u = <PyObject*>in_  # borrow
+    c.ctx.uk = PyUnicode_KIND(in_)
+    c.ctx.ud = PyUnicode_DATA(in_)
+    c.ctx.ul = PyUnicode_GET_LENGTH(in_)
+    c.ctx.pos = 0
+    c.ctx.err = JNTAJISError_Success
+    c.find_all = find_all
+    c.first = -1
+    c.found.p = NULL
+    c.found.l = 0
+    c.found.cap = 0
+    try:
+        if c.ctx.ul >= JNTAJIS_NOGIL_THRESHOLD:
+            with nogil:
+                ok = JNTAJISChecker_scan(c)
+        else:
+            ok = JNTAJISChecker_scan(c)
+        if not ok:
+            if c.ctx.err == JNTAJISError_MemoryError:
+                raise MemoryError()
+            elif c.ctx.e == NULL:
+                raise TransliterationError(f"lookahead buffer overflow at position {c.ctx.pos}")
+            else:
+                JNTAJISIncrementalEncoderContext_raise(&c.ctx)
+        if find_all:
+            return [c.found.p[i] for i in range(c.found.l)]
+        else:
+            return c.first
+    finally:
+        IndexBuffer_fini(&c.found)
+
+
+def jnta_check(unicode in_, int conv_mode, bint find_all=False):
+    """
+    Check whether a given Unicode string can be encoded in the conversion
+    mode, and return the position of the first character that cannot, or -1.
+    """
+
+    cdef JNTAJISIncrementalEncoder e
+    cdef JNTAJISChecker c
+    JNTAJISIncrementalEncoder_init(&e, u"jis", conv_mode)
+    try:
+        c.ctx.e = &e
+        return JNTAJISChecker_run(&c, in_, find_all)
+    finally:
+        JNTAJISIncrementalEncoder_fini(&e)
+
+
+def _put_jis(int jis, int conv_mode):
+    """
+    Write a single JIS code with the put function of the conversion mode, and
+    return the bytes written, or the reason it is refused.  Lets the tests
+    reach codes that no Unicode character maps to.
+    """
+
+    cdef JNTAJISIncrementalEncoder e
+    cdef JNTAJISIncrementalEncoderContext ctx
+    cdef char[64] scratch
+    cdef const char* reason
+    if jis < 0 or jis >= 94 * 94 * 2:
+        raise ValueError(f"invalid JIS code: {jis}")
+    JNTAJISIncrementalEncoder_init(&e, u"jis", conv_mode)
+    try:
+        ctx.e = &e
+        ctx.err = JNTAJISError_Success
+        ctx.p = scratch
+        ctx.pe = scratch + sizeof(scratch)
+        if not e.put_jis(&ctx, <uint16_t>jis):
+            if ctx.err != JNTAJISError_Success:
+                raise AssertionError()
+            reason = JNTAJISIncrementalEncoder_reason(jis_put_failure(&ctx, <uint16_t>jis))
+            return (<bytes>reason).decode("ascii")
+        return scratch[:ctx.p - scratch]
+    finally:
+        JNTAJISIncrementalEncoder_fini(&e)
+
+
+def jnta_shrink_translit_check(unicode in_, bint find_all=False):
+    """
+    Check whether every character of a given Unicode string is found in the
+    NTA shrink mappings, and return the position of the first character that
+    is not, or -1.
+    """
+
+    cdef JNTAJISChecker c
+    c.ctx.e = NULL
+    return JNTAJISChecker_run(&c, in_, find_all)
+
+
+ctypedef struct ByteBuffer:
+    char* p
+    Py_ssize_t l
+    Py_ssize_t cap
+
+
+cdef bint ByteBuffer_init(ByteBuffer* b, Py_ssize_t cap) noexcept nogil:
+    if cap < 16:
+        cap = 16
+    b.p = <char*>malloc(cap)
+    b.l = 0
+    b.cap = cap
+    return b.p != NULL
+
+
+cdef bint ByteBuffer_reserve(ByteBuffer* b, Py_ssize_t n) noexcept nogil:
+    cdef Py_ssize_t cap
+    cdef char* p
+    if b.cap - b.l >= n:
+        return True
+    cap = b.cap + b.cap // 2
+    if cap < b.l + n:
+        cap = b.l + n
+    p = <char*>realloc(b.p, cap)
+    if p == NULL:
+        return False
+    b.p = p
+    b.cap = cap
+    return True
+
+
+cdef void ByteBuffer_fini(ByteBuffer* b) noexcept nogil:
+    free(b.p)
+    b.p = NULL
+
+
+ctypedef enum JNTAJISBatchKind:
+    JNTAJISBatchKind_ENCODE
+    JNTAJISBatchKind_DECODE
+    JNTAJISBatchKind_SHRINK_TRANSLIT
+    JNTAJISBatchKind_MJ_EQUIVALENT
+
+
+ctypedef struct JNTAJISBatchItem:
+    PyObject* in_  # borrow
+    int kind
+    const void* data
+    Py_ssize_t len
+    int kind2  # mj_equivalent only
+    const void* data2
+    Py_ssize_t len2
+    Py_ssize_t out_off
+    Py_ssize_t out_len
+    JNTAJISError err
+    Py_ssize_t err_pos
+    Py_ssize_t err_end  # encoding only
+    unsigned int c0, c1
+    uint16_t jis
+
+
+ctypedef struct JNTAJISBatch:
+    JNTAJISBatchKind kind
+    PyObject* encoding  # borrow
+    JNTAJISBatchItem* items
+    Py_ssize_t n
+    Py_buffer* views  # decoding only; the buffers of the items
+    Py_ssize_t n_views  # the number of the buffers acquired
+    JNTAJISIncrementalEncoder* e
+    JNTAJISDecoder* d
+    Py_UCS4* replacement
+    Py_ssize_t replacement_len
+    bint passthrough
+    int combo
+
+
+ctypedef struct JNTAJISBatchWorker:
+    JNTAJISBatch* b
+    Py_ssize_t start, end
+    ByteBuffer bout
+    UCS4Buffer uout
+    PyThread_type_lock done
+
+
+cdef bint JNTAJISBatchWorker_reserve(
+    JNTAJISBatchWorker* w,
+    JNTAJISIncrementalEncoderContext* ctx,
+    Py_ssize_t n,
+) noexcept nogil:
+    if ctx.pe - ctx.p >= n:
+        return True
+    w.bout.l = ctx.p - w.bout.p
+    if not ByteBuffer_reserve(&w.bout, n):
+        ctx.err = JNTAJISError_MemoryError
+        return False
+    ctx.p = w.bout.p + w.bout.l
+    ctx.pe = w.bout.p + w.bout.cap
+    return True
+
+
+cdef bint JNTAJISBatchWorker_encode_item(
+    JNTAJISBatchWorker* w,
+    JNTAJISIncrementalEncoderContext* ctx,
+) noexcept nogil:
+    cdef JNTAJISIncrementalEncoder* e = ctx.e
+
+    ctx.p = w.bout.p + w.bout.l
+    ctx.pe = w.bout.p + w.bout.cap
+    while not JNTAJISIncrementalEncoderContext_encode(ctx):
+        if ctx.err != JNTAJISError_BufferFull:
+            return False
+        ctx.err = JNTAJISError_Success
+        if not JNTAJISBatchWorker_reserve(
+            w, ctx,
+            (ctx.ul - ctx.pos) * 2 + (e.lal + 1) * e.max_put_len,
+        ):
+            return False
+    if ctx.pos > 0:
+        ctx.pos -= 1
+    return (
+        JNTAJISBatchWorker_reserve(w, ctx, e.lal * e.max_put_len + e.max_reset_len) and
+        JNTAJISIncrementalEncoderContext_flush_lookahead(ctx) and
+        JNTAJISIncrementalEncoderContext_put_shift(ctx, 0)
+    )
+
+
+cdef void JNTAJISBatchWorker_encode(JNTAJISBatchWorker* w) noexcept nogil:
+    cdef JNTAJISIncrementalEncoder e = w.b.e[0]
+    cdef JNTAJISIncrementalEncoderContext ctx
+    cdef JNTAJISBatchItem* it
+    cdef Py_ssize_t i
+
+    ctx.e = &e
+    ctx.writer = NULL
+    ctx.u = NULL
+    for i in range(w.start, w.end):
+        it = &w.b.items[i]
+        JNTAJISIncrementalEncoder_reset(&e)
+        e.shift_state = 0
+        ctx.uk = <PyUnicode_Kind>it.kind
+        ctx.ud = <void*>it.data
+        ctx.ul = it.len
+        ctx.pos = 0
+        ctx.err = JNTAJISError_Success
+        ctx.err_start = ctx.err_end = 0
+        it.out_off = w.bout.l
+        if JNTAJISBatchWorker_encode_item(w, &ctx):
+            w.bout.l = ctx.p - w.bout.p
+            it.out_len = w.bout.l - it.out_off
+        it.err = ctx.err
+        it.err_pos = ctx.err_start
+        it.err_end = ctx.err_end
+
+
+cdef void JNTAJISBatchWorker_decode(JNTAJISBatchWorker* w) noexcept nogil:
+    cdef JNTAJISDecoder d = w.b.d[0]
+    cdef JNTAJISDecoderContext ctx
+    cdef JNTAJISBatchItem* it
+    cdef Py_ssize_t i
+
+    ctx.d = &d
+    ctx.out_mode = JNTAJISDecoderOutput_BUFFER
+    ctx.out = w.uout
+    for i in range(w.start, w.end):
+        it = &w.b.items[i]
+        d.shift_offset = 0
+        d.upper = 0
+        d.upper2 = 0
+        ctx.in_ = <const unsigned char*>it.data
+        ctx.in_sz = it.len
+        ctx.err = JNTAJISError_Success
+        it.out_off = ctx.out.l
+        if JNTAJISDecoderContext_decode(&ctx):
+            if d.upper > 0:
+                ctx.err = JNTAJISError_IncompleteMultibyteCharacter
+                ctx.err_pos = ctx.in_sz - (2 if d.upper2 > 0 else 1)
+        if ctx.err == JNTAJISError_Success:
+            it.out_len = ctx.out.l - it.out_off
+        else:
+            ctx.out.l = it.out_off
+            it.err_pos = ctx.err_pos
+            it.c0 = ctx.c0
+            it.c1 = ctx.c1
+            it.jis = ctx.jis
+        it.err = ctx.err
+    w.uout = ctx.out
+
+
+cdef void JNTAJISBatchWorker_shrink_translit(JNTAJISBatchWorker* w) noexcept nogil:
+    cdef JNTAJISShrinkingTransliteratorContext t
+    cdef JNTAJISBatchItem* it
+    cdef Py_ssize_t i
+    cdef Py_UCS4 repl
+
+    t.out = w.uout
+    t.replacement = w.b.replacement
+    t.replacement_len = w.b.replacement_len
+    t.passthrough = w.b.passthrough
+    t.in_ = NULL
+    repl = w.b.replacement[0] if w.b.replacement_len == 1 else <Py_UCS4>-1
+    for i in range(w.start, w.end):
+        it = &w.b.items[i]
+        t.uk = it.kind
+        t.ud = <void*>it.data
+        t.ul = it.len
+        t.pos = shrink_translit_unchanged_prefix(t.uk, t.ud, t.ul, t.passthrough, repl)
+        t.final = True
+        t.state = 0
+        t.lal = 0
+        t.err = JNTAJISError_Success
+        it.out_off = t.out.l
+        if t.pos == t.ul:
+            # the input is returned as is
+            it.out_len = -1
+        elif not UCS4Buffer_append_kind(&t.out, t.uk, t.ud, t.pos):
+            t.err = JNTAJISError_MemoryError
+            it.err_pos = t.pos
+        elif JNTAJISShrinkingTransliteratorContext_do(&t):
+            it.out_len = t.out.l - it.out_off
+        else:
+            t.out.l = it.out_off
+            it.err_pos = t.pos
+        it.err = t.err
+    w.uout = t.out
+
+
+cdef void JNTAJISBatchWorker_mj_equivalent(JNTAJISBatchWorker* w) noexcept nogil:
+    cdef JNTAJISBatchItem* it
+    cdef Py_ssize_t i
+    cdef int r
+
+    for i in range(w.start, w.end):
+        it = &w.b.items[i]
+        r = mj_equivalent_kind(it.kind, it.data, it.len, it.kind2, it.data2, it.len2, w.b.combo)
+        if r < 0:
+            it.err = JNTAJISError_MemoryError
+        else:
+            it.out_len = r
+
+
+cdef void JNTAJISBatchWorker_run(void* arg) noexcept nogil:
+    cdef JNTAJISBatchWorker* w = <JNTAJISBatchWorker*>arg
+
+    if w.b.kind == JNTAJISBatchKind_ENCODE:
+        JNTAJISBatchWorker_encode(w)
+    elif w.b.kind == JNTAJISBatchKind_DECODE:
+        JNTAJISBatchWorker_decode(w)
+    elif w.b.kind == JNTAJISBatchKind_MJ_EQUIVALENT:
+        JNTAJISBatchWorker_mj_equivalent(w)
+    else:
+        JNTAJISBatchWorker_shrink_translit(w)
+    if w.done != NULL:
+        PyThread_release_lock(w.done)
+
+
+cdef object JNTAJISBatch_createError(JNTAJISBatch* b, JNTAJISBatchItem* it):
+    cdef JNTAJISIncrementalEncoderContext ectx
+    cdef JNTAJISDecoderContext dctx
+    cdef JNTAJISShrinkingTransliteratorContext t
+
+    if b.kind == JNTAJISBatchKind_ENCODE:
+        ectx.e = b.e
+        ectx.u = it.in_
+        ectx.err_start = it.err_pos
+        ectx.err_end = it.err_end
+        ectx.err = it.err
+        return JNTAJISIncrementalEncoderContext_createError(&ectx)
+    elif b.kind == JNTAJISBatchKind_DECODE:
+        dctx.d = b.d
+        dctx.jis = it.jis
+        dctx.err = it.err
+        dctx.err_pos = it.err_pos
+        dctx.c0 = it.c0
+        dctx.c1 = it.c1
+        return JNTAJISDecoderContext_createError(&dctx, <object>it.in_)
+    elif b.kind == JNTAJISBatchKind_MJ_EQUIVALENT:
+        return MemoryError()
+    else:
+        t.pos = it.err_pos
+        t.err = it.err
+        return JNTAJISShrinkingTransliteratorContext_createError(&t)
+
+
+cdef list JNTAJISBatch_run(JNTAJISBatch* b, int n_threads):
+    # Split the items into contiguous slices, one per worker, and convert
+    # them with the GIL released.  The calling thread takes the first slice
+    # and the rest is handed to native threads.  Each worker appends its
+    # results to its own output buffer; the Python objects are built after
+    # all the workers are done.
+    cdef JNTAJISBatchWorker* ws
+    cdef JNTAJISBatchWorker* w
+    cdef JNTAJISBatchItem* it
+    cdef Py_ssize_t nw, i, k, est
+    cdef list retval
+
+    if n_threads < 1:
+        raise ValueError("n_threads must be a positive integer")
+    nw = n_threads if n_threads < b.n else b.n
+    if nw < 1:
+        nw = 1
+    ws = <JNTAJISBatchWorker*>calloc(nw, sizeof(JNTAJISBatchWorker))
+    if ws == NULL:
+        raise MemoryError()
+    try:
+        for k in range(nw):
+            w = &ws[k]
+            w.b = b
+            w.start = b.n * k // nw
+            w.end = b.n * (k + 1) // nw
+            est = 0
+            for i in range(w.start, w.end):
+                est += b.items[i].len
+            if b.kind == JNTAJISBatchKind_ENCODE:
+                if not ByteBuffer_init(&w.bout, est * 2):
+                    raise MemoryError()
+            elif b.kind != JNTAJISBatchKind_MJ_EQUIVALENT:
+                if not UCS4Buffer_init(&w.uout, est if b.kind == JNTAJISBatchKind_SHRINK_TRANSLIT else est // 2):
+                    raise MemoryError()
+        for k in range(1, nw):
+            w = &ws[k]
+            w.done = PyThread_allocate_lock()
+            if w.done == NULL:
+                continue
+            PyThread_acquire_lock(w.done, WAIT_LOCK)
+            if PyThread_start_new_thread(JNTAJISBatchWorker_run, w) == -1:
+                PyThread_release_lock(w.done)
+                PyThread_free_lock(w.done)
+                w.done = NULL
+        with nogil:
+            JNTAJISBatchWorker_run(&ws[0])
+            for k in range(1, nw):
+                w = &ws[k]
+                if w.done != NULL:
+                    # wait for the worker to finish
+                    PyThread_acquire_lock(w.done, WAIT_LOCK)
+                    PyThread_release_lock(w.done)
+                else:
+                    # the thread could not be started
+                    JNTAJISBatchWorker_run(w)
+
+        retval = [None] * b.n
+        for k in range(nw):
+            w = &ws[k]
+            for i in range(w.start, w.end):
+                it = &b.items[i]
+                if it.err != JNTAJISError_Success:
+                    retval[i] = JNTAJISBatch_createError(b, it)
+                elif b.kind == JNTAJISBatchKind_MJ_EQUIVALENT:
+                    retval[i] = it.out_len != 0
+                elif b.kind == JNTAJISBatchKind_ENCODE:
+                    retval[i] = PyBytes_FromStringAndSize(w.bout.p + it.out_off, it.out_len)
+                elif it.out_len < 0:
+                    retval[i] = <object>it.in_
+                else:
+                    retval[i] = PyUnicode_FromKindAndData(
+                        PyUnicode_4BYTE_KIND, w.uout.p + it.out_off, it.out_len,
+                    )
+        return retval
+    finally:
+        for k in range(nw):
+            w = &ws[k]
+            if w.done != NULL:
+                PyThread_free_lock(w.done)
+            ByteBuffer_fini(&w.bout)
+            UCS4Buffer_fini(&w.uout)
+        free(ws)
+
+
+cdef JNTAJISBatch_init(JNTAJISBatch* b, JNTAJISBatchKind kind, list ins):
+    cdef Py_ssize_t i
+    cdef JNTAJISBatchItem* it
+
+    b.kind = kind
+    b.encoding = NULL
+    b.n = len(ins)
+    b.e = NULL
+    b.replacement = NULL
+    b.views = NULL
+    b.n_views = 0
+    b.items = <JNTAJISBatchItem*>calloc(b.n if b.n > 0 else 1, sizeof(JNTAJISBatchItem))
+    if b.items == NULL:
+        raise MemoryError()
+    if kind == JNTAJISBatchKind_DECODE:
+        b.views = <Py_buffer*>calloc(b.n if b.n > 0 else 1, sizeof(Py_buffer))
+        if b.views == NULL:
+            JNTAJISBatch_fini(b)
+            raise MemoryError()
+    for i in range(b.n):
+        it = &b.items[i]
+        in_ = ins[i]
+        it.in_ = <PyObject*>in_  # borrow; ins keeps the reference
+        if kind == JNTAJISBatchKind_DECODE:
+            # the buffers are held until the batch is done, as in
+            # JNTAJISDecoder_decode_buffer()
+            try:
+                PyObject_GetBuffer(in_, &b.views[i], PyBUF_SIMPLE)
+            except TypeError:
+                JNTAJISBatch_fini(b)
+                raise TypeError(
+                    f"item {i}: expected a bytes-like object, got {type(in_).__name__}"
+                ) from None
+            except BaseException:
+                JNTAJISBatch_fini(b)
+                raise
+            b.n_views += 1
+            it.data = b.views[i].buf
+            it.len = b.views[i].len
+        elif kind == JNTAJISBatchKind_MJ_EQUIVALENT:
+            if (
+                not isinstance(in_, tuple) or len(<tuple>in_) != 2
+                or not isinstance((<tuple>in_)[0], unicode)
+                or not isinstance((<tuple>in_)[1], unicode)
+            ):
+                JNTAJISBatch_fini(b)
+                raise TypeError(f"item {i}: expected a pair of str, got {type(in_).__name__}")
+            # borrow; the tuple keeps the references
+            it.kind = PyUnicode_KIND((<tuple>in_)[0])
+            it.data = PyUnicode_DATA((<tuple>in_)[0])
+            it.len = PyUnicode_GET_LENGTH((<tuple>in_)[0])
+            it.kind2 = PyUnicode_KIND((<tuple>in_)[1])
+            it.data2 = PyUnicode_DATA((<tuple>in_)[1])
+            it.len2 = PyUnicode_GET_LENGTH((<tuple>in_)[1])
+        else:
+            if not isinstance(in_, unicode):
+                JNTAJISBatch_fini(b)
+                raise TypeError(f"item {i}: expected str, got {type(in_).__name__}")
+            it.kind = PyUnicode_KIND(in_)
+            it.data = PyUnicode_DATA(in_)
+            it.len = PyUnicode_GET_LENGTH(in_)
+
+
+cdef void JNTAJISBatch_fini(JNTAJISBatch* b):
+    cdef Py_ssize_t i
+    for i in range(b.n_views):
+        PyBuffer_Release(&b.views[i])
+    b.n_views = 0
+    free(b.views)
+    b.views = NULL
+    free(b.items)
+    b.items = NULL
+
+
+def jnta_encode_many(
+    unicode encoding,
+    ins,
+    int conv_mode,
+    int n_threads=1,
+    unicode errors=u"strict",
+    unicode replacement=u"\u3013",
+):
+    """
+    Encode each of the given Unicode strings into JIS X 0208:1997 / JIS X 0213:2012.
+
+    The items are converted with the GIL released, split across ``n_threads``
+    native threads.  The result is a list in the same order as the input,
+    where an item that failed to convert is represented by the exception
+    that would have been raised by :py:func:`jnta_encode`.  The characters
+    that cannot be encoded are handled according to ``errors`` and
+    ``replacement`` as with :py:func:`jnta_encode`, except that the error
+    handlers registered with :py:func:`codecs.register_error` are not
+    supported.
+    """
+
+    cdef JNTAJISIncrementalEncoder e
+    cdef JNTAJISBatch b
+    cdef list ins_ = list(ins)
+
+    JNTAJISIncrementalEncoder_init(&e, encoding, conv_mode, errors, replacement)
+    try:
+        if e.errors == JNTAJISErrorHandling_CALLBACK:
+            # the workers run without the GIL
+            raise ValueError("custom error handlers are not supported in batch conversion")
+        JNTAJISBatch_init(&b, JNTAJISBatchKind_ENCODE, ins_)
+        try:
+            b.encoding = e.encoding
+            b.e = &e
+            return JNTAJISBatch_run(&b, n_threads)
+        finally:
+            JNTAJISBatch_fini(&b)
+    finally:
+        JNTAJISIncrementalEncoder_fini(&e)
+
+
+def jnta_decode_many(unicode encoding, ins, int n_threads=1, int input_encoding=0):
+    """
+    Decode each of the given JIS character sequences, given as bytes or any
+    other object supporting the buffer protocol, into a Unicode string.
+
+    The items are converted with the GIL released, split across ``n_threads``
+    native threads.  The result is a list in the same order as the input,
+    where an item that failed to convert is represented by the exception
+    that would have been raised by :py:func:`jnta_decode`.
+    """
 
+    cdef JNTAJISDecoder d
+    cdef JNTAJISBatch b
+    cdef list ins_ = list(ins)
 
-def jnta_shrink_translit(unicode in_, unicode replacement=u"\ufffd", bint passthrough=False):
+    JNTAJISDecoder_init(&d, encoding, input_encoding)
+    try:
+        JNTAJISBatch_init(&b, JNTAJISBatchKind_DECODE, ins_)
+        try:
+            b.encoding = d.encoding
+            b.d = &d
+            return JNTAJISBatch_run(&b, n_threads)
+        finally:
+            JNTAJISBatch_fini(&b)
+    finally:
+        JNTAJISDecoder_fini(&d)
+
+
+def jnta_shrink_translit_many(ins, unicode replacement=u"\ufffd", bint passthrough=False, int n_threads=1):
     """
-    Transliterate a Unicode string according to the NTA shrink mappings.
+    Transliterate each of the given Unicode strings according to the NTA shrink mappings.
+
+    The items are converted with the GIL released, split across ``n_threads``
+    native threads.  The result is a list in the same order as the input,
+    where an item that failed to convert is represented by the exception
+    that would have been raised by :py:func:`jnta_shrink_translit`.
     """
 
-    cdef JNTAJISShrinkingTransliteratorContext ctx
+    cdef JNTAJISBatch b
+    cdef list ins_ = list(ins)
 
-    JNTAJISShrinkingTransliteratorContext_init(&ctx, in_, replacement, passthrough)
+    JNTAJISBatch_init(&b, JNTAJISBatchKind_SHRINK_TRANSLIT, ins_)
     try:
-        JNTAJISShrinkingTransliteratorContext_do(&ctx)
-        return JNTAJISShrinkingTransliteratorContext_get_result(&ctx)
+        b.replacement_len = PyUnicode_GET_LENGTH(replacement)
+        b.replacement = PyUnicode_AsUCS4Copy(replacement)
+        b.passthrough = passthrough
+        return JNTAJISBatch_run(&b, n_threads)
     finally:
-        JNTAJISShrinkingTransliteratorContext_fini(&ctx)
+        PyMem_Free(b.replacement)
+        JNTAJISBatch_fini(&b)
 
 
-cdef bint MJShrinkMappingUnicodeSet_valid(const MJShrinkMappingUnicodeSet *sm) nogil:
+cdef bint MJShrinkMappingUnicodeSet_valid(const MJShrinkMappingUnicodeSet *sm) noexcept nogil:
     cdef size_t i
     for i in range(sizeof(sm._0) // sizeof(sm._0[0])):
         if sm._0[i] != <uint32_t>-1:
@@ -795,7 +3500,7 @@ cdef bint MJShrinkMappingUnicodeSet_valid(const MJShrinkMappingUnicodeSet *sm) n
     return 0
 
 
-cdef bint lookup_mj_mapping_table(const MJMappingSet** pms, uint32_t u) nogil:
+cdef bint lookup_mj_mapping_table(const MJMappingSet** pms, uint32_t u) noexcept nogil:
     cdef size_t l = sizeof(urange_to_mj_mappings) // sizeof(urange_to_mj_mappings[0])
     cdef size_t s = 0, e = l
     cdef size_t m, i
@@ -827,54 +3532,99 @@ ctypedef struct MJShrinkCandidates:
     size_t* is_
 
 
-cdef Py_UCS4 to_ivs(int n) nogil:
+cdef Py_UCS4 to_ivs(int n) noexcept nogil:
     if n < 16:
         return 0xfe00 + n
     else:
         return 0xe00f0 + n
 
 
-cdef object MJShrinkCandidates_append_candidates(MJShrinkCandidates* cands, list li, int limit):
+cdef unicode MJShrinkCandidates_build(MJShrinkCandidates* cands):
     cdef size_t i
     cdef Py_ssize_t l
     cdef _PyUnicodeWriter w
     cdef UIVSPair* c
     cdef Py_UCS4 u
 
-    while True:
-        if limit >= 0:
-            limit -= 1
-            if limit < 0:
-                break
-        _PyUnicodeWriter_Init(&w)
-        u = 0
-        l = 0
-        for i in range(cands.l):
-            c = &cands.a[i][cands.is_[i]]
-            u = Py_MAX(u, c.u)
+    _PyUnicodeWriter_Init(&w)
+    u = 0
+    l = 0
+    for i in range(cands.l):
+        c = &cands.a[i][cands.is_[i]]
+        u = Py_MAX(u, c.u)
+        l += 1
+        if c.sv:
+            u = Py_MAX(u, to_ivs(c.s))
             l += 1
-            if c.sv:
-                u = Py_MAX(u, to_ivs(c.s))
-                l += 1
 
-        if _PyUnicodeWriter_Prepare(&w, l, u):
-            _PyUnicodeWriter_Dealloc(&w)
-            raise MemoryError()
+    if _PyUnicodeWriter_Prepare(&w, l, u):
+        _PyUnicodeWriter_Dealloc(&w)
+        raise MemoryError()
 
-        for i in range(cands.l):
-            c = &cands.a[i][cands.is_[i]]
-            _PyUnicodeWriter_WriteChar(&w, c.u)
-            if c.sv:
-                _PyUnicodeWriter_WriteChar(&w, to_ivs(c.s))
+    for i in range(cands.l):
+        c = &cands.a[i][cands.is_[i]]
+        _PyUnicodeWriter_WriteChar(&w, c.u)
+        if c.sv:
+            _PyUnicodeWriter_WriteChar(&w, to_ivs(c.s))
 
-        li.append(_PyUnicodeWriter_Finish(&w))
+    return _PyUnicodeWriter_Finish(&w)
 
-        for i in range(cands.l):
-            cands.is_[i] += 1
-            if cands.is_[i] < cands.al[i]:
-                break
-            cands.is_[i] = 0
+
+cdef bint MJShrinkCandidates_advance(MJShrinkCandidates* cands) noexcept nogil:
+    # move on to the next combination, returning False once all of them
+    # have been visited
+    cdef size_t i
+    for i in range(cands.l):
+        cands.is_[i] += 1
+        if cands.is_[i] < cands.al[i]:
+            return True
+        cands.is_[i] = 0
+    return False
+
+
+cdef object MJShrinkCandidates_count(MJShrinkCandidates* cands):
+    cdef size_t i
+    cdef object n = 1
+    for i in range(cands.l):
+        n *= cands.al[i]
+    return n
+
+
+cdef object MJShrinkCandidates_index(MJShrinkCandidates* cands):
+    # the number of combinations visited so far; the first position is the
+    # one that changes fastest
+    cdef size_t i = cands.l
+    cdef object n = 0
+    while i > 0:
+        i -= 1
+        n = n * cands.al[i] + cands.is_[i]
+    return n
+
+
+cdef tuple MJShrinkCandidates_set(MJShrinkCandidates* cands, size_t p):
+    # the alternatives at a position, each with its IVS if any
+    cdef size_t j
+    cdef UIVSPair* c
+    cdef tuple retval = PyTuple_New(cands.al[p])
+    for j in range(cands.al[p]):
+        c = &cands.a[p][j]
+        if c.sv:
+            o = PyUnicode_FromOrdinal(c.u) + PyUnicode_FromOrdinal(to_ivs(c.s))
         else:
+            o = PyUnicode_FromOrdinal(c.u)
+        Py_INCREF(o)
+        PyTuple_SET_ITEM(retval, j, o)
+    return retval
+
+
+cdef object MJShrinkCandidates_append_candidates(MJShrinkCandidates* cands, list li, int limit):
+    while True:
+        if limit >= 0:
+            limit -= 1
+            if limit < 0:
+                break
+        li.append(MJShrinkCandidates_build(cands))
+        if not MJShrinkCandidates_advance(cands):
             break
 
 
@@ -887,7 +3637,7 @@ cdef void MJShrinkCandidates_fini(MJShrinkCandidates* cands) noexcept:
         free(cands.is_)
 
 
-cdef int resolve_ivs_no(Py_UCS4 n) nogil:
+cdef int resolve_ivs_no(Py_UCS4 n) noexcept nogil:
     # VS1 to VS16
     if n >= 0xfe00 and n < 0xfe10:
         return <int>n - <int>0xfe00
@@ -897,14 +3647,76 @@ cdef int resolve_ivs_no(Py_UCS4 n) nogil:
     return -1
 
 
-cdef MJShrinkCandidates_init(MJShrinkCandidates* cands, unicode in_, int combo):
-    cdef int uk = PyUnicode_KIND(in_)
-    cdef Py_ssize_t ul = PyUnicode_GET_LENGTH(in_)
-    cdef void* ud = PyUnicode_DATA(in_)
-    cdef Py_ssize_t i = 0
-    cdef size_t k, j, l, p
-    cdef int iv
-    cdef Py_UCS4 u, nu
+cdef Py_ssize_t MJShrinkCandidates_read(
+    int uk, const void* ud, Py_ssize_t ul, Py_ssize_t i, Py_UCS4* pu, int* piv,
+) noexcept nogil:
+    # read a character at i, with the IVS that follows it if any, and return
+    # the position next to them
+    cdef Py_UCS4 u = PyUnicode_READ(uk, ud, i)
+    cdef int iv = -1
+    i += 1
+    if i < ul:
+        iv = resolve_ivs_no(PyUnicode_READ(uk, ud, i))
+        if iv >= 0:
+            i += 1
+    pu[0] = u
+    piv[0] = iv
+    return i
+
+
+cdef const uint32_t* lookup_mj_closure(uint32_t u, int iv, int combo) noexcept nogil:
+    # the number of the alternatives of the character followed by them, or
+    # 0 if it is kept as it is
+    cdef size_t s = 0, e = MJ_CLOSURE_IVS_LEN
+    cdef size_t m
+    cdef const MJClosureIVS* ci
+    combo &= MJ_CLOSURE_COMBOS - 1
+    if iv < 0:
+        if u >= MJ_CLOSURE_PAGE_INDEX_LEN << MJ_CLOSURE_PAGE_SHIFT:
+            return mj_closure_pool
+        return &mj_closure_pool[mj_closure_lists[
+            mj_closure_pages[mj_closure_page_index[u >> MJ_CLOSURE_PAGE_SHIFT]][u & (MJ_CLOSURE_PAGE_SIZE - 1)]
+        ][combo]]
+    while s < e:
+        m = (s + e) // 2
+        ci = &mj_closure_ivs[m]
+        if ci.u < u or (ci.u == u and ci.s < iv):
+            s = m + 1
+        elif ci.u == u and ci.s == iv:
+            return &mj_closure_pool[mj_closure_lists[ci.i][combo]]
+        else:
+            e = m
+    return mj_closure_pool
+
+
+cdef Py_ssize_t MJShrinkCandidates_collect(UIVSPair* c, Py_UCS4 u, int iv, int combo) noexcept nogil:
+    # put the alternatives of a character into c and return the number of
+    # them, which never fails as they are looked up in the table built by
+    # gen.py
+    cdef const uint32_t* p = lookup_mj_closure(u, iv, combo)
+    cdef size_t k, l = p[0]
+    cdef uint32_t x, xiv
+    if l == 0:
+        c[0].u = u
+        c[0].v = True
+        c[0].sv = iv >= 0
+        c[0].s = iv
+        return 1
+    for k in range(l):
+        x = p[1 + k]
+        xiv = x >> MJ_CLOSURE_FORM_U_BITS
+        c[k].u = x & ((1 << MJ_CLOSURE_FORM_U_BITS) - 1)
+        c[k].v = True
+        c[k].sv = xiv != 0
+        c[k].s = xiv - 1 if xiv != 0 else 0
+    return l
+
+
+cdef Py_ssize_t MJShrinkCandidates_collect_walk(UIVSPair* c, Py_UCS4 u, int iv, int combo) noexcept nogil:
+    # the same as MJShrinkCandidates_collect(), walking the MJ mappings and
+    # the MJ shrink mappings; returns -1 if the character belongs to too
+    # many MJ codes.  Kept for the tests and the benchmarks only
+    cdef size_t k, j, l = 0
     cdef uint32_t uu
     cdef const MJShrinkMappingUnicodeSet* sm
     cdef const MJMappingSet* ms
@@ -912,168 +3724,118 @@ cdef MJShrinkCandidates_init(MJShrinkCandidates* cands, unicode in_, int combo):
     cdef const MJMapping* mm
     cdef const MJMapping** cmmp
     cdef const MJMapping** cmme
-    cdef UIVSPair[20] c 
-    cdef UIVSPair[20]* a
-    cdef size_t* al
-    cdef size_t* is_
-
-    a = <UIVSPair[20]*>calloc(ul, sizeof(UIVSPair[20]))
-    if a == NULL:
-        raise MemoryError()
-    al = <size_t*>calloc(ul, sizeof(size_t))
-    if al == NULL:
-        free(a)
-        raise MemoryError()
-    is_ = <size_t*>calloc(ul, sizeof(size_t))
-    if is_ == NULL:
-        free(al)
-        free(a)
-        raise MemoryError()
-
-    p = 0
-    while i < ul:
-        is_[p] = 0
-        l = 0
-        iv = -1
-        u = PyUnicode_READ(uk, ud, i)
-        i += 1
-        if i < ul:
-            nu = PyUnicode_READ(uk, ud, i)
-            iv = resolve_ivs_no(nu)
-            if iv >= 0:
-                i += 1
 
-        cmme = cmm
-        if lookup_mj_mapping_table(&ms, u):
-            if iv >= 0:
-                # expecting exact match
-                for j in range(ms.l):
-                    mm = &ms.ms[j]
-                    for k in range(sizeof(mm.v) / sizeof(mm.v[0])):
-                        if not mm.v[k].v:
-                            mm = NULL
-                            break
-                        if mm.v[k].u == u and mm.v[k].sv and mm.v[k].s == iv:
-                            break
-                    else:
+    cmme = cmm
+    if lookup_mj_mapping_table(&ms, u):
+        if iv >= 0:
+            # expecting exact match
+            for j in range(ms.l):
+                mm = &ms.ms[j]
+                for k in range(sizeof(mm.v) / sizeof(mm.v[0])):
+                    if not mm.v[k].v:
                         mm = NULL
-                    if mm != NULL:
-                        cmmp = cmm
-                        while cmmp < cmme:
-                            if cmmp[0] == mm:
-                                break
-                            cmmp += 1
-                        else:
-                            cmme[0] = mm
-                            cmme += 1
-                            if cmme >= cmm + sizeof(cmm) / sizeof(cmm[0]):
-                                raise MemoryError()
                         break
-            else:
-                # search for all candidates
-                for j in range(ms.l):
-                    mm = &ms.ms[j]
-                    for k in range(sizeof(mm.v) / sizeof(mm.v[0])):
-                        if not mm.v[k].v:
-                            mm = NULL
-                            break
-                        if mm.v[k].u == u and not mm.v[k].sv:
+                    if mm.v[k].u == u and mm.v[k].sv and mm.v[k].s == iv:
+                        break
+                else:
+                    mm = NULL
+                if mm != NULL:
+                    cmmp = cmm
+                    while cmmp < cmme:
+                        if cmmp[0] == mm:
                             break
+                        cmmp += 1
                     else:
+                        cmme[0] = mm
+                        cmme += 1
+                        if cmme >= cmm + sizeof(cmm) / sizeof(cmm[0]):
+                            return -1
+                    break
+        else:
+            # search for all candidates
+            for j in range(ms.l):
+                mm = &ms.ms[j]
+                for k in range(sizeof(mm.v) / sizeof(mm.v[0])):
+                    if not mm.v[k].v:
                         mm = NULL
-                    if mm != NULL:
-                        cmmp = cmm
-                        while cmmp < cmme:
-                            if cmmp[0] == mm:
-                                break
-                            cmmp += 1
-                        else:
-                            cmme[0] = mm
-                            cmme += 1
-                            if cmme >= cmm + sizeof(cmm) / sizeof(cmm[0]):
-                                raise MemoryError()
-
-        cmmp = cmm
-        while cmmp < cmme:
-            mm = cmmp[0]
-
-            sm = &mj_shrink_mappings[mm.mj]
-            if MJShrinkMappingUnicodeSet_valid(sm):
-                if combo & 1 != 0:
-                    for j in range(sizeof(sm._0) // sizeof(sm._0[0])):
-                        uu = sm._0[j]
-                        if uu == <uint32_t>-1:
-                            break
-                        if uu == u and iv < 0:
-                            break
-                        for k in range(l):
-                            if c[k].u == uu and not c[k].sv:
-                                break
-                        else:
-                            c[l].u = uu
-                            c[l].v = True
-                            c[l].sv = False
-                            c[l].s = 0
-                            l += 1
-                if combo & 2 != 0:
-                    for j in range(sizeof(sm._1) // sizeof(sm._1[0])):
-                        uu = sm._1[j]
-                        if uu == <uint32_t>-1:
-                            break
-                        if uu == u and iv < 0:
-                            break
-                        for k in range(l):
-                            if c[k].u == uu and not c[k].sv:
-                                break
-                        else:
-                            c[l].u = uu
-                            c[l].v = True
-                            c[l].sv = False
-                            c[l].s = 0
-                            l += 1
-                if combo & 4 != 0:
-                    for j in range(sizeof(sm._2) // sizeof(sm._2[0])):
-                        uu = sm._2[j]
-                        if uu == <uint32_t>-1:
+                        break
+                    if mm.v[k].u == u and not mm.v[k].sv:
+                        break
+                else:
+                    mm = NULL
+                if mm != NULL:
+                    cmmp = cmm
+                    while cmmp < cmme:
+                        if cmmp[0] == mm:
                             break
-                        if uu == u and iv < 0:
+                        cmmp += 1
+                    else:
+                        cmme[0] = mm
+                        cmme += 1
+                        if cmme >= cmm + sizeof(cmm) / sizeof(cmm[0]):
+                            return -1
+
+    cmmp = cmm
+    while cmmp < cmme:
+        mm = cmmp[0]
+
+        sm = &mj_shrink_mappings[mm.mj]
+        if mm.mj < MJ_SHRINK_MAPPINGS_LEN and MJShrinkMappingUnicodeSet_valid(sm):
+            if combo & 1 != 0:
+                for j in range(sizeof(sm._0) // sizeof(sm._0[0])):
+                    uu = sm._0[j]
+                    if uu == <uint32_t>-1:
+                        break
+                    if uu == u and iv < 0:
+                        break
+                    for k in range(l):
+                        if c[k].u == uu and not c[k].sv:
                             break
-                        for k in range(l):
-                            if c[k].u == uu and not c[k].sv:
-                                break
-                        else:
-                            c[l].u = uu
-                            c[l].v = True
-                            c[l].sv = False
-                            c[l].s = 0
-                            l += 1
-                if combo & 8 != 0:
-                    for j in range(sizeof(sm._3) // sizeof(sm._3[0])):
-                        uu = sm._3[j]
-                        if uu == <uint32_t>-1:
+                    else:
+                        c[l].u = uu
+                        c[l].v = True
+                        c[l].sv = False
+                        c[l].s = 0
+                        l += 1
+            if combo & 2 != 0:
+                for j in range(sizeof(sm._1) // sizeof(sm._1[0])):
+                    uu = sm._1[j]
+                    if uu == <uint32_t>-1:
+                        break
+                    if uu == u and iv < 0:
+                        break
+                    for k in range(l):
+                        if c[k].u == uu and not c[k].sv:
                             break
-                        if uu == u and iv < 0:
+                    else:
+                        c[l].u = uu
+                        c[l].v = True
+                        c[l].sv = False
+                        c[l].s = 0
+                        l += 1
+            if combo & 4 != 0:
+                for j in range(sizeof(sm._2) // sizeof(sm._2[0])):
+                    uu = sm._2[j]
+                    if uu == <uint32_t>-1:
+                        break
+                    if uu == u and iv < 0:
+                        break
+                    for k in range(l):
+                        if c[k].u == uu and not c[k].sv:
                             break
-                        for k in range(l):
-                            if c[k].u == uu and not c[k].sv:
-                                break
-                        else:
-                            c[l].u = uu
-                            c[l].v = True
-                            c[l].sv = False
-                            c[l].s = 0
-                            l += 1
-            cmmp += 1
-
-        cmmp = cmm
-        while cmmp < cmme:
-            mm = cmmp[0]
-
-            for j in range(sizeof(mm.v) / sizeof(mm.v[0])):
-                if not mm.v[j].v:
-                    break
-                if not mm.v[j].sv:
-                    uu = mm.v[j].u
+                    else:
+                        c[l].u = uu
+                        c[l].v = True
+                        c[l].sv = False
+                        c[l].s = 0
+                        l += 1
+            if combo & 8 != 0:
+                for j in range(sizeof(sm._3) // sizeof(sm._3[0])):
+                    uu = sm._3[j]
+                    if uu == <uint32_t>-1:
+                        break
+                    if uu == u and iv < 0:
+                        break
                     for k in range(l):
                         if c[k].u == uu and not c[k].sv:
                             break
@@ -1083,17 +3845,215 @@ cdef MJShrinkCandidates_init(MJShrinkCandidates* cands, unicode in_, int combo):
                         c[l].sv = False
                         c[l].s = 0
                         l += 1
+        cmmp += 1
+
+    cmmp = cmm
+    while cmmp < cmme:
+        mm = cmmp[0]
+
+        for j in range(sizeof(mm.v) / sizeof(mm.v[0])):
+            if not mm.v[j].v:
+                break
+            if not mm.v[j].sv:
+                uu = mm.v[j].u
+                for k in range(l):
+                    if c[k].u == uu and not c[k].sv:
+                        break
+                else:
+                    c[l].u = uu
+                    c[l].v = True
+                    c[l].sv = False
+                    c[l].s = 0
+                    l += 1
+
+        cmmp += 1
+
+    if l == 0:
+        c[0].u = u
+        c[0].v = True
+        c[0].sv = iv >= 0
+        c[0].s = iv
+        l = 1
+    return l
+
+
+def _mj_collect_scan(unicode in_, int combo, bint table=True):
+    """
+    Collect the MJ shrink alternatives of every character of the given
+    string and return a checksum of them, or -1 if any could not be
+    collected.  Used by the benchmarks and tests to compare the precomputed
+    table against walking the MJ mappings.
+    """
+
+    cdef int uk = PyUnicode_KIND(in_)
+    cdef void* ud = PyUnicode_DATA(in_)
+    cdef Py_ssize_t ul = PyUnicode_GET_LENGTH(in_)
+    cdef Py_ssize_t i = 0, l = 0, k
+    cdef Py_UCS4 u
+    cdef int iv
+    cdef UIVSPair[20] c
+    cdef unsigned long long acc = 0
+
+    with nogil:
+        while i < ul:
+            i = MJShrinkCandidates_read(uk, ud, ul, i, &u, &iv)
+            if table:
+                l = MJShrinkCandidates_collect(c, u, iv, combo)
+            else:
+                l = MJShrinkCandidates_collect_walk(c, u, iv, combo)
+            if l < 0:
+                break
+            acc = acc * 1000003 + <unsigned long long>l
+            for k in range(l):
+                acc = acc * 1000003 + c[k].u
+                acc = acc * 1000003 + (c[k].s + 1 if c[k].sv else 0)
+    return -1 if l < 0 else acc
+
+
+def _mj_closure_table_sizes():
+    """
+    Return the memory footprint in bytes of the precomputed table of MJ
+    shrink alternatives, and of the MJ mappings and the MJ shrink mappings
+    walked without it.
+    """
+
+    cdef size_t i
+    cdef size_t mappings = sizeof(urange_to_mj_mappings) + sizeof(mj_shrink_mappings)
+    for i in range(sizeof(urange_to_mj_mappings) // sizeof(urange_to_mj_mappings[0])):
+        mappings += (urange_to_mj_mappings[i].end - urange_to_mj_mappings[i].start + 1) * sizeof(MJMappingSet)
+    return {
+        "mappings": mappings,
+        "closure": (
+            sizeof(mj_closure_pages) + sizeof(mj_closure_page_index) + sizeof(mj_closure_ivs)
+            + sizeof(mj_closure_lists) + sizeof(mj_closure_pool)
+        ),
+    }
+
+
+cdef bint UIVSPair_intersect(const UIVSPair* a, size_t al, const UIVSPair* b, size_t bl) noexcept nogil:
+    cdef size_t i, j
+    for i in range(al):
+        for j in range(bl):
+            if a[i].u == b[j].u and a[i].sv == b[j].sv and (not a[i].sv or a[i].s == b[j].s):
+                return True
+    return False
+
+
+cdef int mj_equivalent_kind(
+    int ak, const void* ad, Py_ssize_t al,
+    int bk, const void* bd, Py_ssize_t bl,
+    int combo,
+) noexcept nogil:
+    # 1 if the alternatives of every character of a meet those of the
+    # character at the same position of b, 0 if not, or -1 if any of them
+    # could not be collected
+    cdef Py_ssize_t i = 0, j = 0
+    cdef Py_ssize_t cal, cbl
+    cdef Py_UCS4 au, bu
+    cdef int aiv, biv
+    cdef UIVSPair[20] ca
+    cdef UIVSPair[20] cb
+    while i < al and j < bl:
+        i = MJShrinkCandidates_read(ak, ad, al, i, &au, &aiv)
+        j = MJShrinkCandidates_read(bk, bd, bl, j, &bu, &biv)
+        if au == bu and aiv == biv:
+            continue
+        cal = MJShrinkCandidates_collect(ca, au, aiv, combo)
+        cbl = MJShrinkCandidates_collect(cb, bu, biv, combo)
+        if cal < 0 or cbl < 0:
+            return -1
+        if not UIVSPair_intersect(ca, cal, cb, cbl):
+            return 0
+    return i == al and j == bl
+
+
+cdef uint32_t lookup_mj_canon(uint32_t u, int iv, int combo) noexcept nogil:
+    # the representative of the class the character belongs to, or 0 if it
+    # is kept as it is
+    cdef size_t s = 0, e = MJ_CANON_IVS_LEN
+    cdef size_t m
+    cdef const MJCanonIVS* ci
+    if iv < 0:
+        if u >= MJ_CANON_PAGE_INDEX_LEN << MJ_CANON_PAGE_SHIFT:
+            return 0
+        return mj_canon_reps[
+            mj_canon_pages[mj_canon_page_index[u >> MJ_CANON_PAGE_SHIFT]][u & (MJ_CANON_PAGE_SIZE - 1)]
+        ][combo]
+    while s < e:
+        m = (s + e) // 2
+        ci = &mj_canon_ivs[m]
+        if ci.u < u or (ci.u == u and ci.s < iv):
+            s = m + 1
+        elif ci.u == u and ci.s == iv:
+            return mj_canon_reps[ci.i][combo]
+        else:
+            e = m
+    return 0
+
+
+cdef Py_ssize_t mj_canonical_key_kind(
+    int uk, const void* ud, Py_ssize_t ul, Py_UCS4* out, int combo,
+) noexcept nogil:
+    # write the key into out, which has room for ul characters, and return
+    # its length, or -1 if it is the same as the input
+    cdef Py_ssize_t i = 0, j, o = 0
+    cdef Py_UCS4 u
+    cdef uint32_t r
+    cdef int iv
+    cdef bint changed = False
+    while i < ul:
+        j = MJShrinkCandidates_read(uk, ud, ul, i, &u, &iv)
+        r = lookup_mj_canon(u, iv, combo)
+        if r == 0 or (r == u and iv < 0):
+            while i < j:
+                out[o] = PyUnicode_READ(uk, ud, i)
+                o += 1
+                i += 1
+        else:
+            out[o] = r
+            o += 1
+            i = j
+            changed = True
+    return o if changed else -1
+
+
+cdef MJShrinkCandidates_init(MJShrinkCandidates* cands, unicode in_, int combo):
+    cdef int uk = PyUnicode_KIND(in_)
+    cdef Py_ssize_t ul = PyUnicode_GET_LENGTH(in_)
+    cdef void* ud = PyUnicode_DATA(in_)
+    cdef Py_ssize_t i = 0
+    cdef Py_ssize_t l
+    cdef size_t p
+    cdef int iv
+    cdef Py_UCS4 u
+    cdef UIVSPair[20]* a
+    cdef size_t* al
+    cdef size_t* is_
 
-            cmmp += 1
+    a = <UIVSPair[20]*>calloc(ul, sizeof(UIVSPair[20]))
+    if a == NULL:
+        raise MemoryError()
+    al = <size_t*>calloc(ul, sizeof(size_t))
+    if al == NULL:
+        free(a)
+        raise MemoryError()
+    is_ = <size_t*>calloc(ul, sizeof(size_t))
+    if is_ == NULL:
+        free(al)
+        free(a)
+        raise MemoryError()
 
-        if l == 0:
-            c[0].u = u
-            c[0].v = True
-            c[0].sv = iv >= 0
-            c[0].s = iv
-            l = 1
+    p = 0
+    while i < ul:
+        is_[p] = 0
+        i = MJShrinkCandidates_read(uk, ud, ul, i, &u, &iv)
+        l = MJShrinkCandidates_collect(a[p], u, iv, combo)
+        if l < 0:
+            free(is_)
+            free(al)
+            free(a)
+            raise MemoryError()
         al[p] = l
-        memcpy(a[p], c, sizeof(UIVSPair[20]))
         p += 1
 
     cands.l = p
@@ -1102,6 +4062,48 @@ cdef MJShrinkCandidates_init(MJShrinkCandidates* cands, unicode in_, int combo):
     cands.is_ = is_
 
 
+cdef class MJShrinkCandidateIterator:
+    """
+    An iterator over the candidates of mj_shrink_candidates, each built when
+    asked for.
+    """
+    cdef MJShrinkCandidates _cands
+    cdef bint _done
+
+    def __cinit__(self):
+        self._cands.a = self._cands.al = self._cands.is_ = NULL
+        self._done = True
+
+    def __dealloc__(self):
+        MJShrinkCandidates_fini(&self._cands)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration()
+        retval = MJShrinkCandidates_build(&self._cands)
+        self._done = not MJShrinkCandidates_advance(&self._cands)
+        return retval
+
+    def __length_hint__(self):
+        if self._done:
+            return 0
+        # operator.length_hint() cannot take anything larger
+        return min(
+            MJShrinkCandidates_count(&self._cands) - MJShrinkCandidates_index(&self._cands),
+            PY_SSIZE_T_MAX,
+        )
+
+
+def mj_shrink_candidates_iter(unicode in_, int combo):
+    cdef MJShrinkCandidateIterator it = MJShrinkCandidateIterator.__new__(MJShrinkCandidateIterator)
+    MJShrinkCandidates_init(&it._cands, in_, combo)
+    it._done = False
+    return it
+
+
 def mj_shrink_candidates(unicode in_, int combo, int limit = 100):
     cdef MJShrinkCandidates cands
     cands.a = cands.al = cands.is_ = NULL
@@ -1112,3 +4114,86 @@ def mj_shrink_candidates(unicode in_, int combo, int limit = 100):
     finally:
         MJShrinkCandidates_fini(&cands)
     return retval
+
+
+def mj_shrink_candidate_sets(unicode in_, int combo):
+    cdef MJShrinkCandidates cands
+    cdef size_t p
+    cands.a = cands.al = cands.is_ = NULL
+    try:
+        MJShrinkCandidates_init(&cands, in_, combo)
+        return [MJShrinkCandidates_set(&cands, p) for p in range(cands.l)]
+    finally:
+        MJShrinkCandidates_fini(&cands)
+
+
+def mj_shrink_candidate_count(unicode in_, int combo):
+    cdef MJShrinkCandidates cands
+    cands.a = cands.al = cands.is_ = NULL
+    try:
+        MJShrinkCandidates_init(&cands, in_, combo)
+        return MJShrinkCandidates_count(&cands)
+    finally:
+        MJShrinkCandidates_fini(&cands)
+
+
+def mj_canonical_key(unicode in_, int combo):
+    cdef int uk = PyUnicode_KIND(in_)
+    cdef const void* ud = PyUnicode_DATA(in_)
+    cdef Py_ssize_t ul = PyUnicode_GET_LENGTH(in_)
+    cdef Py_UCS4* out
+    cdef Py_ssize_t ol
+    if ul == 0:
+        return in_
+    out = <Py_UCS4*>malloc(ul * sizeof(Py_UCS4))
+    if out == NULL:
+        raise MemoryError()
+    try:
+        combo &= MJ_CANON_COMBOS - 1
+        if ul >= JNTAJIS_NOGIL_THRESHOLD:
+            with nogil:
+                ol = mj_canonical_key_kind(uk, ud, ul, out, combo)
+        else:
+            ol = mj_canonical_key_kind(uk, ud, ul, out, combo)
+        if ol < 0:
+            return in_
+        return PyUnicode_FromKindAndData(PyUnicode_4BYTE_KIND, out, ol)
+    finally:
+        free(out)
+
+
+def mj_equivalent(unicode a, unicode b, int combo):
+    cdef int ak = PyUnicode_KIND(a), bk = PyUnicode_KIND(b)
+    cdef const void* ad = PyUnicode_DATA(a)
+    cdef const void* bd = PyUnicode_DATA(b)
+    cdef Py_ssize_t al = PyUnicode_GET_LENGTH(a), bl = PyUnicode_GET_LENGTH(b)
+    cdef int r
+    if al >= JNTAJIS_NOGIL_THRESHOLD or bl >= JNTAJIS_NOGIL_THRESHOLD:
+        with nogil:
+            r = mj_equivalent_kind(ak, ad, al, bk, bd, bl, combo)
+    else:
+        r = mj_equivalent_kind(ak, ad, al, bk, bd, bl, combo)
+    if r < 0:
+        raise MemoryError()
+    return r != 0
+
+
+def mj_equivalent_many(pairs, int combo, int n_threads=1):
+    """
+    Tell whether each of the given pairs of strings are the same modulo MJ
+    shrink variants.
+
+    The pairs are compared with the GIL released, split across
+    ``n_threads`` native threads.  The result is a list of booleans in the
+    same order as the input.
+    """
+
+    cdef JNTAJISBatch b
+    cdef list ins_ = list(pairs)
+
+    JNTAJISBatch_init(&b, JNTAJISBatchKind_MJ_EQUIVALENT, ins_)
+    try:
+        b.combo = combo
+        return JNTAJISBatch_run(&b, n_threads)
+    finally:
+        JNTAJISBatch_fini(&b)
@@ -0,0 +1,195 @@
+"""
+Python codec registration for the JNTA encoder and decoder.
+
+Importing :py:mod:`jntajis` registers :py:func:`search` with
+:py:func:`codecs.register`, so that the codecs below can be used anywhere an
+encoding name is accepted, e.g. ``open(path, encoding="jntajis-siso")``:
+
+* ``jntajis-siso``: :py:attr:`ConversionMode.SISO`
+* ``jntajis-men1``: :py:attr:`ConversionMode.MEN1`
+* ``jntajis-jisx0208``: :py:attr:`ConversionMode.JISX0208`
+* ``jntajis-jisx0208-translit``: :py:attr:`ConversionMode.JISX0208_TRANSLIT`
+"""
+
+import codecs
+import typing
+
+from . import ConversionMode, _jntajis
+
+if typing.TYPE_CHECKING:
+    from typing_extensions import Buffer
+
+T = typing.TypeVar("T")
+
+CODEC_NAMES: typing.Dict[str, ConversionMode] = {
+    "jntajis-siso": ConversionMode.SISO,
+    "jntajis-men1": ConversionMode.MEN1,
+    "jntajis-jisx0208": ConversionMode.JISX0208,
+    "jntajis-jisx0208-translit": ConversionMode.JISX0208_TRANSLIT,
+}
+
+
+def _decode(dec: _jntajis.IncrementalDecoder, input: "Buffer", final: bool, errors: str) -> str:
+    """
+    Decode ``input`` with ``dec``, calling the error handler registered as
+    ``errors`` with :py:func:`codecs.register_error` for each error as the
+    codec machinery does, and resuming the decoding where it tells.
+    """
+
+    if errors == "strict":
+        return dec.decode(input, final)
+    handler = codecs.lookup_error(errors)
+    data = memoryview(input).cast("B")
+    retval: typing.List[str] = []
+    while True:
+        state = dec.getstate()
+        try:
+            retval.append(dec.decode(data, final))
+            break
+        except UnicodeDecodeError as e:
+            exc = e
+        dec.setstate(state)
+        if state[0]:
+            # decode again with the pending bytes in front, so that the
+            # error is located in the bytes given to the handler
+            data = memoryview(state[0] + data.tobytes())
+            dec.setstate((b"", state[1]))
+            continue
+        # decode again up to the error, which is at a character boundary
+        retval.append(dec.decode(data[: exc.start], False))
+        repl, pos = handler(exc)
+        if not isinstance(repl, str):
+            raise TypeError("decoding error handler must return (str, int) tuple")
+        if pos < 0:
+            pos += len(data)
+        if not 0 <= pos <= len(data):
+            raise IndexError(f"position {pos} from error handler out of bounds")
+        retval.append(repl)
+        data = data[pos:]
+    return "".join(retval)
+
+
+class Codec(codecs.Codec):
+    name: typing.ClassVar[str]
+    conv_mode: typing.ClassVar[ConversionMode]
+
+    def encode(self, input: str, errors: str = "strict") -> typing.Tuple[bytes, int]:
+        return _jntajis.jnta_encode(self.name, input, self.conv_mode, errors), len(input)
+
+    def decode(self, input: "Buffer", errors: str = "strict") -> typing.Tuple[str, int]:
+        dec = _jntajis.IncrementalDecoder(self.name, self.conv_mode == ConversionMode.SISO)
+        return _decode(dec, input, True, errors), memoryview(input).nbytes
+
+
+class IncrementalEncoder(codecs.IncrementalEncoder):
+    """
+    Every call to :py:meth:`encode` flushes the lookahead and returns to the
+    primary plane, as :py:class:`io.TextIOWrapper` never passes
+    ``final=True`` and the pending characters would otherwise be lost on
+    close.  Consequently, a combining sequence cannot be split across calls.
+    """
+
+    name: typing.ClassVar[str]
+    conv_mode: typing.ClassVar[ConversionMode]
+
+    def __init__(self, errors: str = "strict") -> None:
+        super().__init__(errors)
+        self._impl = _jntajis.IncrementalEncoder(self.name, self.conv_mode, errors)
+
+    def encode(self, input: str, final: bool = False) -> bytes:
+        return self._impl.encode(input, True)
+
+    def reset(self) -> None:
+        self._impl.reset()
+        self._impl.setstate(0)
+
+    def getstate(self) -> int:
+        return self._impl.getstate()
+
+    def setstate(self, state: typing.Union[int, str]) -> None:
+        self._impl.setstate(int(state))
+
+
+class IncrementalDecoder(codecs.IncrementalDecoder):
+    name: typing.ClassVar[str]
+    conv_mode: typing.ClassVar[ConversionMode]
+
+    def __init__(self, errors: str = "strict") -> None:
+        super().__init__(errors)
+        self._impl = _jntajis.IncrementalDecoder(self.name, self.conv_mode == ConversionMode.SISO)
+
+    def decode(self, input: "Buffer", final: bool = False) -> str:
+        return _decode(self._impl, input, final, self.errors)
+
+    def reset(self) -> None:
+        self._impl.reset()
+
+    def getstate(self) -> typing.Tuple[bytes, int]:
+        return self._impl.getstate()
+
+    def setstate(self, state: typing.Tuple[bytes, int]) -> None:
+        self._impl.setstate(state)
+
+
+class StreamWriter(Codec, codecs.StreamWriter):
+    def __init__(self, stream: typing.Any, errors: str = "strict") -> None:
+        super().__init__(stream, errors)
+        self._encoder = _jntajis.IncrementalEncoder(self.name, self.conv_mode, errors)
+
+    def encode(self, input: str, errors: str = "strict") -> typing.Tuple[bytes, int]:
+        # the error handler given at construction is used throughout, as
+        # the shift state would be lost by switching encoders
+        return self._encoder.encode(input, True), len(input)
+
+    def reset(self) -> None:
+        self._encoder.reset()
+        self._encoder.setstate(0)
+
+
+class StreamReader(Codec, codecs.StreamReader):
+    def __init__(self, stream: typing.Any, errors: str = "strict") -> None:
+        super().__init__(stream, errors)
+        self._decoder = _jntajis.IncrementalDecoder(
+            self.name, self.conv_mode == ConversionMode.SISO
+        )
+
+    def decode(self, input: "Buffer", errors: str = "strict") -> typing.Tuple[str, int]:
+        # the incomplete character is handed back to codecs.StreamReader,
+        # which prepends it to the next read; only the plane is kept here
+        retval = _decode(self._decoder, input, False, errors)
+        pending, plane = self._decoder.getstate()
+        self._decoder.setstate((b"", plane))
+        return retval, memoryview(input).nbytes - len(pending)
+
+    def reset(self) -> None:
+        super().reset()
+        self._decoder.reset()
+
+
+def _specialize(cls: typing.Type[T], name: str, conv_mode: ConversionMode) -> typing.Type[T]:
+    return type(cls.__name__, (cls,), {"name": name, "conv_mode": conv_mode})
+
+
+def _build_codec_info(name: str, conv_mode: ConversionMode) -> codecs.CodecInfo:
+    codec = _specialize(Codec, name, conv_mode)()
+    return codecs.CodecInfo(
+        name=name,
+        encode=codec.encode,
+        decode=codec.decode,
+        incrementalencoder=_specialize(IncrementalEncoder, name, conv_mode),
+        incrementaldecoder=_specialize(IncrementalDecoder, name, conv_mode),
+        streamwriter=_specialize(StreamWriter, name, conv_mode),
+        streamreader=_specialize(StreamReader, name, conv_mode),
+    )
+
+
+def search(name: str) -> typing.Optional[codecs.CodecInfo]:
+    """
+    A codec search function to be given to :py:func:`codecs.register`.
+    """
+
+    name = name.replace("_", "-")
+    conv_mode = CODEC_NAMES.get(name)
+    if conv_mode is None:
+        return None
+    return _build_codec_info(name, conv_mode)
@@ -97,6 +97,30 @@ static const ShrinkingTransliterationMapping tx_mappings[2 * 94 * 94] = {
     {%- endfor %}
 };
 
+/*
+ * What the decoder reads for each JIS code, kept apart from tx_mappings:
+ * the codepoint, or JIS_DEC_PAIR | (index into jis_dec_pairs) for the
+ * characters of two codepoints.  JIS_DEC_SHRINKS marks the characters
+ * transliterated by the shrink mappings, and reserved codes are
+ * JIS_DEC_RESERVED.
+ */
+#define JIS_DEC_PAIR {{ "0x%08x"|format(jis_dec_pair) }}U
+#define JIS_DEC_SHRINKS {{ "0x%08x"|format(jis_dec_shrinks) }}U
+#define JIS_DEC_RESERVED {{ "0x%08x"|format(jis_dec_reserved) }}U
+#define JIS_DEC_FLAGS (JIS_DEC_PAIR | JIS_DEC_SHRINKS | JIS_DEC_RESERVED)
+
+static const uint32_t jis_dec_us[2 * 94 * 94] = {
+    {%- for i in jis_dec_table.us|batch(16) %}
+    {% for e in i %}{{ e }}U{% if not loop.last %},{% endif %}{% endfor %}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+static const uint32_t jis_dec_pairs[{{ jis_dec_table.pairs|length or 1 }}][2] = {
+    {%- for e in jis_dec_table.pairs or [(0, 0)] %}
+    {{ "{" }}{{ e[0] }}, {{ e[1] }}}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
 {% for m in uni_range_to_jis_mappings %}
 static const uint16_t jis_urange_{{ "%06x"|format(m.start) }}_{{ "%06x"|format(m.end) }}[{{ m.jis|length }}] = {
     {%- for e in m.jis %}
@@ -111,47 +135,172 @@ static const URangeToJISMapping urange_to_jis_mappings[] = {
     {%- endfor %}
 };
 
+#define REV_JIS_PAGE_SHIFT {{ rev_jis_page_table.shift }}
+#define REV_JIS_PAGE_SIZE (1 << REV_JIS_PAGE_SHIFT)
+#define REV_JIS_PAGE_INDEX_LEN {{ rev_jis_page_table.page_index|length }}
+
+/* page 0 is the shared empty page */
+static const uint16_t rev_jis_pages[{{ rev_jis_page_table.pages|length }}][REV_JIS_PAGE_SIZE] = {
+    {%- for p in rev_jis_page_table.pages %}
+    {{ "{" }}{% for e in p %}{% if not loop.first %},{% endif %}{{ e }}{% endfor %}}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+static const uint16_t rev_jis_page_index[REV_JIS_PAGE_INDEX_LEN] = {
+    {%- for i in rev_jis_page_table.page_index|batch(32) %}
+    {% for e in i %}{{ e }}{% if not loop.last %},{% endif %}{% endfor %}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+/*
+ * The shrink transliteration of each codepoint, laid out in the same pages
+ * as rev_jis_pages: either the single resulting codepoint, or
+ * SHRINK_TX_POOL | (length << 24) | (offset into shrink_tx_pool).
+ * SHRINK_TX_STARTER is set on the codepoints that may begin a combining
+ * sequence.
+ */
+#define SHRINK_TX_POOL {{ "0x%08x"|format(shrink_tx_pool_flag) }}U
+#define SHRINK_TX_STARTER {{ "0x%08x"|format(shrink_tx_starter) }}U
+#define SHRINK_TX_NONE {{ "0x%08x"|format(shrink_tx_none) }}U
+
+static const uint32_t shrink_tx_pages[{{ shrink_tx_table.pages|length }}][REV_JIS_PAGE_SIZE] = {
+    {%- for p in shrink_tx_table.pages %}
+    {{ "{" }}{% for e in p %}{% if not loop.first %},{% endif %}{{ e }}U{% endfor %}}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+static const uint32_t shrink_tx_pool[{{ shrink_tx_table.pool|length or 1 }}] = {
+    {%- for e in shrink_tx_table.pool or [0] %}{% if not loop.first %},{% endif %}{{ e }}{% endfor %}
+};
+
+#define CP932_IBM_EXT_TRAIL_LEN 188
+
+/* Unicode codepoints for the IBM extensions of CP932 (lead bytes 0xED, 0xEE, 0xFA-0xFC) indexed by the trail byte; 0 denotes an undefined code */
+static const uint16_t cp932_ibm_ext_ucs[{{ cp932_ibm_ext_ucs|length }}][CP932_IBM_EXT_TRAIL_LEN] = {
+    {%- for r in cp932_ibm_ext_ucs %}
+    {{ "{" }}{% for e in r %}{% if not loop.first %},{% endif %}{{ e }}{% endfor %}}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+/*
+ * Whether each JIS X 0208 code is defined in CP932, for the lead bytes
+ * 0x81-0x9F and 0xE0-0xEF other than those of the IBM extensions
+ */
+static const uint32_t cp932_jis_valid[{{ cp932_jis_valid|length }}] = {
+    {%- for i in cp932_jis_valid|batch(8) %}
+    {% for e in i %}{{ "0x%08x"|format(e) }}U{% if not loop.last %},{% endif %}{% endfor %}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
 typedef struct SMUniToJISTuple {
     int state;
     uint32_t u;
 } SMUniToJISTuple;
 
+/*
+ * The state machine for the combining sequences: state n > 0 follows the
+ * codepoint sm_uni_to_jis_firsts[n - 1], and may be completed by the
+ * transitions from sm_uni_to_jis_transition_offsets[n - 1] to
+ * sm_uni_to_jis_transition_offsets[n].  The bitmaps tell in O(1) whether a
+ * codepoint can begin, or complete, a sequence at all.
+ */
+typedef struct SMUniToJISTransition {
+    uint32_t u;
+    uint16_t jis;
+} SMUniToJISTransition;
+
+#define SM_UNI_TO_JIS_MIN_FIRST {{ sm_uni_to_jis_table.first_bitmap.min }}
+#define SM_UNI_TO_JIS_MAX_FIRST {{ sm_uni_to_jis_table.first_bitmap.max }}
+/* the smallest codepoint that can complete a combining sequence */
+#define SM_UNI_TO_JIS_MIN_SECOND {{ sm_uni_to_jis_table.second_bitmap.min }}
+#define SM_UNI_TO_JIS_MAX_SECOND {{ sm_uni_to_jis_table.second_bitmap.max }}
+#define SM_UNI_TO_JIS_NUM_FIRSTS {{ sm_uni_to_jis_table.firsts|length }}
+
+static const uint32_t sm_uni_to_jis_first_bitmap[{{ sm_uni_to_jis_table.first_bitmap.words|length }}] = {
+    {%- for i in sm_uni_to_jis_table.first_bitmap.words|batch(8) %}
+    {% for e in i %}{{ "0x%08x"|format(e) }}U{% if not loop.last %},{% endif %}{% endfor %}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+static const uint32_t sm_uni_to_jis_second_bitmap[{{ sm_uni_to_jis_table.second_bitmap.words|length }}] = {
+    {%- for i in sm_uni_to_jis_table.second_bitmap.words|batch(8) %}
+    {% for e in i %}{{ "0x%08x"|format(e) }}U{% if not loop.last %},{% endif %}{% endfor %}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+static const uint32_t sm_uni_to_jis_firsts[SM_UNI_TO_JIS_NUM_FIRSTS] = {
+    {%- for i in sm_uni_to_jis_table.firsts|batch(16) %}
+    {% for e in i %}{{ e }}{% if not loop.last %},{% endif %}{% endfor %}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+static const uint16_t sm_uni_to_jis_transition_offsets[SM_UNI_TO_JIS_NUM_FIRSTS + 1] = {
+    {%- for i in sm_uni_to_jis_table.transition_offsets|batch(16) %}
+    {% for e in i %}{{ e }}{% if not loop.last %},{% endif %}{% endfor %}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+static const SMUniToJISTransition sm_uni_to_jis_transitions[{{ sm_uni_to_jis_table.transitions|length }}] = {
+    {%- for e in sm_uni_to_jis_table.transitions %}
+    {{ "{" }}{{ e[0] }}, {{ e[1] }}}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+/* whether u can begin a combining sequence */
+static inline int sm_uni_to_jis_is_first(uint32_t u)
+{
+    uint32_t i = u - SM_UNI_TO_JIS_MIN_FIRST;
+    if (u < SM_UNI_TO_JIS_MIN_FIRST || u > SM_UNI_TO_JIS_MAX_FIRST) {
+        return 0;
+    }
+    return (sm_uni_to_jis_first_bitmap[i >> 5] >> (i & 31)) & 1;
+}
+
+/* whether u can complete a combining sequence */
+static inline int sm_uni_to_jis_is_second(uint32_t u)
+{
+    uint32_t i = u - SM_UNI_TO_JIS_MIN_SECOND;
+    if (u < SM_UNI_TO_JIS_MIN_SECOND || u > SM_UNI_TO_JIS_MAX_SECOND) {
+        return 0;
+    }
+    return (sm_uni_to_jis_second_bitmap[i >> 5] >> (i & 31)) & 1;
+}
+
+/*
+ * Feed u to the state machine.  *state becomes -1 when u completes the
+ * sequence, whose JIS code is returned; otherwise it becomes the state
+ * begun by u, or 0.
+ */
 static uint16_t sm_uni_to_jis_mapping(int *state, uint32_t u)
 {
-    uint16_t j = 0;
-    int _state = *state;
-reenter:
-    switch (_state) {
-    case 0:
-        if (u < {{ uni_pairs_to_jis_mappings[0].u }} || u > {{ uni_pairs_to_jis_mappings[-1].u }}) {
-            break;
-        }
-        switch (u) {
-        {%- for m in uni_pairs_to_jis_mappings %}
-        case {{m.u}}:
-            _state = {{ loop.index }};
-            break;
-        {%- endfor %}
+    const SMUniToJISTransition *t, *te;
+    size_t s, e, m;
+
+    if (*state > 0) {
+        t = &sm_uni_to_jis_transitions[sm_uni_to_jis_transition_offsets[*state - 1]];
+        te = &sm_uni_to_jis_transitions[sm_uni_to_jis_transition_offsets[*state]];
+        for (; t < te; t++) {
+            if (t->u == u) {
+                *state = -1;
+                return t->jis;
+            }
         }
-        break;
-    {%- for m in uni_pairs_to_jis_mappings %}
-    case {{ loop.index }}:
-        switch (u) {
-        {%- for e in m.n %}
-        case {{ e.us[1] }}:
-            j = {{ e.jis }};
-            _state = -1;
-            break;
-        {%- endfor %}
-        default:
-            _state = 0;
-            goto reenter;
+    }
+    *state = 0;
+    if (sm_uni_to_jis_is_first(u)) {
+        s = 0;
+        e = SM_UNI_TO_JIS_NUM_FIRSTS;
+        while (s < e) {
+            m = (s + e) / 2;
+            if (sm_uni_to_jis_firsts[m] < u) {
+                s = m + 1;
+            } else {
+                e = m;
+            }
         }
-        break;
-    {%- endfor %}
+        *state = (int)s + 1;
     }
-    *state = _state;
-    return j;
+    return 0;
 }
 
 typedef enum MJShrinkScheme {
@@ -212,6 +361,9 @@ static const URangeToMJMappings urange_to_mj_mappings[{{ chunked_mj_mappings|len
 {%- endfor %}
 };
 
+/* the MJ codes beyond have no shrink mappings */
+#define MJ_SHRINK_MAPPINGS_LEN {{ digested_shrink_mappings.smss|length }}
+
 static const MJShrinkMappingUnicodeSet mj_shrink_mappings[{{ digested_shrink_mappings.mje + 1 }}] = {
     {%- for sms in digested_shrink_mappings.smss %}
     {{ "{" }}
@@ -221,6 +373,101 @@ static const MJShrinkMappingUnicodeSet mj_shrink_mappings[{{ digested_shrink_map
     }{% if not loop.last %},{% endif %}
     {%- endfor %}
 };
+
+/*
+ * The representative of the class of MJ shrink equivalent characters that
+ * each character belongs to, for each combo: mj_canon_pages (laid out as
+ * rev_jis_pages) and mj_canon_ivs give the row of mj_canon_reps for a
+ * character without and with an IVS, and 0 in mj_canon_reps keeps the
+ * character as it is.
+ */
+#define MJ_CANON_PAGE_SHIFT {{ mj_canonical_table.shift }}
+#define MJ_CANON_PAGE_SIZE (1 << MJ_CANON_PAGE_SHIFT)
+#define MJ_CANON_PAGE_INDEX_LEN {{ mj_canonical_table.page_index|length }}
+#define MJ_CANON_IVS_LEN {{ mj_canonical_table.ivs|length }}
+#define MJ_CANON_COMBOS {{ mj_shrink_scheme_combos }}
+
+typedef struct MJCanonIVS {
+    uint32_t u:24;
+    uint8_t s;
+    uint16_t i;
+} MJCanonIVS;
+
+static const uint16_t mj_canon_pages[{{ mj_canonical_table.pages|length }}][MJ_CANON_PAGE_SIZE] = {
+    {%- for p in mj_canonical_table.pages %}
+    {{ "{" }}{% for e in p %}{% if not loop.first %},{% endif %}{{ e }}{% endfor %}}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+static const uint16_t mj_canon_page_index[MJ_CANON_PAGE_INDEX_LEN] = {
+    {%- for i in mj_canonical_table.page_index|batch(32) %}
+    {% for e in i %}{{ e }}{% if not loop.last %},{% endif %}{% endfor %}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+static const MJCanonIVS mj_canon_ivs[{{ mj_canonical_table.ivs|length or 1 }}] = {
+    {%- for e in mj_canonical_table.ivs or [(0, 0, 0)] %}
+    {{ "{" }}{{ e[0] }}, {{ e[1] }}, {{ e[2] }}}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+static const uint32_t mj_canon_reps[{{ mj_canonical_table.reps|length }}][MJ_CANON_COMBOS] = {
+    {%- for r in mj_canonical_table.reps %}
+    {{ "{" }}{% for e in r %}{% if not loop.first %},{% endif %}{{ e }}{% endfor %}}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+/*
+ * The alternatives of each character at a position of the MJ shrink
+ * candidates, for each combo: mj_closure_pages (laid out as mj_canon_pages)
+ * and mj_closure_ivs give the row of mj_closure_lists for a character
+ * without and with an IVS, and each entry of the row is the offset into
+ * mj_closure_pool of the number of alternatives followed by them, each
+ * packed as (codepoint | (IVS number + 1) << MJ_CLOSURE_FORM_U_BITS).  The
+ * empty list at offset 0 keeps the character as it is.
+ */
+#define MJ_CLOSURE_PAGE_SHIFT {{ mj_closure_table.shift }}
+#define MJ_CLOSURE_PAGE_SIZE (1 << MJ_CLOSURE_PAGE_SHIFT)
+#define MJ_CLOSURE_PAGE_INDEX_LEN {{ mj_closure_table.page_index|length }}
+#define MJ_CLOSURE_IVS_LEN {{ mj_closure_table.ivs|length }}
+#define MJ_CLOSURE_COMBOS {{ mj_shrink_scheme_combos }}
+#define MJ_CLOSURE_FORM_U_BITS {{ mj_closure_form_u_bits }}
+
+typedef struct MJClosureIVS {
+    uint32_t u:24;
+    uint8_t s;
+    uint16_t i;
+} MJClosureIVS;
+
+static const uint16_t mj_closure_pages[{{ mj_closure_table.pages|length }}][MJ_CLOSURE_PAGE_SIZE] = {
+    {%- for p in mj_closure_table.pages %}
+    {{ "{" }}{% for e in p %}{% if not loop.first %},{% endif %}{{ e }}{% endfor %}}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+static const uint16_t mj_closure_page_index[MJ_CLOSURE_PAGE_INDEX_LEN] = {
+    {%- for i in mj_closure_table.page_index|batch(32) %}
+    {% for e in i %}{{ e }}{% if not loop.last %},{% endif %}{% endfor %}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+static const MJClosureIVS mj_closure_ivs[{{ mj_closure_table.ivs|length or 1 }}] = {
+    {%- for e in mj_closure_table.ivs or [(0, 0, 0)] %}
+    {{ "{" }}{{ e[0] }}, {{ e[1] }}, {{ e[2] }}}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+static const uint32_t mj_closure_lists[{{ mj_closure_table.lists|length }}][MJ_CLOSURE_COMBOS] = {
+    {%- for r in mj_closure_table.lists %}
+    {{ "{" }}{% for e in r %}{% if not loop.first %},{% endif %}{{ e }}{% endfor %}}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
+
+static const uint32_t mj_closure_pool[{{ mj_closure_table.pool|length }}] = {
+    {%- for i in mj_closure_table.pool|batch(16) %}
+    {% for e in i %}{{ e }}{% if not loop.last %},{% endif %}{% endfor %}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+};
 """
 
 men_ku_ten_regexp = re.compile(r"(\d+)-(\d+)-(\d+)$")
@@ -674,6 +921,9 @@ def build_reverse_mappings(
             continue
 
         r = m.us[0]
+        if r == lr:
+            # keep the first mapping so that the chunk stays aligned
+            continue
         if lr == -1:
             sr = r
         else:
@@ -711,6 +961,224 @@ def build_reverse_mappings(
     return rm, rpm
 
 
+class Bitmap(typing.NamedTuple):
+    min: int
+    max: int
+    words: typing.Sequence[int]
+    """bit (u - min) is at (words[(u - min) >> 5] >> ((u - min) & 31)) & 1"""
+
+
+def build_bitmap(us: typing.Iterable[int]) -> Bitmap:
+    su = sorted(set(us))
+    words = [0] * ((su[-1] - su[0]) // 32 + 1)
+    for u in su:
+        i = u - su[0]
+        words[i >> 5] |= 1 << (i & 31)
+    return Bitmap(min=su[0], max=su[-1], words=words)
+
+
+class SMUniToJISTable(typing.NamedTuple):
+    firsts: typing.Sequence[int]
+    transition_offsets: typing.Sequence[int]
+    transitions: typing.Sequence[typing.Tuple[int, int]]
+    """(second codepoint, JIS code) for each state in turn"""
+    first_bitmap: Bitmap
+    second_bitmap: Bitmap
+
+
+def build_sm_uni_to_jis_table(rpm: typing.Sequence[Outer]) -> SMUniToJISTable:
+    firsts: typing.List[int] = []
+    transition_offsets: typing.List[int] = [0]
+    transitions: typing.List[typing.Tuple[int, int]] = []
+
+    for o in sorted(rpm, key=lambda o: o.u):
+        firsts.append(o.u)
+        for m in o.n:
+            transitions.append((m.us[1], m.jis))
+        transition_offsets.append(len(transitions))
+
+    if len(transitions) > 0xFFFF:
+        raise ValueError("too many combining sequences")
+
+    return SMUniToJISTable(
+        firsts=firsts,
+        transition_offsets=transition_offsets,
+        transitions=transitions,
+        first_bitmap=build_bitmap(firsts),
+        second_bitmap=build_bitmap(u for u, _ in transitions),
+    )
+
+
+class RevPageTable(typing.NamedTuple):
+    shift: int
+    page_index: typing.Sequence[int]
+    """page number for each (codepoint >> shift); 0 denotes the empty page"""
+    pages: typing.Sequence[typing.Sequence[int]]
+
+
+def build_reverse_page_table(
+    rm: typing.Sequence[URangeToJISMapping],
+    shift: int = 8,
+) -> RevPageTable:
+    page_size = 1 << shift
+    pages: typing.List[typing.List[int]] = [[0xFFFF] * page_size]
+    page_index: typing.List[int] = [0] * ((0x10FFFF >> shift) + 1)
+
+    for m in rm:
+        for i, jis in enumerate(m.jis):
+            if jis == -1:
+                continue
+            u = m.start + i
+            pi = page_index[u >> shift]
+            if pi == 0:
+                pi = len(pages)
+                pages.append([0xFFFF] * page_size)
+                page_index[u >> shift] = pi
+            pages[pi][u & (page_size - 1)] = jis
+
+    return RevPageTable(shift=shift, page_index=page_index, pages=pages)
+
+
+JIS_DEC_PAIR = 0x80000000
+JIS_DEC_SHRINKS = 0x40000000
+JIS_DEC_RESERVED = 0x20000000
+
+
+class JISDecodeTable(typing.NamedTuple):
+    us: typing.Sequence[int]
+    """entries indexed by JIS code"""
+    pairs: typing.Sequence[typing.Tuple[int, int]]
+    """the characters of two codepoints"""
+
+
+def build_jis_decode_table(
+    mappings: typing.Sequence[ShrinkingTransliterationMapping],
+) -> JISDecodeTable:
+    us: typing.List[int] = []
+    pairs: typing.List[typing.Tuple[int, int]] = []
+
+    for m in mappings:
+        if m.class_ == JISCharacterClass.RESERVED:
+            us.append(JIS_DEC_RESERVED)
+            continue
+        if len(m.us) == 1:
+            x = m.us[0]
+        elif len(m.us) == 2:
+            x = JIS_DEC_PAIR | len(pairs)
+            pairs.append((m.us[0], m.us[1]))
+        else:
+            raise ValueError(f"unexpected number of codepoints for JIS code {m.jis}: {m.us}")
+        if shrink_tx_result(m) != tuple(m.us):
+            x |= JIS_DEC_SHRINKS
+        us.append(x)
+
+    if len(us) != 2 * 94 * 94:
+        raise ValueError(f"expected {2 * 94 * 94} mappings, got {len(us)}")
+
+    return JISDecodeTable(us=us, pairs=pairs)
+
+
+SHRINK_TX_POOL = 0x80000000
+SHRINK_TX_STARTER = 0x40000000
+SHRINK_TX_NONE = 0x3FFFFFFF
+
+
+class ShrinkTxTable(typing.NamedTuple):
+    pages: typing.Sequence[typing.Sequence[int]]
+    """entries laid out in the pages of the reverse page table"""
+    pool: typing.Sequence[int]
+    """the results of more than one codepoint"""
+
+
+def shrink_tx_result(
+    m: ShrinkingTransliterationMapping,
+) -> typing.Optional[typing.Tuple[int, ...]]:
+    if m.class_ == JISCharacterClass.RESERVED:
+        return None
+    if m.tx_us and m.class_ in (
+        JISCharacterClass.JISX0213_NON_KANJI,
+        JISCharacterClass.KANJI_LEVEL_3,
+        JISCharacterClass.KANJI_LEVEL_4,
+    ):
+        return tuple(m.tx_us)
+    return tuple(m.us)
+
+
+def build_shrink_tx_table(
+    mappings: typing.Sequence[ShrinkingTransliterationMapping],
+    rev_jis_page_table: RevPageTable,
+    rpm: typing.Sequence[Outer],
+) -> ShrinkTxTable:
+    page_mask = (1 << rev_jis_page_table.shift) - 1
+    pool: typing.List[int] = []
+    pool_offsets: typing.Dict[typing.Tuple[int, ...], int] = {}
+    pages: typing.List[typing.List[int]] = []
+
+    for rp in rev_jis_page_table.pages:
+        page: typing.List[int] = []
+        for jis in rp:
+            r = shrink_tx_result(mappings[jis]) if jis != 0xFFFF else None
+            if r is None:
+                page.append(SHRINK_TX_NONE)
+            elif len(r) == 1:
+                page.append(r[0])
+            else:
+                off = pool_offsets.get(r)
+                if off is None:
+                    off = pool_offsets[r] = len(pool)
+                    pool.extend(r)
+                page.append(SHRINK_TX_POOL | (len(r) << 24) | off)
+        pages.append(page)
+
+    for o in rpm:
+        pi = rev_jis_page_table.page_index[o.u >> rev_jis_page_table.shift]
+        if pi == 0:
+            raise ValueError(f"U+{o.u:04X} begins a combining sequence but has no JIS counterpart")
+        pages[pi][o.u & page_mask] |= SHRINK_TX_STARTER
+
+    if len(pool) > 0xFFFFFF:
+        raise ValueError("too many codepoints in the shrink transliteration pool")
+
+    return ShrinkTxTable(pages=pages, pool=pool)
+
+
+cp932_ibm_ext_lead_bytes = (0xED, 0xEE, 0xFA, 0xFB, 0xFC)
+
+
+def build_cp932_ibm_ext_table() -> typing.Sequence[typing.Sequence[int]]:
+    retval: typing.List[typing.List[int]] = []
+    for c0 in cp932_ibm_ext_lead_bytes:
+        r: typing.List[int] = []
+        for c1 in [*range(0x40, 0x7F), *range(0x80, 0xFD)]:
+            try:
+                r.append(ord(bytes((c0, c1)).decode("cp932")))
+            except UnicodeDecodeError:
+                r.append(0)
+        retval.append(r)
+    return retval
+
+
+def build_cp932_jis_valid_table() -> typing.Sequence[int]:
+    """
+    Returns a bitmap of the JIS X 0208 codes (men-ku-ten packed as in
+    ShrinkingTransliterationMapping.jis) whose Shift_JIS bytes decode with
+    the stdlib cp932 codec.  The rows of the IBM extensions are left out,
+    as they are looked up in the table built by build_cp932_ibm_ext_table().
+    """
+    words = [0] * ((94 * 94 + 31) // 32)
+    for c0 in [*range(0x81, 0xA0), *range(0xE0, 0xF0)]:
+        if c0 in cp932_ibm_ext_lead_bytes:
+            continue
+        for t, c1 in enumerate([*range(0x40, 0x7F), *range(0x80, 0xFD)]):
+            try:
+                bytes((c0, c1)).decode("cp932")
+            except UnicodeDecodeError:
+                continue
+            jis = (c0 - (0x81 if c0 <= 0x9F else 0xC1)) * 188 + t
+            words[jis >> 5] |= 1 << (jis & 31)
+    return words
+
+
 class ShrinkMappings(typing.NamedTuple):
     smss: typing.Sequence[MJShrinkMappingUnicodeSet]
     mje: int
@@ -746,23 +1214,27 @@ class URangeToMJMappings(typing.NamedTuple):
     mss: typing.Sequence[typing.Sequence[MJMapping]]
 
 
-def build_chunked_mj_mappings(
+def build_uni_to_mj_mappings(
     mappings: typing.Sequence[MJMapping],
-    gap_thr: int = 64,
-) -> typing.Tuple[typing.Sequence[URangeToMJMappings], int]:
+) -> typing.Mapping[int, typing.Sequence[MJMapping]]:
     uni_to_mj_mappings = typing.DefaultDict[int, typing.List[MJMapping]](list)
-
-    max_mss = 0
     for m in mappings:
         for uivp in m.v:
-            li = uni_to_mj_mappings[uivp.u]
-            li.append(m)
-            max_mss = max(max_mss, len(li))
+            uni_to_mj_mappings[uivp.u].append(m)
+    return uni_to_mj_mappings
+
+
+def build_chunked_mj_mappings(
+    mappings: typing.Sequence[MJMapping],
+    gap_thr: int = 64,
+) -> typing.Tuple[typing.Sequence[URangeToMJMappings], int]:
+    uni_to_mj_mappings = build_uni_to_mj_mappings(mappings)
+    max_mss = max((len(ms) for ms in uni_to_mj_mappings.values()), default=0)
 
     retval: typing.List[URangeToMJMappings] = []
     s = -1
     e = -1
-    chunk: typing.List[typing.List[MJMapping]] = []
+    chunk: typing.List[typing.Sequence[MJMapping]] = []
     for u, ms in sorted(uni_to_mj_mappings.items(), key=lambda pair: pair[0]):
         if u - e >= gap_thr:
             if chunk:
@@ -791,6 +1263,248 @@ def build_chunked_mj_mappings(
     return (retval, max_mss)
 
 
+MJ_SHRINK_SCHEME_COMBOS = 16
+
+MJForm = typing.Tuple[int, int]
+"""a codepoint and the number of the IVS that follows it, or -1"""
+
+
+def mj_shrink_alternatives(
+    uni_to_mj_mappings: typing.Mapping[int, typing.Sequence[MJMapping]],
+    smss: typing.Sequence[MJShrinkMappingUnicodeSet],
+    form: MJForm,
+    combo: int,
+) -> typing.Sequence[MJForm]:
+    """
+    The alternatives of a character at a position of mj_shrink_candidates,
+    collected in the same way as MJShrinkCandidates_collect_walk() does.
+    """
+    u, iv = form
+    cmm: typing.List[MJMapping] = []
+    for m in uni_to_mj_mappings.get(u, ()):
+        if UIVSPair(u, iv) in m.v:
+            if m not in cmm:
+                cmm.append(m)
+            if iv >= 0:
+                # expecting exact match
+                break
+
+    retval: typing.List[MJForm] = []
+    for m in cmm:
+        if m.mj >= len(smss):
+            continue
+        for x, us in enumerate(smss[m.mj]):
+            if combo & (1 << x) == 0:
+                continue
+            for uu in us:
+                if uu == u and iv < 0:
+                    break
+                if (uu, -1) not in retval:
+                    retval.append((uu, -1))
+    for m in cmm:
+        for v in m.v:
+            if v.s < 0 and (v.u, -1) not in retval:
+                retval.append((v.u, -1))
+    return retval or [form]
+
+
+class MJCanonicalTable(typing.NamedTuple):
+    shift: int
+    page_index: typing.Sequence[int]
+    """page number for each (codepoint >> shift); 0 denotes the empty page"""
+    pages: typing.Sequence[typing.Sequence[int]]
+    """index into reps for each codepoint not followed by an IVS"""
+    ivs: typing.Sequence[typing.Tuple[int, int, int]]
+    """(codepoint, IVS number, index into reps), sorted"""
+    reps: typing.Sequence[typing.Sequence[int]]
+    """the representative codepoint under each combo; 0 keeps the character"""
+
+
+def build_mj_canonical_table(
+    mappings: typing.Sequence[MJMapping],
+    digested_shrink_mappings: ShrinkMappings,
+    shift: int = 8,
+) -> MJCanonicalTable:
+    """
+    Split the characters into the classes of those reachable from one
+    another through the alternatives given by mj_shrink_alternatives(),
+    for each combo, and pick the smallest codepoint without an IVS in each
+    class as its representative.  A class without one consists of a single
+    character followed by an IVS, which stays as it is.
+    """
+    uni_to_mj_mappings = build_uni_to_mj_mappings(mappings)
+    smss = digested_shrink_mappings.smss
+
+    forms: typing.Set[MJForm] = set()
+    for m in mappings:
+        forms.update((v.u, v.s) for v in m.v)
+        if m.mj < len(smss):
+            for us in smss[m.mj]:
+                forms.update((u, -1) for u in us)
+    sorted_forms = sorted(forms)
+
+    form_reps: typing.Dict[MJForm, typing.List[int]] = {f: [] for f in sorted_forms}
+    for combo in range(MJ_SHRINK_SCHEME_COMBOS):
+        parent: typing.Dict[MJForm, MJForm] = {f: f for f in sorted_forms}
+
+        def find(f: MJForm) -> MJForm:
+            while parent[f] != f:
+                parent[f] = parent[parent[f]]
+                f = parent[f]
+            return f
+
+        for f in sorted_forms:
+            for a in mj_shrink_alternatives(uni_to_mj_mappings, smss, f, combo):
+                ra, rf = find(a), find(f)
+                if ra != rf:
+                    parent[max(ra, rf)] = min(ra, rf)
+
+        members = typing.DefaultDict[MJForm, typing.List[MJForm]](list)
+        for f in sorted_forms:
+            members[find(f)].append(f)
+        for ms in members.values():
+            us = [u for u, iv in ms if iv < 0]
+            if not us and len(ms) > 1:
+                raise ValueError(f"no character without IVS in the class of {ms}")
+            rep = min(us, default=0)
+            for f in ms:
+                form_reps[f].append(rep)
+
+    # the classes only grow as schemes are added to the combo, so that the
+    # characters of a class under combo 0 share the representatives
+    reps: typing.List[typing.Sequence[int]] = [(0,) * MJ_SHRINK_SCHEME_COMBOS]
+    rep_indices: typing.Dict[typing.Tuple[int, ...], int] = {}
+    page_size = 1 << shift
+    pages: typing.List[typing.List[int]] = [[0] * page_size]
+    page_index: typing.List[int] = [0] * ((0x10FFFF >> shift) + 1)
+    ivs: typing.List[typing.Tuple[int, int, int]] = []
+    for f, fr in form_reps.items():
+        u, iv = f
+        if all(r == 0 or (iv < 0 and r == u) for r in fr):
+            continue
+        k = tuple(fr)
+        i = rep_indices.get(k)
+        if i is None:
+            i = rep_indices[k] = len(reps)
+            reps.append(k)
+        if iv >= 0:
+            ivs.append((u, iv, i))
+            continue
+        pi = page_index[u >> shift]
+        if pi == 0:
+            pi = len(pages)
+            pages.append([0] * page_size)
+            page_index[u >> shift] = pi
+        pages[pi][u & (page_size - 1)] = i
+
+    if len(reps) > 0x10000:
+        raise ValueError("too many classes of MJ shrink equivalent characters")
+
+    return MJCanonicalTable(
+        shift=shift,
+        page_index=page_index,
+        pages=pages,
+        ivs=sorted(ivs),
+        reps=reps,
+    )
+
+
+MJ_SHRINK_CANDIDATES_MAX = 20
+"""the number of alternatives MJShrinkCandidates_collect() has room for"""
+
+MJ_CLOSURE_FORM_U_BITS = 21
+
+
+class MJClosureTable(typing.NamedTuple):
+    shift: int
+    page_index: typing.Sequence[int]
+    """page number for each (codepoint >> shift); 0 denotes the empty page"""
+    pages: typing.Sequence[typing.Sequence[int]]
+    """index into lists for each codepoint not followed by an IVS"""
+    ivs: typing.Sequence[typing.Tuple[int, int, int]]
+    """(codepoint, IVS number, index into lists), sorted"""
+    lists: typing.Sequence[typing.Sequence[int]]
+    """offset into pool of the alternatives under each combo"""
+    pool: typing.Sequence[int]
+    """the number of alternatives followed by them, packed by pack_mj_form()"""
+
+
+def pack_mj_form(form: MJForm) -> int:
+    u, iv = form
+    return u | ((iv + 1) << MJ_CLOSURE_FORM_U_BITS)
+
+
+def build_mj_closure_table(
+    mappings: typing.Sequence[MJMapping],
+    digested_shrink_mappings: ShrinkMappings,
+    shift: int = 8,
+) -> MJClosureTable:
+    """
+    Precompute the alternatives given by mj_shrink_alternatives() for each
+    character of the MJ mappings, with the IVS if any, under each combo.
+    Each distinct list of alternatives is stored once in the pool, and the
+    empty list at offset 0 stands for the character itself, which is what
+    the characters not in the table get.
+    """
+    uni_to_mj_mappings = build_uni_to_mj_mappings(mappings)
+    smss = digested_shrink_mappings.smss
+
+    forms: typing.Set[MJForm] = set()
+    for m in mappings:
+        forms.update((v.u, v.s) for v in m.v)
+
+    pool: typing.List[int] = [0]
+    pool_offsets: typing.Dict[typing.Tuple[int, ...], int] = {(): 0}
+    lists: typing.List[typing.Sequence[int]] = [(0,) * MJ_SHRINK_SCHEME_COMBOS]
+    list_indices: typing.Dict[typing.Tuple[int, ...], int] = {}
+    page_size = 1 << shift
+    pages: typing.List[typing.List[int]] = [[0] * page_size]
+    page_index: typing.List[int] = [0] * ((0x10FFFF >> shift) + 1)
+    ivs: typing.List[typing.Tuple[int, int, int]] = []
+    for f in sorted(forms):
+        u, iv = f
+        offsets: typing.List[int] = []
+        for combo in range(MJ_SHRINK_SCHEME_COMBOS):
+            alts = mj_shrink_alternatives(uni_to_mj_mappings, smss, f, combo)
+            if len(alts) > MJ_SHRINK_CANDIDATES_MAX:
+                raise ValueError(f"too many alternatives for {f}: {len(alts)}")
+            k = () if list(alts) == [f] else tuple(pack_mj_form(a) for a in alts)
+            o = pool_offsets.get(k)
+            if o is None:
+                o = pool_offsets[k] = len(pool)
+                pool.append(len(k))
+                pool.extend(k)
+            offsets.append(o)
+        if not any(offsets):
+            continue
+        lk = tuple(offsets)
+        i = list_indices.get(lk)
+        if i is None:
+            i = list_indices[lk] = len(lists)
+            lists.append(lk)
+        if iv >= 0:
+            ivs.append((u, iv, i))
+            continue
+        pi = page_index[u >> shift]
+        if pi == 0:
+            pi = len(pages)
+            pages.append([0] * page_size)
+            page_index[u >> shift] = pi
+        pages[pi][u & (page_size - 1)] = i
+
+    if len(lists) > 0x10000:
+        raise ValueError("too many lists of MJ shrink alternatives")
+
+    return MJClosureTable(
+        shift=shift,
+        page_index=page_index,
+        pages=pages,
+        ivs=sorted(ivs),
+        lists=lists,
+        pool=pool,
+    )
+
+
 def do_jnta(dest: str, src_jnta: str, src_mj: str, src_mj_shrink: str, gap_thr: int = 256) -> None:
     e = jinja2.Environment()
     e.filters["iter_pad"] = iter_pad
@@ -811,19 +1525,56 @@ def do_jnta(dest: str, src_jnta: str, src_mj: str, src_mj_shrink: str, gap_thr:
     print("chunking MJ mappings...")
     chunked_mj_mappings, max_mss = build_chunked_mj_mappings(mj_mappings)
 
+    print("building MJ canonical key table...")
+    mj_canonical_table = build_mj_canonical_table(mj_mappings, digested_shrink_mappings)
+
+    print("building MJ shrink alternative table...")
+    mj_closure_table = build_mj_closure_table(mj_mappings, digested_shrink_mappings)
+
     print("building reverse mappings...")
     rm, rpm = build_reverse_mappings(mappings, gap_thr)
 
+    print("building reverse page table...")
+    rev_jis_page_table = build_reverse_page_table(rm)
+
+    print("building combining sequence table...")
+    sm_uni_to_jis_table = build_sm_uni_to_jis_table(rpm)
+
+    print("building JIS decode table...")
+    jis_dec_table = build_jis_decode_table(mappings)
+
+    print("building shrink transliteration table...")
+    shrink_tx_table = build_shrink_tx_table(mappings, rev_jis_page_table, rpm)
+
+    print("building CP932 IBM extension table...")
+    cp932_ibm_ext_ucs = build_cp932_ibm_ext_table()
+    cp932_jis_valid = build_cp932_jis_valid_table()
+
     gen = t.generate(
         JISCharacterClass=JISCharacterClass,
         tx_mappings=mappings,
         uni_range_to_jis_mappings=rm,
-        uni_pairs_to_jis_mappings=rpm,
+        rev_jis_page_table=rev_jis_page_table,
+        jis_dec_table=jis_dec_table,
+        jis_dec_pair=JIS_DEC_PAIR,
+        jis_dec_shrinks=JIS_DEC_SHRINKS,
+        jis_dec_reserved=JIS_DEC_RESERVED,
+        shrink_tx_table=shrink_tx_table,
+        shrink_tx_pool_flag=SHRINK_TX_POOL,
+        shrink_tx_starter=SHRINK_TX_STARTER,
+        shrink_tx_none=SHRINK_TX_NONE,
+        cp932_ibm_ext_ucs=cp932_ibm_ext_ucs,
+        cp932_jis_valid=cp932_jis_valid,
+        sm_uni_to_jis_table=sm_uni_to_jis_table,
         MJShrinkScheme=MJShrinkScheme,
         max_variants=max_variants,
         digested_shrink_mappings=digested_shrink_mappings,
         chunked_mj_mappings=chunked_mj_mappings,
         max_mss=max_mss,
+        mj_canonical_table=mj_canonical_table,
+        mj_shrink_scheme_combos=MJ_SHRINK_SCHEME_COMBOS,
+        mj_closure_table=mj_closure_table,
+        mj_closure_form_u_bits=MJ_CLOSURE_FORM_U_BITS,
     )
     with open(dest, "w") as f:
         for c in gen:
@@ -0,0 +1,315 @@
+"""
+An inverted index for searching names modulo MJ shrink variants.
+
+:py:class:`MJIndex` keys each name by :py:func:`jntajis.mj_canonical_key`, so
+that names written in different kanji variants (辺, 邉, 邊, ...) get the same
+key, and keeps the rows of the names in which each bigram of the keys occurs
+in flat arrays.  A search looks up the bigrams of the query, takes the
+shortest list of rows and checks the names on it, so that only a handful of
+names are compared per query instead of the whole table.
+
+The arrays are written out as they are by :py:meth:`MJIndex.save`, and
+:py:meth:`MJIndex.load` maps the file into memory and reads them in place,
+so that loading an index takes no time regardless of its size.
+"""
+
+import array
+import bisect
+import collections
+import mmap
+import os
+import struct
+import typing
+
+from . import MJShrinkSchemeCombo, mj_canonical_key
+
+MAGIC = b"JNTAMJIX"
+VERSION = 1
+
+# magic, version, byte order mark, combo, number of rows, number of bigrams,
+# number of postings, size of the names in UTF-8
+_HEADER = struct.Struct("=8sIIIxxxxQQQQ")
+_BOM = 0x01020304
+_ALIGN = 8
+
+# a bigram is packed into an integer as (first << _CHAR_BITS) | second,
+# where second is 0 for the last character of a key
+_CHAR_BITS = 21
+_ROW_BITS = 32
+_ROW_MASK = (1 << _ROW_BITS) - 1
+
+ALL_COMBO = (
+    MJShrinkSchemeCombo.JIS_INCORPORATION_UCS_UNIFICATION_RULE
+    | MJShrinkSchemeCombo.INFERENCE_BY_READING_AND_GLYPH
+    | MJShrinkSchemeCombo.MOJ_NOTICE_582
+    | MJShrinkSchemeCombo.MOJ_FAMILY_REGISTER_ACT_RELATED_NOTICE
+)
+
+
+# an array built in memory, or one read in place from a mapped file
+_Array = typing.Union["array.array[int]", memoryview]
+
+
+def _pad(n: int) -> int:
+    return -n % _ALIGN
+
+
+class MJIndex:
+    """
+    An index of names for finding those that contain a given string modulo
+    MJ shrink variants.  Build one with :py:meth:`build` or open a saved one
+    with :py:meth:`load`; the index is read-only either way.
+    """
+
+    _combo: int
+    _ids: _Array
+    _name_offsets: _Array
+    _names: typing.Union[bytes, memoryview]
+    _grams: _Array
+    _posting_offsets: _Array
+    _postings: _Array
+    _mmap: typing.Optional[mmap.mmap]
+    _views: typing.List[memoryview]
+
+    def __init__(
+        self,
+        combo: int,
+        ids: _Array,
+        name_offsets: _Array,
+        names: typing.Union[bytes, memoryview],
+        grams: _Array,
+        posting_offsets: _Array,
+        postings: _Array,
+        mmap_: typing.Optional[mmap.mmap] = None,
+        views: typing.Sequence[memoryview] = (),
+    ) -> None:
+        self._combo = combo
+        self._ids = ids
+        self._name_offsets = name_offsets
+        self._names = names
+        self._grams = grams
+        self._posting_offsets = posting_offsets
+        self._postings = postings
+        self._mmap = mmap_
+        self._views = list(views)
+
+    @classmethod
+    def build(
+        cls, pairs: typing.Iterable[typing.Tuple[int, str]], combo: int = ALL_COMBO
+    ) -> "MJIndex":
+        """
+        Build an index of the given ``(id, name)`` pairs, keyed by
+        :py:func:`jntajis.mj_canonical_key` under ``combo``.  The index can
+        then be searched with ``combo`` or any subset of it.
+        """
+        ids = array.array("q")
+        name_offsets = array.array("Q", [0])
+        names = bytearray()
+        # the postings of the bigrams starting with each character, packed
+        # as (second << _ROW_BITS) | row so that sorting orders them by
+        # bigram, then by row
+        buckets: typing.DefaultDict[str, "array.array[int]"] = collections.defaultdict(
+            lambda: array.array("Q")
+        )
+        for row, (id_, name) in enumerate(pairs):
+            if row > _ROW_MASK:
+                raise ValueError("too many names")
+            ids.append(id_)
+            names += name.encode("utf-8")
+            name_offsets.append(len(names))
+            key = mj_canonical_key(name, combo)
+            if key:
+                # a bigram of the last character and nothing, so that a
+                # query of a single character finds it at the end as well
+                buckets[key[-1]].append(row)
+            for a, b in set(zip(key, key[1:])):
+                buckets[a].append((ord(b) << _ROW_BITS) | row)
+
+        grams = array.array("Q")
+        posting_offsets = array.array("Q", [0])
+        postings = array.array("I")
+        for a in sorted(buckets):
+            hi = ord(a) << _CHAR_BITS
+            last = -1
+            for e in sorted(buckets[a]):
+                second = e >> _ROW_BITS
+                if second != last:
+                    if last >= 0:
+                        posting_offsets.append(len(postings))
+                    grams.append(hi | second)
+                    last = second
+                postings.append(e & _ROW_MASK)
+            posting_offsets.append(len(postings))
+            del buckets[a]
+
+        return cls(int(combo), ids, name_offsets, bytes(names), grams, posting_offsets, postings)
+
+    @classmethod
+    def load(cls, path: typing.Union[str, "os.PathLike[str]"]) -> "MJIndex":
+        """
+        Open an index saved by :py:meth:`save`.  The file is mapped into
+        memory and the arrays are read in place, so that the pages are
+        loaded as the searches touch them and are shared between processes
+        opening the same file.
+        """
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        views: typing.List[memoryview] = []
+        try:
+            if len(mm) < _HEADER.size:
+                raise ValueError("not an MJ index")
+            magic, version, bom, combo, n_rows, n_grams, n_postings, names_size = (
+                _HEADER.unpack_from(mm)
+            )
+            if magic != MAGIC:
+                raise ValueError("not an MJ index")
+            if version != VERSION:
+                raise ValueError(f"unsupported MJ index version: {version}")
+            if bom != _BOM:
+                raise ValueError("MJ index saved on a machine of different byte order")
+            base = memoryview(mm)
+            views.append(base)
+            o = _HEADER.size + _pad(_HEADER.size)
+
+            def take(n: int, format: typing.Literal["q", "Q", "B", "I"]) -> memoryview:
+                nonlocal o
+                size = n * struct.calcsize(format)
+                if o + size > len(mm):
+                    raise ValueError("truncated MJ index")
+                v = base[o : o + size].cast(format)
+                views.append(v)
+                o += size + _pad(size)
+                return v
+
+            retval = cls(
+                combo,
+                take(n_rows, "q"),
+                take(n_rows + 1, "Q"),
+                take(names_size, "B"),
+                take(n_grams, "Q"),
+                take(n_grams + 1, "Q"),
+                take(n_postings, "I"),
+                mm,
+                views,
+            )
+        except BaseException:
+            for v in reversed(views):
+                v.release()
+            mm.close()
+            raise
+        return retval
+
+    def save(self, path: typing.Union[str, "os.PathLike[str]"]) -> None:
+        """
+        Save the index in a form that :py:meth:`load` can map into memory.
+        The file is laid out in the byte order of the machine.
+        """
+        with open(path, "wb") as f:
+            header = _HEADER.pack(
+                MAGIC,
+                VERSION,
+                _BOM,
+                self._combo,
+                len(self._ids),
+                len(self._grams),
+                len(self._postings),
+                len(self._names),
+            )
+            f.write(header + bytes(_pad(len(header))))
+            for a in (
+                self._ids,
+                self._name_offsets,
+                self._names,
+                self._grams,
+                self._posting_offsets,
+                self._postings,
+            ):
+                b = memoryview(a).cast("B")
+                f.write(b)
+                f.write(bytes(_pad(len(b))))
+
+    def close(self) -> None:
+        """
+        Unmap the file of an index opened by :py:meth:`load`.  The index
+        cannot be used afterwards.  Does nothing for a built index.
+        """
+        for v in reversed(self._views):
+            v.release()
+        self._views.clear()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self) -> "MJIndex":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def combo(self) -> int:
+        """The combination of the schemes the index was built with."""
+        return self._combo
+
+    def name(self, row: int) -> str:
+        """Returns the name at ``row``, in the order the names were given."""
+        return str(self._names[self._name_offsets[row] : self._name_offsets[row + 1]], "utf-8")
+
+    def _postings_of(self, gram: int) -> typing.Sequence[int]:
+        i = bisect.bisect_left(self._grams, gram)
+        if i == len(self._grams) or self._grams[i] != gram:
+            return ()
+        return self._postings[self._posting_offsets[i] : self._posting_offsets[i + 1]]
+
+    def _candidate_rows(self, key: str) -> typing.Iterable[int]:
+        if not key:
+            return range(len(self._ids))
+        if len(key) == 1:
+            # the bigrams starting with the character, including the one
+            # at the end of a key, are next to each other
+            lo = ord(key) << _CHAR_BITS
+            i = bisect.bisect_left(self._grams, lo)
+            j = bisect.bisect_left(self._grams, lo + (1 << _CHAR_BITS))
+            return sorted(set(self._postings[self._posting_offsets[i] : self._posting_offsets[j]]))
+        retval: typing.Optional[typing.Sequence[int]] = None
+        for a, b in set(zip(key, key[1:])):
+            p = self._postings_of((ord(a) << _CHAR_BITS) | ord(b))
+            if retval is None or len(p) < len(retval):
+                retval = p
+                if not p:
+                    break
+        assert retval is not None
+        return retval
+
+    def search(
+        self, query: str, combo: typing.Optional[int] = None, limit: typing.Optional[int] = None
+    ) -> typing.List[int]:
+        """
+        Returns the ids of the names that contain ``query`` modulo MJ shrink
+        variants, that is, those whose :py:func:`jntajis.mj_canonical_key`
+        under ``combo`` contains that of ``query``, in the order the names
+        were given.
+
+        ``combo`` defaults to the combo the index was built with, and may
+        be any subset of it.  A query made only of bigrams that occur in a
+        large part of the names, such as 株式会社, has to check all of them;
+        ``limit`` stops the search when as many names are found.
+        """
+        if combo is None:
+            combo = self._combo
+        elif combo & ~self._combo:
+            raise ValueError("combo must be a subset of that the index was built with")
+        rows = self._candidate_rows(mj_canonical_key(query, self._combo))
+        qkey = mj_canonical_key(query, combo)
+        retval: typing.List[int] = []
+        if limit is not None and limit <= 0:
+            return retval
+        for row in rows:
+            if qkey in mj_canonical_key(self.name(row), combo):
+                retval.append(self._ids[row])
+                if len(retval) == limit:
+                    break
+        return retval
@@ -0,0 +1,112 @@
+import codecs
+import io
+
+import pytest
+
+import jntajis
+
+
+@pytest.mark.parametrize(
+    ("name", "mode"),
+    [
+        ("jntajis-siso", jntajis.ConversionMode.SISO),
+        ("jntajis-men1", jntajis.ConversionMode.MEN1),
+        ("jntajis-jisx0208", jntajis.ConversionMode.JISX0208),
+        ("jntajis-jisx0208-translit", jntajis.ConversionMode.JISX0208_TRANSLIT),
+        ("JNTAJIS_JISX0208_TRANSLIT", jntajis.ConversionMode.JISX0208_TRANSLIT),
+    ],
+)
+def test_codec_lookup(name, mode):
+    in_ = "ジャンクロードヴァンダム，"
+    expected = jntajis.jnta_encode("jis", in_, mode)
+    assert in_.encode(name) == expected
+    assert expected.decode(name) == in_
+
+
+def test_codec_unknown_name():
+    with pytest.raises(LookupError):
+        codecs.lookup("jntajis-unknown")
+
+
+def test_codec_encode_error():
+    with pytest.raises(UnicodeEncodeError) as e:
+        "繫".encode("jntajis-jisx0208")
+    assert e.value.encoding == "jntajis-jisx0208"
+
+
+def test_codec_encode_errors():
+    assert "あ繫い".encode("jntajis-jisx0208", "replace") == b"\x24\x22\x22\x2e\x24\x24"
+    assert "あ繫い".encode("jntajis-jisx0208", "ignore") == b"\x24\x22\x24\x24"
+    buf = io.BytesIO()
+    with io.TextIOWrapper(buf, encoding="jntajis-jisx0208", errors="replace") as f:
+        f.write("あ繫い")
+        f.flush()
+        assert buf.getvalue() == b"\x24\x22\x22\x2e\x24\x24"
+
+
+@pytest.mark.parametrize(
+    ("errors", "expected"),
+    [
+        ("replace", "あ\ufffd\ufffdい\ufffd"),
+        ("ignore", "あい"),
+        ("backslashreplace", "あ\\x24\\x7fい\\x24"),
+        ("test-jntajis", "あ??い?"),
+    ],
+)
+def test_codec_decode_errors(errors, expected):
+    codecs.register_error("test-jntajis", lambda e: ("?", e.end))
+    in_ = b"\x24\x22\x24\x7f\x24\x24\x24"
+    assert in_.decode("jntajis-men1", errors) == expected
+    assert bytearray(in_).decode("jntajis-men1", errors) == expected
+    dec = codecs.getincrementaldecoder("jntajis-men1")(errors)
+    assert (
+        "".join(dec.decode(in_[i : i + 1]) for i in range(len(in_))) + dec.decode(b"", True)
+        == expected
+    )
+    with io.TextIOWrapper(io.BytesIO(in_), encoding="jntajis-men1", errors=errors) as f:
+        assert f.read() == expected
+    # as with the standard codecs, the stream reader drops an incomplete
+    # character at the end of the stream
+    r = codecs.getreader("jntajis-men1")(io.BytesIO(in_[:-1]), errors)
+    assert r.read() == in_[:-1].decode("jntajis-men1", errors)
+
+
+def test_codec_decode_errors_siso():
+    # the plane selected before the error is kept after it
+    in_ = b"\x0f\x21\x21\x24\x7f\x21\x21\x0e\x24\x22"
+    assert in_.decode("jntajis-siso", "replace") == "\U00020089\ufffd\ufffd\U00020089あ"
+
+
+def test_codec_decode_unknown_error_handler():
+    with pytest.raises(LookupError):
+        b"\x24\x22".decode("jntajis-men1", "unknown")
+
+
+def test_codec_text_io_siso(tmp_path):
+    in_ = "ジャンク\U00020089ロードヴァンダム\U00020089"
+    path = tmp_path / "siso.txt"
+    with open(path, "w", encoding="jntajis-siso") as f:
+        for c in in_:
+            f.write(c)
+    assert path.read_bytes() == b"".join(
+        jntajis.jnta_encode("jis", c, jntajis.ConversionMode.SISO) for c in in_
+    )
+    with open(path, encoding="jntajis-siso") as f:
+        assert f.read() == in_
+    with open(path, encoding="jntajis-siso") as f:
+        assert f.read(5) == in_[:5]
+        pos = f.tell()
+        rest = f.read()
+        f.seek(pos)
+        assert f.read() == rest == in_[5:]
+
+
+def test_codec_stream_reader_writer():
+    in_ = "ジャンク\U00020089ロードヴァンダム"
+    b = io.BytesIO()
+    w = codecs.getwriter("jntajis-siso")(b)
+    w.write(in_[:5])
+    w.write(in_[5:])
+    b.seek(0)
+    r = codecs.getreader("jntajis-siso")(b)
+    assert "".join(iter(lambda: r.read(1, 1), "")) == in_
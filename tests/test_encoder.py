@@ -1,3 +1,7 @@
+import codecs
+import gc
+import threading
+
 import pytest
 
 import jntajis
@@ -268,3 +272,989 @@ def test_incremental_encoder(expected, expected_at_flush, err, mode, input):
         with pytest.raises(UnicodeEncodeError) as e:
             enc.encode(input, True)
         assert e.value.reason == err
+
+
+@pytest.mark.parametrize(
+    ("layout", "codec"),
+    [
+        (jntajis.ConversionMode.SJIS2004, "shift_jis_2004"),
+        (jntajis.ConversionMode.EUC_JIS2004, "euc_jis_2004"),
+        (jntajis.ConversionMode.ISO2022JP2004, "iso2022_jp_2004"),
+    ],
+)
+@pytest.mark.parametrize(
+    ("input", "repertoire"),
+    [
+        ("あ亜ー，", jntajis.ConversionMode.SISO),
+        ("あ亜ー，", jntajis.ConversionMode.JISX0208),
+        ("俱㉑繫", jntajis.ConversionMode.SISO),
+        ("俱㉑繫", jntajis.ConversionMode.MEN1),
+        ("\U00020089丂\U0002a6b2", jntajis.ConversionMode.SISO),
+        ("あ\U00020089亜俱丂ー", jntajis.ConversionMode.SISO),
+    ],
+)
+def test_encode_multibyte_layouts(layout, codec, input, repertoire):
+    encoded = jntajis.jnta_encode("jis", input, layout + repertoire)
+    assert encoded == input.encode(codec)
+    assert encoded.decode(codec) == input
+
+
+@pytest.mark.parametrize(
+    ("expected", "codec", "mode", "input"),
+    [
+        ("繋２１", "shift_jis_2004", jntajis.ConversionMode.SJIS2004_JISX0208_TRANSLIT, "繫㉑"),
+        ("繋２１", "euc_jis_2004", jntajis.ConversionMode.EUC_JIS2004_JISX0208_TRANSLIT, "繫㉑"),
+        (
+            "繋２１",
+            "iso2022_jp_2004",
+            jntajis.ConversionMode.ISO2022JP2004_JISX0208_TRANSLIT,
+            "繫㉑",
+        ),
+        (None, None, jntajis.ConversionMode.SJIS2004_MEN1, "\U00020089"),
+        (None, None, jntajis.ConversionMode.EUC_JIS2004_JISX0208, "繫"),
+        (None, None, jntajis.ConversionMode.ISO2022JP2004_JISX0208, "㉑"),
+    ],
+)
+def test_encode_multibyte_layouts_repertoire(expected, codec, mode, input):
+    if expected is None:
+        with pytest.raises(UnicodeEncodeError):
+            jntajis.jnta_encode("jis", input, mode)
+    else:
+        assert jntajis.jnta_encode("jis", input, mode).decode(codec) == expected
+
+
+SJIS2004_PLANE2_ROWS = {1, 3, 4, 5, 8, 12, 13, 14, 15} | set(range(78, 95))
+
+
+@pytest.mark.parametrize(("ku",), [(ku,) for ku in range(1, 95)])
+def test_encode_sjis2004_plane2_rows(ku):
+    jis = 94 * 94 + (ku - 1) * 94
+    if ku in SJIS2004_PLANE2_ROWS:
+        encoded = jntajis._jntajis._put_jis(jis, jntajis.ConversionMode.SJIS2004)
+        euc = bytes([0x8F, 0xA0 + ku, 0xA1])
+        assert encoded == euc.decode("euc_jis_2004").encode("shift_jis_2004")
+    else:
+        assert (
+            jntajis._jntajis._put_jis(jis, jntajis.ConversionMode.SJIS2004)
+            == "not representable in Shift_JIS-2004"
+        )
+        assert jntajis._jntajis._put_jis(jis, jntajis.ConversionMode.EUC_JIS2004) == bytes(
+            [0x8F, 0xA0 + ku, 0xA1]
+        )
+    # out of the repertoire before the layout comes into play
+    assert (
+        jntajis._jntajis._put_jis(jis, jntajis.ConversionMode.SJIS2004_MEN1)
+        == "not convertible to JISX0208"
+    )
+
+
+def test_encode_iso2022jp2004_incremental():
+    enc = jntajis.IncrementalEncoder("jis", jntajis.ConversionMode.ISO2022JP2004)
+    out = enc.encode("あ", False)
+    out += enc.encode("\U00020089", False)
+    state = enc.getstate()
+    enc.reset()
+    enc.setstate(0)
+    enc.setstate(state)
+    out += enc.encode("亜", True)
+    assert out == "あ\U00020089亜".encode("iso2022_jp_2004")
+    assert enc.getstate() == 0
+
+
+@pytest.mark.parametrize(
+    ("expected", "expected_all", "mode", "input"),
+    [
+        (-1, [], jntajis.ConversionMode.JISX0208, "ジャンクロードヴァンダム，"),
+        (1, [1, 3], jntajis.ConversionMode.JISX0208, "あ㉑い繫"),
+        (-1, [], jntajis.ConversionMode.JISX0208_TRANSLIT, "あ㉑い繫"),
+        (-1, [], jntajis.ConversionMode.MEN1, "あ㉑い繫"),
+        (1, [1], jntajis.ConversionMode.JISX0208, "あか\u309aい"),
+        (-1, [], jntajis.ConversionMode.MEN1, "あか\u309aい"),
+        (1, [1, 3], jntajis.ConversionMode.MEN1, "あ\U00020089い✋"),
+        (3, [3], jntajis.ConversionMode.SISO, "あ\U00020089い✋"),
+        (1, [1], jntajis.ConversionMode.JISX0208, "あㇷ"),
+    ],
+)
+def test_check(expected, expected_all, mode, input):
+    assert jntajis.jnta_check(input, mode) == expected
+    assert jntajis.jnta_check(input, mode, True) == expected_all
+    if expected == -1:
+        jntajis.jnta_encode("jis", input, mode)
+    else:
+        with pytest.raises(UnicodeEncodeError):
+            jntajis.jnta_encode("jis", input, mode)
+
+
+def test_check_large_input():
+    in_ = "ジャンクロードヴァンダム，" * 1000
+    assert jntajis.jnta_check(in_ + "繫", jntajis.ConversionMode.JISX0208) == len(in_)
+    assert jntajis.jnta_check(
+        "繫" + in_ + "繫", jntajis.ConversionMode.JISX0208, find_all=True
+    ) == [0, len(in_) + 1]
+
+
+def test_shrink_translit_check():
+    assert jntajis.jnta_shrink_translit_check("あ㉑か\u309a繫") == -1
+    assert jntajis.jnta_shrink_translit_check("あ✋い", True) == [1]
+    assert jntajis.jnta_shrink_translit_check("ab", True) == [0, 1]
+    with pytest.raises(jntajis.TransliterationError):
+        jntajis.jnta_shrink_translit("あ✋い", "")
+
+
+def test_check_long_run_of_starters():
+    # each character may begin a sequence, but none completes one
+    in_ = "かカトセ" * 20 + "か\u309a"
+    mode = jntajis.ConversionMode.SISO
+    assert jntajis.jnta_check(in_, mode) == -1
+    assert jntajis.jnta_check(in_ + "\U0001f600", mode, True) == [len(in_)]
+    jntajis.jnta_encode("jis", in_, mode)
+    assert jntajis.jnta_shrink_translit_check(in_) == -1
+    assert jntajis.jnta_shrink_translit_check(in_ + "\U0001f600", True) == [len(in_)]
+    jntajis.jnta_shrink_translit(in_)
+
+
+def test_rev_table_layouts_agree():
+    from jntajis import _jntajis
+
+    for u in range(0x110000):
+        c = chr(u)
+        assert _jntajis._rev_table_scan(c, True) == _jntajis._rev_table_scan(c, False), hex(u)
+
+
+def test_decode_table_agrees():
+    # every JIS code decodes to a string that survives a round trip, and is
+    # transliterated in one pass as it is in two
+    euc = jntajis.InputEncoding.EUC_JIS2004
+    mode = jntajis.ConversionMode.EUC_JIS2004 + jntajis.ConversionMode.SISO
+    for men in (0, 1):
+        for ku in range(94):
+            for ten in range(94):
+                encoded = (b"\x8f" if men else b"") + bytes([0xA1 + ku, 0xA1 + ten])
+                try:
+                    decoded = jntajis.jnta_decode("jis", encoded, euc)
+                except UnicodeDecodeError:
+                    continue
+                reencoded = jntajis.jnta_encode("jis", decoded, mode)
+                assert jntajis.jnta_decode("jis", reencoded, euc) == decoded, (men, ku, ten)
+                assert jntajis.jnta_decode_shrink_translit(
+                    "jis", encoded, euc
+                ) == jntajis.jnta_shrink_translit(decoded), (men, ku, ten)
+
+
+def test_shrink_tx_table_agrees():
+    from jntajis import _jntajis
+
+    assert _jntajis._shrink_tx_table_mismatches() == []
+    # the fused table against the decoder, which goes through tx_mappings
+    mode = jntajis.ConversionMode.EUC_JIS2004 + jntajis.ConversionMode.SISO
+    for u in range(0x30000):
+        c = chr(u)
+        try:
+            encoded = jntajis.jnta_encode("jis", c, mode)
+        except UnicodeEncodeError:
+            continue
+        assert jntajis.jnta_shrink_translit(c) == jntajis.jnta_decode_shrink_translit(
+            "jis", encoded, jntajis.InputEncoding.EUC_JIS2004
+        ), hex(u)
+
+
+@pytest.mark.parametrize(
+    ("mode",),
+    [
+        (jntajis.ConversionMode.SISO,),
+        (jntajis.ConversionMode.MEN1,),
+        (jntajis.ConversionMode.JISX0208,),
+        (jntajis.ConversionMode.JISX0208_TRANSLIT,),
+    ],
+)
+def test_encode_decode_large_input(mode):
+    piece = "ジャンクロードヴァンダム，"
+    if mode != jntajis.ConversionMode.JISX0208:
+        piece += "繫"
+    if mode == jntajis.ConversionMode.SISO:
+        piece += "\U00020089"
+    n = 10000 // len(piece) + 1
+    encoded = jntajis.jnta_encode("jis", piece * n, mode)
+    assert encoded == jntajis.jnta_encode("jis", piece, mode) * n
+    if mode != jntajis.ConversionMode.SISO:
+        assert (
+            jntajis.jnta_decode("jis", encoded)
+            == jntajis.jnta_decode("jis", jntajis.jnta_encode("jis", piece, mode)) * n
+        )
+
+
+def test_encode_large_input_error_position():
+    in_ = "あ" * 10000 + "\u0000" + "あ" * 10
+    with pytest.raises(UnicodeEncodeError) as e:
+        jntajis.jnta_encode("jis", in_, jntajis.ConversionMode.MEN1)
+    assert e.value.start == 10000
+    assert e.value.reason == "not convertible to JISX0208"
+
+
+@pytest.mark.parametrize(
+    ("expected", "errors", "replacement"),
+    [
+        (b"\x24\x22\x22\x2e\x24\x24\x22\x2e\x24\x26", "replace", "\u3013"),
+        (b"\x24\x22\x21\x76\x24\x24\x21\x76\x24\x26", "replace", "＊"),
+        (b"\x24\x22\x24\x24\x24\x26", "ignore", "\u3013"),
+    ],
+)
+def test_encode_errors(expected, errors, replacement):
+    in_ = "あ\U0001f600い\U0002000bう"
+    mode = jntajis.ConversionMode.JISX0208
+    assert jntajis.jnta_encode("jis", in_, mode, errors, replacement) == expected
+    enc = jntajis.IncrementalEncoder("jis", mode, errors, replacement)
+    assert b"".join(enc.encode(c, False) for c in in_) + enc.encode("", True) == expected
+
+
+def test_encode_errors_custom_handler():
+    calls = []
+
+    def handler(exc):
+        calls.append((exc.start, exc.end, exc.reason))
+        return "？" * (exc.end - exc.start), exc.end
+
+    def bad_handler(exc):
+        return 1, exc.end
+
+    codecs.register_error("jntajis-test-fullwidth", handler)
+    codecs.register_error("jntajis-test-bytes", lambda exc: (b"??", exc.end))
+    codecs.register_error("jntajis-test-bad", bad_handler)
+
+    in_ = "あ\U0001f600い\U0002000bう" + "か\u309a"
+    assert (
+        jntajis.jnta_encode("jis", in_, jntajis.ConversionMode.JISX0208, "jntajis-test-fullwidth")
+        == b"\x24\x22\x21\x29\x24\x24\x21\x29\x24\x26\x21\x29\x21\x29"
+    )
+    assert calls == [
+        (1, 2, "not convertible to JISX0208"),
+        (3, 4, "not convertible to JISX0208"),
+        (5, 7, "not convertible to JISX0208"),
+    ]
+    assert (
+        jntajis.jnta_encode("jis", in_[:3], jntajis.ConversionMode.MEN1, "jntajis-test-bytes")
+        == b"\x24\x22??\x24\x24"
+    )
+    with pytest.raises(TypeError):
+        jntajis.jnta_encode("jis", in_, jntajis.ConversionMode.MEN1, "jntajis-test-bad")
+    with pytest.raises(ValueError):
+        jntajis.jnta_encode_into(
+            "jis", in_, jntajis.ConversionMode.MEN1, bytearray(32), 0, "jntajis-test-bytes"
+        )
+    with pytest.raises(LookupError):
+        jntajis.jnta_encode("jis", in_, jntajis.ConversionMode.MEN1, "jntajis-test-unknown")
+
+
+@pytest.mark.parametrize(
+    ("exc", "args", "kwargs"),
+    [
+        (LookupError, ("jis", jntajis.ConversionMode.MEN1), {"errors": "jntajis-test-unknown"}),
+        (ValueError, ("jis", jntajis.ConversionMode.MEN1), {"replacement": "ab"}),
+        (ValueError, ("jis", 99), {}),
+        (ValueError, ("", jntajis.ConversionMode.MEN1), {}),
+    ],
+)
+def test_incremental_encoder_invalid_arguments(exc, args, kwargs):
+    # the half-initialized encoder must be safe to collect
+    with pytest.raises(exc):
+        jntajis.IncrementalEncoder(*args, **kwargs)
+    gc.collect()
+    enc = jntajis.IncrementalEncoder("jis", jntajis.ConversionMode.MEN1)
+    with pytest.raises(exc):
+        enc.__init__(*args, **kwargs)
+    assert enc.encode("あ", True) == b"\x24\x22"
+    del enc
+    gc.collect()
+
+
+def test_encode_errors_invalid_replacement():
+    with pytest.raises(ValueError):
+        jntajis.jnta_encode("jis", "あ", jntajis.ConversionMode.MEN1, "replace", "\U0001f600")
+    with pytest.raises(ValueError):
+        jntajis.jnta_encode("jis", "あ", jntajis.ConversionMode.MEN1, "replace", "ああ")
+    with pytest.raises(UnicodeEncodeError) as e:
+        jntajis.jnta_encode(
+            "jis", "\U0001f600", jntajis.ConversionMode.JISX0208, "replace", "\U0002000b"
+        )
+    assert e.value.reason == "replacement character is neither convertible to JISX0208"
+
+
+@pytest.mark.parametrize(
+    ("expected", "expected_failures", "mode", "errors", "input"),
+    [
+        (
+            b"\x24\x22\x22\x2e\x24\x24\x22\x2e\x24\x26",
+            [
+                (1, 0x1F600, "no corresponding JIS character"),
+                (3, 0x2000B, "not convertible to JISX0208"),
+            ],
+            jntajis.ConversionMode.JISX0208,
+            "replace",
+            "あ\U0001f600い\U0002000bう",
+        ),
+        (
+            b"\x24\x22\x24\x24",
+            [(1, 0x1F600, "no corresponding JIS character")],
+            jntajis.ConversionMode.SISO,
+            "ignore",
+            "あ\U0001f600い",
+        ),
+        (
+            b"\x22\x2e",
+            [(0, 0x304B, "not convertible to JISX0208")],
+            jntajis.ConversionMode.JISX0208,
+            "replace",
+            "か\u309a",
+        ),
+        (
+            b"\x24\x2b",
+            [],
+            jntajis.ConversionMode.JISX0208,
+            "replace",
+            "か",
+        ),
+    ],
+)
+def test_encode_report(expected, expected_failures, mode, errors, input):
+    assert jntajis.jnta_encode_report("jis", input, mode, errors) == (expected, expected_failures)
+
+
+def test_encode_report_large_input():
+    in_ = ("あ" * 100 + "\U0001f600") * 1000
+    encoded, failures = jntajis.jnta_encode_report("jis", in_, jntajis.ConversionMode.MEN1)
+    assert (
+        encoded
+        == jntajis.jnta_encode("jis", "あ" * 100 + "\u3013", jntajis.ConversionMode.MEN1) * 1000
+    )
+    assert failures == [
+        (i * 101 + 100, 0x1F600, "no corresponding JIS character") for i in range(1000)
+    ]
+    with pytest.raises(UnicodeEncodeError) as e:
+        jntajis.jnta_encode_report("jis", in_, jntajis.ConversionMode.MEN1, "strict")
+    assert e.value.start == 100
+
+
+@pytest.mark.parametrize(
+    ("mode",),
+    [(mode,) for mode in jntajis.ConversionMode],
+)
+@pytest.mark.parametrize(
+    ("input",),
+    [
+        ("",),
+        ("ジャンクロードヴァンダム，繫",),
+        ("か\u309aか\u309a",),
+        ("あ\U00020089い" * 2000,),
+        ("ト\u309aㇷ\u309a繫" * 2000,),
+    ],
+)
+def test_encoded_length(mode, input):
+    try:
+        expected = jntajis.jnta_encode("jis", input, mode, "replace")
+    except UnicodeEncodeError:
+        with pytest.raises(UnicodeEncodeError):
+            jntajis.jnta_encoded_length(input, mode, "replace")
+        return
+    assert jntajis.jnta_encoded_length(input, mode, "replace") == len(expected)
+    assert jntajis.jnta_encode("jis", input, mode, "replace", presize=True) == expected
+
+
+def test_encoded_length_errors():
+    in_ = "あ" * 5000 + "\U0001f600" + "あ"
+    with pytest.raises(UnicodeEncodeError) as e:
+        jntajis.jnta_encoded_length(in_, jntajis.ConversionMode.MEN1)
+    assert e.value.start == 5000
+    with pytest.raises(UnicodeEncodeError) as e:
+        jntajis.jnta_encode("jis", in_, jntajis.ConversionMode.MEN1, presize=True)
+    assert e.value.start == 5000
+    assert jntajis.jnta_encoded_length(in_, jntajis.ConversionMode.MEN1, "ignore") == 10002
+
+
+@pytest.mark.parametrize(
+    ("mode",),
+    [(mode,) for mode in jntajis.ConversionMode],
+)
+def test_encode_string_kinds_agree(mode):
+    # the 1-byte string is converted by the specialized loop, and the same
+    # characters in a 2-byte string by the generic one
+    in_ = "".join(chr(c) for c in range(256)) * 3
+    wide = in_ + "\u3042"
+    encoded, failures = jntajis.jnta_encode_report("jis", in_, mode)
+    assert jntajis.jnta_encode_report("jis", wide, mode)[1] == failures
+    enc1 = jntajis.IncrementalEncoder("jis", mode, "replace")
+    enc2 = jntajis.IncrementalEncoder("jis", mode, "replace")
+    assert enc1.encode(wide, False) == enc2.encode(in_, False) + enc2.encode("\u3042", False)
+    assert jntajis.jnta_shrink_translit(in_, "?") == jntajis.jnta_shrink_translit(wide, "?")[:-1]
+
+
+def test_decode_large_input_error_position():
+    in_ = b"\x24\x22" * 10000 + b"\x24\x7f"
+    with pytest.raises(UnicodeDecodeError) as e:
+        jntajis.jnta_decode("jis", in_)
+    assert e.value.start == 20000
+    assert e.value.reason == "unexpected byte \\x7f after \\x24"
+
+
+def test_shrink_translit_large_input():
+    piece = "ジャンクロードヴァンダム繫"
+    n = 10000 // len(piece) + 1
+    assert jntajis.jnta_shrink_translit(piece * n) == jntajis.jnta_shrink_translit(piece) * n
+    with pytest.raises(jntajis.TransliterationError):
+        jntajis.jnta_shrink_translit(piece * n + "\u0000", replacement="")
+
+
+@pytest.mark.parametrize(
+    ("input", "passthrough"),
+    [
+        ("", False),
+        ("ジャンクロードヴァンダム", False),
+        ("かか", False),
+        ("あ\U0001f600", True),
+        ("ジャンクロードヴァンダム" * 1000, False),
+    ],
+)
+def test_shrink_translit_unchanged(input, passthrough):
+    assert jntajis.jnta_shrink_translit(input, passthrough=passthrough) is input
+    result = jntajis.jnta_shrink_translit_many([input], passthrough=passthrough)
+    assert result[0] is input
+
+
+@pytest.mark.parametrize(
+    ("prefix",),
+    [("",), ("あ",), ("か",), ("か\u309a",), ("ジャンクロードヴァンダム" * 1000,)],
+)
+def test_shrink_translit_changed_after_prefix(prefix):
+    for suffix in ("繫", "\U0001f600", "繫か\u309aか"):
+        expected = prefix + jntajis.jnta_shrink_translit(suffix)
+        assert jntajis.jnta_shrink_translit(prefix + suffix) == expected
+        assert jntajis.jnta_shrink_translit_many([prefix + suffix]) == [expected]
+
+
+@pytest.mark.parametrize(
+    ("input",),
+    [
+        ("カか\u309aセ\u309aア",),
+        ("ka\u309aか\u309a\u309a",),
+        ("æ\u0300ææ\u0301",),
+        ("か" * 40,),
+        ("か" * 39 + "\u309a",),
+    ],
+)
+def test_combining_sequences_across_chunks(input):
+    # a character that may begin a sequence is held back only when the
+    # next one may complete it, or when it ends the chunk
+    mode = jntajis.ConversionMode.SISO
+    expected = jntajis.jnta_encode("jis", input, mode, "replace")
+    for i in range(len(input) + 1):
+        enc = jntajis.IncrementalEncoder("jis", mode, "replace")
+        assert enc.encode(input[:i], False) + enc.encode(input[i:], True) == expected, i
+    _, failures = jntajis.jnta_encode_report("jis", input, mode)
+    assert jntajis.jnta_check(input, mode, True) == [pos for pos, _, _ in failures]
+
+
+def test_lookahead_not_dropped():
+    # a character held for a possible combining sequence is kept when the
+    # following one begins another sequence, or when the input ends
+    in_ = "かか\u309aか"
+    mode = jntajis.ConversionMode.SISO
+    assert (
+        jntajis.jnta_shrink_translit(in_ + "\U0001f600", "?")
+        == "".join(jntajis.jnta_shrink_translit(c) for c in ("か", "か\u309a", "か")) + "?"
+    )
+    assert jntajis.jnta_encode("jis", in_, mode) == b"".join(
+        jntajis.jnta_encode("jis", c, mode) for c in ("か", "か\u309a", "か")
+    )
+    assert jntajis.jnta_check("\U0001f600かか\u309a", mode, True) == [0]
+
+
+@pytest.mark.parametrize(
+    ("input", "replacement", "passthrough"),
+    [
+        ("ジャンクロードヴァンダム", "\ufffd", False),
+        ("かか\u309aか\U0001f600繫", "?", False),
+        ("セ\u309a俱ト\u309aト", "", True),
+        ("ka\u309a\u309aæ\u0300", "\ufffd", False),
+        ("か" * 40, "\ufffd", False),
+    ],
+)
+def test_transliterator_chunked(input, replacement, passthrough):
+    expected = jntajis.jnta_shrink_translit(input, replacement, passthrough)
+    t = jntajis.Transliterator(replacement=replacement, passthrough=passthrough)
+    for i in range(len(input) + 1):
+        for j in range(i, len(input) + 1):
+            out = t.translit(input[:i]) + t.translit(input[i:j]) + t.translit(input[j:], True)
+            assert out == expected, (i, j)
+    chunks = [input[i : i + 1] for i in range(len(input))]
+    assert "".join(t.translit_iter(chunks)) == expected
+    assert "".join(t.translit_iter([])) == ""
+
+
+def test_transliterator_state():
+    t = jntajis.Transliterator()
+    chunk = "ジャンクロードヴァンダム"
+    assert t.translit(chunk) is chunk
+    # a possible beginning of a sequence is held back
+    assert t.translit("アカ") == "ア"
+    assert t.translit("\u309a", True) == jntajis.jnta_shrink_translit("カ\u309a")
+    assert t.translit("カ") == ""
+    t.reset()
+    assert t.translit("ア", True) == "ア"
+    with pytest.raises(jntajis.TransliterationError):
+        jntajis.Transliterator(replacement="").translit("\U0001f600")
+
+
+def test_transliterator_threads():
+    # large chunks are transliterated without the GIL; a call made while
+    # another thread is in one fails instead of sharing its buffers
+    t = jntajis.Transliterator()
+    chunk = "俱繫" * 100_000
+    expected = jntajis.jnta_shrink_translit(chunk)
+    results = []
+
+    def run():
+        for _ in range(10):
+            try:
+                results.append(t.translit(chunk) == expected)
+            except RuntimeError:
+                pass
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert results and all(results)
+    assert t.translit(chunk, True) == expected
+
+
+@pytest.mark.parametrize(("n_threads",), [(1,), (3,)])
+def test_encode_many(n_threads):
+    ins = ["ジャンクロードヴァンダム", "\u0000", "", "，繫"] * 5
+    result = jntajis.jnta_encode_many("jis", ins, jntajis.ConversionMode.MEN1, n_threads=n_threads)
+    assert len(result) == len(ins)
+    for in_, r in zip(ins, result):
+        if in_ == "\u0000":
+            assert isinstance(r, UnicodeEncodeError)
+            assert r.reason == "not convertible to JISX0208"
+            assert r.object == in_
+        else:
+            assert r == jntajis.jnta_encode("jis", in_, jntajis.ConversionMode.MEN1)
+
+
+@pytest.mark.parametrize(("n_threads",), [(1,), (3,)])
+@pytest.mark.parametrize(
+    ("errors", "replacement"), [("replace", "\u3013"), ("replace", "＿"), ("ignore", "\u3013")]
+)
+def test_encode_many_errors(n_threads, errors, replacement):
+    mode = jntajis.ConversionMode.JISX0208
+    ins = ["ジャンクロードヴァンダム", "あ\U0001f600い繫", "", "か\u309aか"] * 5
+    result = jntajis.jnta_encode_many(
+        "jis", ins, mode, n_threads=n_threads, errors=errors, replacement=replacement
+    )
+    assert result == [jntajis.jnta_encode("jis", in_, mode, errors, replacement) for in_ in ins]
+
+
+def test_encode_many_invalid_error_handling():
+    mode = jntajis.ConversionMode.JISX0208
+    # the replacement is out of the repertoire of the conversion mode
+    (r,) = jntajis.jnta_encode_many("jis", ["繫"], mode, errors="replace", replacement="俱")
+    assert isinstance(r, UnicodeEncodeError)
+    assert r.reason == "replacement character is neither convertible to JISX0208"
+    with pytest.raises(ValueError):
+        jntajis.jnta_encode_many("jis", ["繫"], mode, errors="backslashreplace")
+    with pytest.raises(LookupError):
+        jntajis.jnta_encode_many("jis", ["繫"], mode, errors="unknown")
+    with pytest.raises(ValueError):
+        jntajis.jnta_encode_many("jis", ["繫"], mode, errors="replace", replacement="ab")
+
+
+@pytest.mark.parametrize(("n_threads",), [(1,), (3,)])
+def test_decode_many(n_threads):
+    ins = [b"\x25\x38\x25\x63", b"\x24\x7f", b"", b"\x24"] * 5
+    result = jntajis.jnta_decode_many("jis", ins, n_threads=n_threads)
+    assert len(result) == len(ins)
+    for in_, r in zip(ins, result):
+        if in_ == b"\x24\x7f":
+            assert isinstance(r, UnicodeDecodeError)
+            assert r.reason == "unexpected byte \\x7f after \\x24"
+        elif in_ == b"\x24":
+            assert isinstance(r, UnicodeDecodeError)
+            assert r.reason == "incomplete multibyte character"
+        else:
+            assert r == jntajis.jnta_decode("jis", in_)
+
+
+@pytest.mark.parametrize(("n_threads",), [(1,), (3,)])
+def test_decode_many_buffer_types(n_threads):
+    encoded = jntajis.jnta_encode("jis", "ジャンクロードヴァンダム", jntajis.ConversionMode.MEN1)
+    ins = [
+        encoded,
+        bytearray(encoded),
+        memoryview(encoded),
+        memoryview(b"\x00" + encoded)[1:],
+        bytearray(b"\x24\x22\x24\x7f"),
+    ] * 3
+    result = jntajis.jnta_decode_many("jis", ins, n_threads=n_threads)
+    for i, r in enumerate(result):
+        if i % 5 == 4:
+            assert isinstance(r, UnicodeDecodeError)
+            assert r.start == 2
+        else:
+            assert r == "ジャンクロードヴァンダム"
+    with pytest.raises(BufferError):
+        jntajis.jnta_decode_many("jis", [encoded, memoryview(encoded)[::2]])
+    # the buffers are released, including those acquired before a failure
+    ba = bytearray(encoded)
+    jntajis.jnta_decode_many("jis", [ba])
+    ba.append(0)
+    with pytest.raises(TypeError):
+        jntajis.jnta_decode_many("jis", [ba, ""])
+    ba.append(0)
+
+
+@pytest.mark.parametrize(("n_threads",), [(1,), (3,)])
+def test_shrink_translit_many(n_threads):
+    ins = ["ジャンクロードヴァンダム繫", "\u0000", ""] * 5
+    result = jntajis.jnta_shrink_translit_many(ins, replacement="", n_threads=n_threads)
+    assert len(result) == len(ins)
+    for in_, r in zip(ins, result):
+        if in_ == "\u0000":
+            assert isinstance(r, jntajis.TransliterationError)
+        else:
+            assert r == jntajis.jnta_shrink_translit(in_)
+
+
+def test_many_rejects_invalid_arguments():
+    with pytest.raises(TypeError):
+        jntajis.jnta_encode_many("jis", [b""], jntajis.ConversionMode.MEN1)
+    with pytest.raises(TypeError):
+        jntajis.jnta_decode_many("jis", [""])
+    with pytest.raises(ValueError):
+        jntajis.jnta_shrink_translit_many([""], n_threads=0)
+
+
+@pytest.mark.parametrize(
+    ("mode", "siso"),
+    [
+        (jntajis.ConversionMode.SISO, True),
+        (jntajis.ConversionMode.MEN1, False),
+    ],
+)
+def test_incremental_decoder_chunked(mode, siso):
+    in_ = "ジャンクロードヴァンダム，繫"
+    if siso:
+        in_ += "\U00020089あ\U00020089"
+    encoded = jntajis.jnta_encode("jis", in_, mode)
+    for chunk_size in (1, 2, 3, 5):
+        dec = jntajis.IncrementalDecoder("jis", siso=siso)
+        out = "".join(
+            dec.decode(encoded[i : i + chunk_size]) for i in range(0, len(encoded), chunk_size)
+        )
+        out += dec.decode(b"", True)
+        assert out == in_
+
+
+@pytest.mark.parametrize(
+    ("args", "kwargs"),
+    [
+        (("jis",), {"input_encoding": 99}),
+        (("jis",), {"input_encoding": -1}),
+        (("",), {}),
+    ],
+)
+def test_incremental_decoder_invalid_arguments(args, kwargs):
+    # the half-initialized decoder must be safe to collect
+    with pytest.raises(ValueError):
+        jntajis.IncrementalDecoder(*args, **kwargs)
+    gc.collect()
+
+
+def test_incremental_decoder_state():
+    dec = jntajis.IncrementalDecoder("jis", siso=True)
+    assert dec.getstate() == (b"", 0)
+    assert dec.decode(b"\x0f\x21") == ""
+    state = dec.getstate()
+    assert state == (b"\x21", 1)
+
+    dec2 = jntajis.IncrementalDecoder("jis", siso=True)
+    dec2.setstate(state)
+    assert dec2.decode(b"\x21\x0e", True) == "\U00020089"
+    assert dec2.getstate() == (b"", 0)
+
+    dec.reset()
+    assert dec.getstate() == (b"", 0)
+
+
+def test_incremental_decoder_errors():
+    dec = jntajis.IncrementalDecoder("jis")
+    with pytest.raises(UnicodeDecodeError) as e:
+        dec.decode(b"\x0f")
+    assert e.value.reason == "unexpected byte \\x0f"
+    assert e.value.start == 0
+
+    dec = jntajis.IncrementalDecoder("jis")
+    assert dec.decode(b"\x24\x22\x24") == "あ"
+    with pytest.raises(UnicodeDecodeError) as e:
+        dec.decode(b"", True)
+    assert e.value.reason == "incomplete multibyte character"
+
+
+LEGACY_ENCODINGS = [
+    ("shift_jis_2004", jntajis.InputEncoding.SJIS2004),
+    ("euc_jis_2004", jntajis.InputEncoding.EUC_JIS2004),
+    ("cp932", jntajis.InputEncoding.CP932),
+]
+
+
+@pytest.mark.parametrize(("codec", "input_encoding"), LEGACY_ENCODINGS)
+def test_decode_legacy_encodings(codec, input_encoding):
+    in_ = "abc あ亜ー，ｱｲｳ繋"
+    if codec == "cp932":
+        in_ += "①Ⅰ纊褜ⅰ\ue000"
+    else:
+        in_ += "俱㉑繫\U00020089丂\U0002a6b2"
+    encoded = in_.encode(codec)
+    assert jntajis.jnta_decode("jis", encoded, input_encoding) == in_
+
+    dec = jntajis.IncrementalDecoder("jis", input_encoding=input_encoding)
+    out = "".join(dec.decode(encoded[i : i + 1]) for i in range(len(encoded)))
+    assert out + dec.decode(b"", True) == in_
+    assert jntajis.jnta_decode_many("jis", [encoded], input_encoding=input_encoding) == [in_]
+
+
+@pytest.mark.parametrize(("codec", "input_encoding"), LEGACY_ENCODINGS)
+@pytest.mark.parametrize(
+    ("replacement", "passthrough"),
+    [("\ufffd", False), ("", True), ("?", False)],
+)
+def test_decode_shrink_translit(codec, input_encoding, replacement, passthrough):
+    in_ = "abc あ亜ー，ｱｲｳ繋"
+    if codec != "cp932":
+        in_ += "俱㉑繫\U00020089"
+    encoded = in_.encode(codec)
+    expected = jntajis.jnta_shrink_translit(
+        jntajis.jnta_decode("jis", encoded, input_encoding), replacement, passthrough
+    )
+    assert (
+        jntajis.jnta_decode_shrink_translit(
+            "jis", encoded, input_encoding, replacement, passthrough
+        )
+        == expected
+    )
+    dec = jntajis.IncrementalDecoder(
+        "jis",
+        input_encoding=input_encoding,
+        shrink_translit=True,
+        replacement=replacement,
+        passthrough=passthrough,
+    )
+    out = "".join(dec.decode(encoded[i : i + 1]) for i in range(len(encoded)))
+    assert out + dec.decode(b"", True) == expected
+
+
+@pytest.mark.parametrize(("codec", "input_encoding"), LEGACY_ENCODINGS)
+@pytest.mark.parametrize(
+    ("input",),
+    [
+        ("",),
+        ("abc",),
+        ("abc é",),
+        ("あ亜ー，ｱｲｳ繋",),
+        ("あ\U00020089亜",),
+        ("俱㉑繫\U00020089か\u309a",),
+    ],
+)
+def test_decode_two_pass(codec, input_encoding, input):
+    from jntajis import _jntajis
+
+    try:
+        encoded = input.encode(codec)
+    except UnicodeEncodeError:
+        pytest.skip(f"{codec} cannot encode {input!r}")
+    expected = jntajis.jnta_decode("jis", encoded, input_encoding)
+    # strings of different kinds never compare equal
+    assert _jntajis._decode_two_pass("jis", encoded, input_encoding) == expected
+    for replacement, passthrough in (("?", False), ("", True)):
+        assert _jntajis._decode_two_pass(
+            "jis", encoded, input_encoding, replacement, passthrough
+        ) == jntajis.jnta_decode_shrink_translit(
+            "jis", encoded, input_encoding, replacement, passthrough
+        )
+    with pytest.raises(UnicodeDecodeError) as e:
+        _jntajis._decode_two_pass("jis", encoded + b"\xff\xff", input_encoding)
+    assert e.value.start >= len(encoded)
+
+
+def test_decode_shrink_translit_fails_without_replacement():
+    with pytest.raises(jntajis.TransliterationError):
+        jntajis.jnta_decode_shrink_translit(
+            "jis", b"\x82\xa0a", jntajis.InputEncoding.CP932, replacement=""
+        )
+
+
+@pytest.mark.parametrize(
+    ("input_encoding", "in_", "start", "reason"),
+    [
+        (jntajis.InputEncoding.SJIS2004, b"\x82\xa0\x80", 2, "unexpected byte \\x80"),
+        (jntajis.InputEncoding.SJIS2004, b"\x82\x20", 0, "unexpected byte \\x20 after \\x82"),
+        (jntajis.InputEncoding.SJIS2004, b"\x82\xa0\x82", 2, "incomplete multibyte character"),
+        (jntajis.InputEncoding.CP932, b"\xfc\x4c", 0, "unexpected byte \\x4c after \\xfc"),
+        # codes out of the CP932 repertoire, although JIS X 0213 defines them
+        (jntajis.InputEncoding.CP932, b"\x82\xa0\x81\xad", 2, "unexpected byte \\xad after \\x81"),
+        (jntajis.InputEncoding.CP932, b"\x85\x40", 0, "unexpected byte \\x40 after \\x85"),
+        (jntajis.InputEncoding.CP932, b"\x86\x40", 0, "unexpected byte \\x40 after \\x86"),
+        (jntajis.InputEncoding.CP932, b"\x87\x9d", 0, "unexpected byte \\x9d after \\x87"),
+        (jntajis.InputEncoding.CP932, b"\x88\x40", 0, "unexpected byte \\x40 after \\x88"),
+        (jntajis.InputEncoding.CP932, b"\xea\xa5", 0, "unexpected byte \\xa5 after \\xea"),
+        (jntajis.InputEncoding.CP932, b"\xeb\x40", 0, "unexpected byte \\x40 after \\xeb"),
+        (jntajis.InputEncoding.CP932, b"\xec\x40", 0, "unexpected byte \\x40 after \\xec"),
+        (jntajis.InputEncoding.CP932, b"\xef\x40", 0, "unexpected byte \\x40 after \\xef"),
+        (jntajis.InputEncoding.EUC_JIS2004, b"\xa4\xa2\xff", 2, "unexpected byte \\xff"),
+        (
+            jntajis.InputEncoding.EUC_JIS2004,
+            b"\xa4\xa2\x8f\xa1",
+            2,
+            "incomplete multibyte character",
+        ),
+    ],
+)
+def test_decode_legacy_encodings_errors(input_encoding, in_, start, reason):
+    with pytest.raises(UnicodeDecodeError) as e:
+        jntajis.jnta_decode("jis", in_, input_encoding)
+    assert e.value.start == start
+    assert e.value.reason == reason
+
+
+def test_incremental_decoder_legacy_state():
+    dec = jntajis.IncrementalDecoder("jis", input_encoding=jntajis.InputEncoding.EUC_JIS2004)
+    assert dec.decode(b"\xa4\xa2\x8f\xa1") == "あ"
+    assert dec.getstate() == (b"\x8f\xa1", 0)
+    dec.reset()
+    assert dec.getstate() == (b"", 0)
+    dec.setstate((b"\x8f\xa1", 0))
+    assert dec.decode(b"\xa1", True) == "\U00020089"
+
+
+@pytest.mark.parametrize(
+    ("mode",),
+    [
+        (jntajis.ConversionMode.SISO,),
+        (jntajis.ConversionMode.MEN1,),
+        (jntajis.ConversionMode.JISX0208_TRANSLIT,),
+        (jntajis.ConversionMode.ISO2022JP2004,),
+    ],
+)
+def test_encode_into_chunked(mode):
+    in_ = "ジャンクロードヴァンダム，繫" * 3
+    if mode in (jntajis.ConversionMode.SISO, jntajis.ConversionMode.ISO2022JP2004):
+        in_ += "\U00020089あ\U00020089"
+    expected = jntajis.jnta_encode("jis", in_, mode)
+    for size in (8, 9, 13):
+        enc = jntajis.IncrementalEncoder("jis", mode)
+        out = b""
+        rest = in_
+        while True:
+            buf = bytearray(size + 1)
+            consumed, written = enc.encode_into(rest, buf, 1, final=not rest)
+            assert written <= size
+            out += bytes(buf[1 : 1 + written])
+            rest = rest[consumed:]
+            if not rest and enc.getstate() == 0:
+                break
+        assert out == expected
+
+
+def test_encode_into_stops_when_full():
+    buf = bytearray(9)
+    assert jntajis.jnta_encode_into("jis", "あいうえお", jntajis.ConversionMode.MEN1, buf) == (
+        4,
+        8,
+    )
+    assert bytes(buf) == b"\x24\x22\x24\x24\x24\x26\x24\x28\x00"
+
+    buf = bytearray(4)
+    assert jntajis.jnta_encode_into("jis", "あ\U00020089", jntajis.ConversionMode.SISO, buf) == (
+        1,
+        2,
+    )
+    assert bytes(buf[:2]) == b"\x24\x22"
+
+
+def test_encode_into_final_flush():
+    mode = jntajis.ConversionMode.ISO2022JP2004
+    enc = jntajis.IncrementalEncoder("jis", mode)
+    assert enc.encode_into("あい", bytearray(16)) == (2, 7)
+    state = enc.getstate()
+    assert state != 0
+    for size in (0, 2):
+        with pytest.raises(ValueError):
+            enc.encode_into("", bytearray(size), final=True)
+        assert enc.getstate() == state
+    buf = bytearray(3)
+    assert enc.encode_into("", buf, final=True) == (0, 3)
+    assert bytes(buf) == b"\x1b(B"
+    assert enc.getstate() == 0
+
+    # the consumed characters are always followed by the complete flush,
+    # including that of the characters held for a combining sequence
+    in_ = "かか\u309a"
+    for size in range(20):
+        enc = jntajis.IncrementalEncoder("jis", mode)
+        buf = bytearray(size)
+        consumed, written = enc.encode_into(in_, buf, final=True)
+        assert enc.getstate() == 0
+        assert bytes(buf[:written]) == jntajis.jnta_encode("jis", in_[:consumed], mode)
+
+
+def test_encode_into_large_input():
+    in_ = "ジャンクロードヴァンダム，繫" * 1000
+    expected = jntajis.jnta_encode("jis", in_, jntajis.ConversionMode.MEN1)
+    buf = bytearray(len(expected) + 10)
+    assert jntajis.jnta_encode_into("jis", in_, jntajis.ConversionMode.MEN1, buf, 10) == (
+        len(in_),
+        len(expected),
+    )
+    assert bytes(buf[10:]) == expected
+
+
+def test_encode_into_invalid_buffer():
+    with pytest.raises(BufferError):
+        jntajis.jnta_encode_into("jis", "あ", jntajis.ConversionMode.MEN1, b"\x00\x00")
+    with pytest.raises(ValueError):
+        jntajis.jnta_encode_into("jis", "あ", jntajis.ConversionMode.MEN1, bytearray(2), 3)
+
+
+def test_decode_buffer_types():
+    encoded = jntajis.jnta_encode("jis", "ジャンクロードヴァンダム", jntajis.ConversionMode.MEN1)
+    for in_ in (bytearray(encoded), memoryview(encoded), memoryview(b"\x00" + encoded)[1:]):
+        assert jntajis.jnta_decode("jis", in_) == "ジャンクロードヴァンダム"
+        assert jntajis.IncrementalDecoder("jis").decode(in_, True) == "ジャンクロードヴァンダム"
+    with pytest.raises(BufferError):
+        jntajis.jnta_decode("jis", memoryview(encoded)[::2])
+    with pytest.raises(UnicodeDecodeError) as e:
+        jntajis.jnta_decode("jis", bytearray(b"\x24\x22\x24\x7f"))
+    assert e.value.start == 2
+
+
+def test_decode_mmap_slice_without_copy():
+    import mmap
+    import tracemalloc
+
+    piece = jntajis.jnta_encode("jis", "あ", jntajis.ConversionMode.MEN1)
+    n = 1 << 20
+    with mmap.mmap(-1, len(piece) * (n + 2)) as mm:
+        mm[:] = piece * (n + 2)
+        view = memoryview(mm)[len(piece) : -len(piece)]
+        try:
+            tracemalloc.start()
+            try:
+                result = jntajis.jnta_decode("jis", view)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            assert result == "あ" * n
+            # the result itself takes 2 bytes per character, as does the input;
+            # a copy of the input would double the peak
+            assert peak < len(view) * 3 // 2
+        finally:
+            view.release()
@@ -0,0 +1,78 @@
+import pytest
+
+import jntajis
+from jntajis.index import MJIndex
+
+NAMES = [
+    "渡辺商事株式会社",
+    "渡邉商事",
+    "渡邊工業",
+    "髙橋",
+    "高橋工業株式会社",
+    "辺",
+    "",
+    "斎藤斉藤齋藤",
+    "株式会社辺",
+]
+
+QUERIES = ["渡辺", "渡邉", "辺", "橋", "髙橋工", "", "会社", "藤斉", "株式会社辺", "存在しない"]
+
+
+def brute_force(query, combo):
+    key = jntajis.mj_canonical_key(query, combo)
+    return [
+        100 + i for i, name in enumerate(NAMES) if key in jntajis.mj_canonical_key(name, combo)
+    ]
+
+
+@pytest.fixture
+def index():
+    return MJIndex.build((100 + i, name) for i, name in enumerate(NAMES))
+
+
+@pytest.mark.parametrize("query", QUERIES)
+@pytest.mark.parametrize("combo", [0, 1, 2, 4, 8, 5, 15])
+def test_mj_index_search(index, query, combo):
+    assert index.search(query, combo) == brute_force(query, combo)
+
+
+def test_mj_index_search_default_combo(index):
+    assert index.combo == 15
+    assert index.search("渡辺") == index.search("渡辺", 15)
+
+
+def test_mj_index_search_limit(index):
+    assert index.search("", limit=2) == [100, 101]
+    assert index.search("辺", limit=1) == [100]
+    assert index.search("辺", limit=0) == []
+
+
+def test_mj_index_search_combo_not_subset():
+    index = MJIndex.build([(1, "渡辺")], jntajis.MJShrinkSchemeCombo.MOJ_NOTICE_582)
+    with pytest.raises(ValueError):
+        index.search("渡辺", 15)
+
+
+def test_mj_index_save_load(index, tmp_path):
+    path = tmp_path / "names.idx"
+    index.save(path)
+    with MJIndex.load(path) as loaded:
+        assert len(loaded) == len(NAMES)
+        assert loaded.combo == index.combo
+        assert [loaded.name(i) for i in range(len(NAMES))] == NAMES
+        for query in QUERIES:
+            assert loaded.search(query, 0) == index.search(query, 0)
+            assert loaded.search(query) == index.search(query)
+        loaded.save(tmp_path / "copy.idx")
+    assert (tmp_path / "copy.idx").read_bytes() == path.read_bytes()
+
+
+def test_mj_index_load_invalid(index, tmp_path):
+    path = tmp_path / "names.idx"
+    path.write_bytes(b"x" * 128)
+    with pytest.raises(ValueError):
+        MJIndex.load(path)
+    index.save(path)
+    path.write_bytes(path.read_bytes()[:-16])
+    with pytest.raises(ValueError):
+        MJIndex.load(path)
@@ -157,3 +157,158 @@ import jntajis
 )
 def test_mj_shrink_candidates(input, combo, expected):
     assert jntajis.mj_shrink_candidates(input, combo) == expected
+
+
+@pytest.mark.parametrize(
+    "input",
+    ["", "斎", "邉\U000e0102", "邉邊斎", "渡邊斎藤邉", "辺髙辺"],
+)
+@pytest.mark.parametrize("combo", [1, 4, 15])
+def test_mj_shrink_candidates_iter(input, combo):
+    import operator
+
+    expected = jntajis.mj_shrink_candidates(input, combo, -1)
+    it = jntajis.mj_shrink_candidates_iter(input, combo)
+    assert operator.length_hint(it) == len(expected)
+    assert next(it) == expected[0]
+    assert operator.length_hint(it) == len(expected) - 1
+    assert [expected[0], *it] == expected
+    assert operator.length_hint(it) == 0
+    with pytest.raises(StopIteration):
+        next(it)
+
+
+def test_mj_shrink_candidates_iter_huge():
+    import operator
+    import sys
+
+    it = jntajis.mj_shrink_candidates_iter("髙" * 80, 15)
+    assert operator.length_hint(it) == sys.maxsize
+    assert next(it) == jntajis.mj_shrink_candidates("髙" * 80, 15, 1)[0]
+
+
+@pytest.mark.parametrize(
+    "input",
+    ["", "斎", "邉\U000e0102", "邉邊斎", "渡邊斎藤邉", "辺髙辺"],
+)
+@pytest.mark.parametrize("combo", [1, 4, 15])
+def test_mj_shrink_candidate_sets(input, combo):
+    import itertools
+
+    sets = jntajis.mj_shrink_candidate_sets(input, combo)
+    assert all(type(s) is tuple and s for s in sets)
+    # the first position changes fastest
+    expected = jntajis.mj_shrink_candidates(input, combo, -1)
+    assert ["".join(p[::-1]) for p in itertools.product(*sets[::-1])] == expected
+    assert jntajis.mj_shrink_candidate_count(input, combo) == len(
+        jntajis.mj_shrink_candidates(input, combo, -1)
+    )
+
+
+def test_mj_shrink_candidate_sets_ivs():
+    # characters with no mappings are kept as they are, IVS included
+    assert jntajis.mj_shrink_candidate_sets("\ue000\U000e0100a\ufe00", 15) == [
+        ("\ue000\U000e0100",),
+        ("a\ufe00",),
+    ]
+
+
+def test_mj_shrink_candidate_count_huge():
+    assert (
+        jntajis.mj_shrink_candidate_count("辺髙" * 40, 15)
+        == (
+            len(jntajis.mj_shrink_candidate_sets("辺", 15)[0])
+            * len(jntajis.mj_shrink_candidate_sets("髙", 15)[0])
+        )
+        ** 40
+    )
+
+
+MJ_EQUIVALENT_INPUTS = [
+    "",
+    "辺",
+    "辺髙",
+    "邉高",
+    "邊髙",
+    "\x00高",
+    "斎藤",
+    "齋藤",
+    "邉\U000e0102高",
+]
+
+
+@pytest.mark.parametrize("combo", [1, 4, 15])
+def test_mj_equivalent(combo):
+    for a in MJ_EQUIVALENT_INPUTS:
+        for b in MJ_EQUIVALENT_INPUTS:
+            expected = bool(
+                set(jntajis.mj_shrink_candidates(a, combo, -1))
+                & set(jntajis.mj_shrink_candidates(b, combo, -1))
+            )
+            assert jntajis.mj_equivalent(a, b, combo) is expected, (a, b)
+
+
+@pytest.mark.parametrize("n_threads", [1, 3])
+def test_mj_equivalent_many(n_threads):
+    pairs = [(a, b) for a in MJ_EQUIVALENT_INPUTS for b in MJ_EQUIVALENT_INPUTS]
+    pairs.append(("辺髙" * 4096, "辺髙" * 4096))
+    pairs.append(("辺髙" * 4096, "辺髙" * 4095 + "辺"))
+    assert jntajis.mj_equivalent_many(pairs, 15, n_threads=n_threads) == [
+        jntajis.mj_equivalent(a, b, 15) for a, b in pairs
+    ]
+
+
+def test_mj_equivalent_many_type_error():
+    with pytest.raises(TypeError):
+        jntajis.mj_equivalent_many([("a", "b"), ("a",)], 15)
+    with pytest.raises(TypeError):
+        jntajis.mj_equivalent_many([("a", b"b")], 15)
+
+
+@pytest.mark.parametrize("combo", range(16))
+def test_mj_canonical_key(combo):
+    for a in MJ_EQUIVALENT_INPUTS:
+        key = jntajis.mj_canonical_key(a, combo)
+        assert jntajis.mj_canonical_key(key, combo) == key
+        for c in jntajis.mj_shrink_candidates(a, combo, -1):
+            assert jntajis.mj_canonical_key(c, combo) == key, (a, c)
+        for b in MJ_EQUIVALENT_INPUTS:
+            if jntajis.mj_equivalent(a, b, combo):
+                assert jntajis.mj_canonical_key(b, combo) == key, (a, b)
+
+
+def test_mj_canonical_key_unchanged():
+    in_ = "あいう\U000e0100abc"
+    assert jntajis.mj_canonical_key(in_, 15) is in_
+    in_ = "あいう" * 2000
+    assert jntajis.mj_canonical_key(in_, 15) is in_
+
+
+def test_mj_canonical_key_large():
+    in_ = "".join(MJ_EQUIVALENT_INPUTS) * 500
+    assert (
+        jntajis.mj_canonical_key(in_, 15)
+        == "".join(jntajis.mj_canonical_key(a, 15) for a in MJ_EQUIVALENT_INPUTS) * 500
+    )
+
+
+@pytest.fixture(scope="module")
+def mj_closure_scan_inputs():
+    # every character, then the CJK ideographs of the BMP and of plane 2
+    # followed by each of the IVSes
+    ivs = [chr(0xFE00 + n) for n in range(16)] + [chr(0xE0100 + n) for n in range(48)]
+    return [
+        "".join(chr(u) for u in range(0x110000) if not 0xD800 <= u < 0xE000),
+        "".join(chr(u) + v for u in range(0x3400, 0xA000) for v in ivs),
+        "".join(chr(u) + v for u in range(0x20000, 0x2A6E0) for v in ivs),
+    ]
+
+
+@pytest.mark.parametrize("combo", range(16))
+def test_mj_closure_table_agrees(mj_closure_scan_inputs, combo):
+    from jntajis import _jntajis
+
+    for in_ in mj_closure_scan_inputs:
+        expected = _jntajis._mj_collect_scan(in_, combo, False)
+        assert expected != -1
+        assert _jntajis._mj_collect_scan(in_, combo, True) == expected